@@ -80,4 +80,25 @@ class OrderAdmin(admin.ModelAdmin):
     
     def mark_as_paid(self, request, queryset):
         queryset.update(paid=True)
-    mark_as_paid.short_description = "Позначити як 'Оплачено'"
\ No newline at end of file
+    mark_as_paid.short_description = "Позначити як 'Оплачено'"
+
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from .models import ImageJob
+
+@admin.register(ImageJob)
+class ImageJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'model', 'object_id', 'field', 'status', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('status', 'model')
+    readonly_fields = ('model', 'object_id', 'field', 'source', 'attempts', 'last_error', 'created_at', 'started_at', 'finished_at')
+    actions = ['retry']
+
+    def retry(self, request, queryset):
+        # A field with a newer pending job already has its retry
+        newer = ImageJob.objects.filter(
+            status=ImageJob.PENDING, model=OuterRef('model'), object_id=OuterRef('object_id'), field=OuterRef('field'),
+        )
+        queryset.filter(status=ImageJob.FAILED).exclude(Exists(newer)).update(
+            status=ImageJob.PENDING, attempts=0, run_after=timezone.now(),
+        )
+    retry.short_description = "Повторити обробку"
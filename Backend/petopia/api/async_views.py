@@ -0,0 +1,132 @@
+"""
+Async views for the I/O-bound endpoints.
+
+Under ASGI (see gunicorn.conf.py) these run on the event loop and only wait
+on I/O: blocking calls that have no async client, like Google's token check,
+go to a small dedicated thread pool, and cached catalog responses are served
+without touching a thread at all. Everything else (cache misses, writes) is
+handed to the regular DRF views through sync_to_async. Under WSGI and in
+tests Django runs the same views through async_to_sync, so nothing changes.
+"""
+import asyncio
+import functools
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from google.auth.exceptions import TransportError
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import cache as response_cache
+from .cache import PRODUCT_LIST_GROUPS, product_groups
+from .google_tokens import get_verifier
+from .views import ProductViewSet, merge_login_cart
+
+User = get_user_model()
+
+_outbound = None
+
+
+def outbound_executor():
+    global _outbound
+    if _outbound is None:
+        _outbound = ThreadPoolExecutor(settings.OUTBOUND_HTTP_THREADS, thread_name_prefix='outbound')
+    return _outbound
+
+
+async def run_outbound(func, *args, **kwargs):
+    """Run a blocking outbound call on the outbound pool, bounded by OUTBOUND_HTTP_TIMEOUT."""
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(outbound_executor(), functools.partial(func, *args, **kwargs))
+    return await asyncio.wait_for(future, settings.OUTBOUND_HTTP_TIMEOUT)
+
+
+def request_data(request):
+    """Body of a JSON or form POST as a dict-like object."""
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return {}
+        return data if isinstance(data, dict) else {}
+    return request.POST
+
+
+@csrf_exempt
+@require_POST
+async def google_auth(request):
+    data = request_data(request)
+    token = data.get('google_token')
+    verifier = get_verifier()
+    try:
+        # A token seen before is answered from memory; anything else may need Google's certificates
+        idinfo = verifier.cached(token) or await run_outbound(verifier.verify, token)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid token'}, status=400)
+    except TransportError:
+        return JsonResponse({'error': 'Could not reach Google'}, status=502)
+    except asyncio.TimeoutError:
+        return JsonResponse({'error': 'Google did not respond in time'}, status=504)
+
+    name = idinfo.get('name', '')
+    user, created = await User.objects.aget_or_create(email=idinfo['email'])
+    if created:
+        user.first_name = name.split()[0] if name else ''
+        user.last_name = name.split()[-1] if name else ''
+        user.date_joined = timezone.now()
+        await user.asave()
+
+    await sync_to_async(merge_login_cart)(user, data.get('cart'))
+
+    refresh = RefreshToken.for_user(user)
+    return JsonResponse({
+        'id': user.id,
+        'email': user.email,
+        'name': user.username,
+        'access': str(refresh.access_token),
+        'refresh': str(refresh),
+    })
+
+
+def serve_cached(name, groups, view):
+    """
+    Serve GET hits from the response cache on the event loop and hand
+    everything else to the sync `view`, whose cache_response wrapper fills the
+    cache. `groups` is a tuple or a callable taking the URL kwargs.
+    """
+    sync_view = sync_to_async(view)
+
+    async def wrapper(request, *args, **kwargs):
+        # The browsable API is rendered by DRF; only JSON clients take the fast path
+        if request.method == 'GET' and 'text/html' not in request.headers.get('Accept', ''):
+            dependencies = groups(kwargs) if callable(groups) else groups
+            data = await response_cache.aget_response(name, request, dependencies)
+            if data is not None:
+                response = HttpResponse(JSONRenderer().render(data), content_type='application/json')
+                response['X-Cache'] = 'HIT'
+                return response
+        return await sync_view(request, *args, **kwargs)
+
+    # The DRF view behind it does its own authentication; CSRF applies to sessions only
+    return csrf_exempt(wrapper)
+
+
+product_list = serve_cached(
+    'products', PRODUCT_LIST_GROUPS,
+    ProductViewSet.as_view({'get': 'list', 'post': 'create'}, basename='product', detail=False),
+)
+product_detail = serve_cached(
+    'product', lambda kwargs: product_groups(kwargs['pk']),
+    ProductViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}, basename='product', detail=True),
+)
+product_facets = serve_cached(
+    'facets', PRODUCT_LIST_GROUPS,
+    ProductViewSet.as_view({'get': 'facets'}, basename='product', detail=False, **ProductViewSet.facets.kwargs),
+)
@@ -0,0 +1,228 @@
+"""
+Response cache for read-mostly catalog endpoints.
+
+Entries live in the `catalog` cache alias (local-memory LRU by default, Redis
+when CATALOG_CACHE_URL is set) and are keyed on the endpoint name plus the
+normalized query parameters. Every key also embeds the current *generation*
+of the groups it depends on ("products", "product:<id>", "animal_categories",
+...). Invalidating a group bumps its generation, which makes every dependent
+key unreachable at once; the stale entries then age out through TTL/LRU.
+"""
+import functools
+import hashlib
+import os
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+
+CACHE_ALIAS = 'catalog'
+
+# Query parameters that may be repeated or comma-separated; order never changes the result
+LIST_PARAMS = ('animal_category', 'item_category', 'animal_category_id', 'item_category_id')
+
+# Product payloads embed both category serializers
+CATEGORY_GROUPS = ('animal_categories', 'item_categories')
+PRODUCT_LIST_GROUPS = ('products',) + CATEGORY_GROUPS
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Generations live in the catalog cache, so a per-process cache only
+    invalidates the worker that handled the write; the others serve stale
+    responses until the TTL runs out. Replica pins of signed-in users
+    (api.replicas) are kept there as well.
+    """
+    backend = settings.CACHES[CACHE_ALIAS]['BACKEND']
+    workers = int(os.getenv('WEB_CONCURRENCY', 1))
+    if not backend.endswith('.LocMemCache') or workers <= 1:
+        return []
+    hint = 'Set CATALOG_CACHE_URL to a Redis server shared by the workers and the image worker.'
+    warnings = [checks.Warning(
+        f'The catalog cache is local to each process, but WEB_CONCURRENCY={workers}.', hint=hint, id='api.W001',
+    )]
+    if settings.REPLICA_DATABASES:
+        warnings.append(checks.Warning(
+            'Read replicas are configured, but the pins that keep a user on the primary after a write '
+            'are only seen by the worker that handled the write.', hint=hint, id='api.W002',
+        ))
+    return warnings
+
+
+def get_timeout(name):
+    timeouts = getattr(settings, 'CATALOG_CACHE_TIMEOUTS', {})
+    return timeouts.get(name, getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300))
+
+
+def normalize_params(query_params):
+    """Canonical, hashable form of the request's query parameters."""
+    normalized = []
+    for key in sorted(query_params.keys()):
+        values = [value.strip() for value in query_params.getlist(key) if value.strip()]
+        if not values:
+            continue
+        if key == 'search':
+            values = [' '.join(values[-1].lower().split())]
+        elif key in LIST_PARAMS:
+            values = sorted({part.strip() for value in values for part in value.split(',') if part.strip()})
+        else:
+            values = values[-1:]
+        normalized.append((key, tuple(values)))
+    return tuple(normalized)
+
+
+class CacheStats:
+    """Per-process hit/miss counters, by endpoint name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(lambda: {'hits': 0, 'misses': 0})
+
+    def record(self, name, hit):
+        with self._lock:
+            self._counters[name]['hits' if hit else 'misses'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {name: dict(counter) for name, counter in self._counters.items()}
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+
+
+stats = CacheStats()
+
+
+def _generation_key(group):
+    return f'gen:{group}'
+
+
+def get_generations(groups):
+    cache = get_cache()
+    keys = [_generation_key(group) for group in groups]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            # Seed with the clock rather than 0 so an evicted counter can never
+            # bring back entries written under an older generation.
+            cache.add(key, time.time_ns(), timeout=None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def _bump(groups):
+    cache = get_cache()
+    for group in groups:
+        key = _generation_key(group)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=None)
+
+
+def invalidate(*groups):
+    """
+    Invalidate every entry that depends on `groups`. Runs immediately and again
+    after the surrounding transaction commits, so a reader can't re-cache data
+    that was read before the commit became visible.
+    """
+    _bump(groups)
+    transaction.on_commit(lambda: _bump(groups))
+
+
+def product_groups(pk):
+    return (f'product:{pk}',) + CATEGORY_GROUPS
+
+
+def invalidate_product(pk):
+    invalidate('products', f'product:{pk}')
+
+
+async def aget_generations(groups):
+    """Async twin of get_generations, for views served on the event loop."""
+    cache = get_cache()
+    keys = [_generation_key(group) for group in groups]
+    generations = await cache.aget_many(keys)
+    for key in keys:
+        if key not in generations:
+            await cache.aadd(key, time.time_ns(), timeout=None)
+            generations[key] = await cache.aget(key)
+    return [generations[key] for key in keys]
+
+
+def _response_key(name, request, generations):
+    # Plain Django requests have no query_params; it's the same QueryDict
+    params = getattr(request, 'query_params', request.GET)
+    raw = repr((name, request.get_host(), normalize_params(params), generations))
+    return f'response:{name}:' + hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def make_key(name, request, groups):
+    return _response_key(name, request, get_generations(groups))
+
+
+async def aget_response(name, request, groups):
+    """
+    Cached data for a GET request, or None. Only hits are counted here: a miss
+    falls through to the view, whose cache_response wrapper records it.
+    """
+    key = _response_key(name, request, await aget_generations(groups))
+    data = await get_cache().aget(key)
+    if data is not None:
+        stats.record(name, hit=True)
+    return data
+
+
+def cached_value(name, groups, compute, timeout=None):
+    """Return a cached value derived from `groups`, computing it on a miss."""
+    generations = get_generations(groups)
+    key = f'value:{name}:' + hashlib.sha1(repr(generations).encode('utf-8')).hexdigest()
+    cache = get_cache()
+    value = cache.get(key)
+    stats.record(name, hit=value is not None)
+    if value is None:
+        value = compute()
+        cache.set(key, value, timeout=timeout if timeout is not None else get_timeout(name))
+    return value
+
+
+def cache_response(name, groups):
+    """
+    Cache successful GET responses of a view method.
+
+    `groups` is a tuple of group names or a callable taking (view, request,
+    kwargs) and returning one, for per-object groups like "product:<pk>".
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            if request.method != 'GET':
+                return method(view, request, *args, **kwargs)
+            dependencies = groups(view, request, kwargs) if callable(groups) else groups
+            key = make_key(name, request, dependencies)
+            cache = get_cache()
+            data = cache.get(key)
+            if data is not None:
+                stats.record(name, hit=True)
+                response = Response(data)
+                response['X-Cache'] = 'HIT'
+                return response
+            stats.record(name, hit=False)
+            response = method(view, request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, response.data, timeout=get_timeout(name))
+            response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
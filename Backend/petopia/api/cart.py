@@ -0,0 +1,138 @@
+"""
+Per-user server-side cart.
+
+Writes come in batches of operations (add / set / remove) that are first
+folded into one final action per product, then applied with a fixed number
+of statements: one DELETE for removals, one upsert (INSERT ... ON CONFLICT
+on the (user, product) constraint) for set quantities and one for relative
+adds, which are summed in the database.
+"""
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .models import Cart, Product
+
+ADD, SET, REMOVE = 'add', 'set', 'remove'
+OPERATIONS = (ADD, SET, REMOVE)
+# Largest quantity of one product in a cart; adds beyond it are clamped
+MAX_QUANTITY = 1000
+
+
+class CartError(Exception):
+    def __init__(self, message, product_ids=()):
+        super().__init__(message)
+        self.product_ids = list(product_ids)
+
+
+def fold_operations(operations):
+    """
+    Reduce [{'op', 'product_id', 'quantity'}, ...] to {product_id: (op, quantity)},
+    where op is ADD (relative to the stored quantity), SET or REMOVE.
+    """
+    actions = {}
+    for operation in operations:
+        product_id, quantity = operation['product_id'], operation.get('quantity', 1)
+        current, amount = actions.get(product_id, (ADD, 0))
+        if operation['op'] == REMOVE or (operation['op'] == SET and quantity == 0):
+            actions[product_id] = (REMOVE, 0)
+        elif operation['op'] == SET:
+            actions[product_id] = (SET, quantity)
+        elif current == REMOVE:
+            actions[product_id] = (SET, quantity)
+        else:
+            actions[product_id] = (current, amount + quantity)
+    return actions
+
+
+def _upsert(user, quantities):
+    Cart.objects.bulk_create(
+        [Cart(user=user, product_id=product_id, quantity=quantity) for product_id, quantity in quantities.items()],
+        update_conflicts=True,
+        unique_fields=['user', 'product'],
+        update_fields=['quantity'],
+    )
+
+
+# How an upsert combines the stored quantity with the new one
+ADD_QUANTITIES = f'CASE WHEN {{stored}} + {{new}} > {MAX_QUANTITY} THEN {MAX_QUANTITY} ELSE {{stored}} + {{new}} END'
+LARGER_QUANTITY = 'CASE WHEN {new} > {stored} THEN {new} ELSE {stored} END'
+
+
+def _upsert_combined(user, quantities, combine):
+    """
+    Upsert where the new quantity is combined with the stored one by the
+    database, in the ON CONFLICT clause. A read-then-write could lose an update
+    when two requests add a product that isn't in the cart yet: there is no
+    row to lock, so both would read 0.
+    """
+    table = connection.ops.quote_name(Cart._meta.db_table)
+    user_column, product_column, quantity_column, date_column = (
+        connection.ops.quote_name(Cart._meta.get_field(name).column) for name in ('user', 'product', 'quantity', 'date_added')
+    )
+    date_added = Cart._meta.get_field('date_added').get_db_prep_value(timezone.now(), connection)
+    rows = [(user.pk, product_id, quantity, date_added) for product_id, quantity in quantities.items()]
+    update = combine.format(stored=f'{table}.{quantity_column}', new=f'EXCLUDED.{quantity_column}')
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({user_column}, {product_column}, {quantity_column}, {date_column}) '
+            f"VALUES {', '.join(['(%s, %s, %s, %s)'] * len(rows))} "
+            f'ON CONFLICT ({user_column}, {product_column}) DO UPDATE SET {quantity_column} = {update}',
+            [value for row in rows for value in row],
+        )
+
+
+def _missing_products(product_ids):
+    known = set(Product.objects.filter(id__in=product_ids).values_list('id', flat=True))
+    return [product_id for product_id in product_ids if product_id not in known]
+
+
+def apply_operations(user, operations):
+    """Apply a batch of cart operations atomically. Unknown products raise CartError."""
+    actions = fold_operations(operations)
+    if not actions:
+        return
+    wanted = [product_id for product_id, (op, _) in actions.items() if op != REMOVE]
+    unknown = _missing_products(wanted)
+    if unknown:
+        raise CartError('Product not found', unknown)
+
+    removed = [product_id for product_id, (op, _) in actions.items() if op == REMOVE]
+    quantities = {product_id: min(amount, MAX_QUANTITY) for product_id, (op, amount) in actions.items() if op == SET}
+    added = {product_id: min(amount, MAX_QUANTITY) for product_id, (op, amount) in actions.items() if op == ADD}
+    try:
+        with transaction.atomic():
+            if removed:
+                Cart.objects.filter(user=user, product_id__in=removed).delete()
+            if quantities:
+                _upsert(user, quantities)
+            if added:
+                _upsert_combined(user, added, ADD_QUANTITIES)
+    except IntegrityError:
+        # A product was deleted after the check above (foreign keys are checked at commit)
+        unknown = _missing_products(wanted)
+        if not unknown:
+            raise
+        raise CartError('Product not found', unknown)
+
+
+def merge_guest_cart(user, items):
+    """
+    Merge a guest (browser) cart into the user's cart at login. Each product
+    ends up with the larger of the two quantities, so repeating the merge is
+    harmless; products that no longer exist are skipped.
+    """
+    guest = {}
+    for item in items:
+        guest[item['product_id']] = max(guest.get(item['product_id'], 0), item['quantity'])
+    missing = set(_missing_products(list(guest)))
+    quantities = {product_id: quantity for product_id, quantity in guest.items() if product_id not in missing}
+    if not quantities:
+        return
+    try:
+        with transaction.atomic():
+            _upsert_combined(user, quantities, LARGER_QUANTITY)
+    except IntegrityError:
+        # A product was deleted meanwhile: merge the ones that are left
+        if not _missing_products(list(quantities)):
+            raise
+        merge_guest_cart(user, [{'product_id': product_id, 'quantity': quantity} for product_id, quantity in quantities.items()])
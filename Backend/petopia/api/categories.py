@@ -0,0 +1,91 @@
+"""
+Hierarchical category filtering.
+
+Animal_Category and Item_Category are MPTT trees, so "a category and everything
+below it" is the range `tree_id = T AND lft BETWEEN L AND R`, which is served
+by the (tree_id, lft) index. The node table itself (id -> name, range,
+parent) is small and read on every catalog request, so it is built in one
+query and kept in the catalog cache until the category group is invalidated.
+"""
+from django.db.models import Q
+
+from .cache import cached_value
+from .models import Animal_Category, Item_Category, Product
+
+CATEGORY_MODELS = {
+    Animal_Category: {'field': 'Animal_Category', 'group': 'animal_categories'},
+    Item_Category: {'field': 'Item_Category', 'group': 'item_categories'},
+}
+
+
+def build_category_tree(model):
+    """
+    Map every node id to its name, MPTT range and parent. Subtrees are not
+    listed: filters and facet counts use the (tree_id, lft, rght) range.
+    """
+    return {
+        node_id: {'name': name, 'tree_id': tree_id, 'lft': lft, 'rght': rght, 'parent_id': parent_id}
+        for node_id, name, tree_id, lft, rght, parent_id in model.objects.values_list(
+            'id', 'name', 'tree_id', 'lft', 'rght', 'parent_id'
+        )
+    }
+
+
+def get_category_tree(model):
+    group = CATEGORY_MODELS[model]['group']
+    return cached_value(f'category_tree:{group}', (group,), lambda: build_category_tree(model))
+
+
+def split_values(values):
+    # Accept both repeated parameters and comma-separated lists
+    return [part.strip() for value in values for part in value.split(',') if part.strip()]
+
+
+def resolve_categories(tree, ids=(), names=()):
+    """Return the ids of the requested nodes that exist in `tree`."""
+    selected = set()
+    for value in ids:
+        if value.isdigit() and int(value) in tree:
+            selected.add(int(value))
+    if names:
+        names = set(names)
+        selected.update(node_id for node_id, node in tree.items() if node['name'] in names)
+    return selected
+
+
+def category_ranges(tree, node_ids):
+    """(tree_id, lft, rght) of each selected node, minus nodes already covered by a selected ancestor."""
+    ranges = []
+    for node_id in sorted(node_ids, key=lambda pk: (tree[pk]['tree_id'], tree[pk]['lft'])):
+        node = tree[node_id]
+        if ranges and ranges[-1][0] == node['tree_id'] and node['lft'] <= ranges[-1][2]:
+            continue
+        ranges.append((node['tree_id'], node['lft'], node['rght']))
+    return ranges
+
+
+def filter_by_categories(queryset, model, node_ids, tree=None):
+    """Restrict `queryset` to products in any of `node_ids` or their descendants."""
+    if not node_ids:
+        return queryset.none()
+    tree = tree if tree is not None else get_category_tree(model)
+    through = getattr(Product, CATEGORY_MODELS[model]['field']).through
+    category = model._meta.model_name
+    condition = Q()
+    for tree_id, lft, rght in category_ranges(tree, node_ids):
+        condition |= Q(**{f'{category}__tree_id': tree_id, f'{category}__lft__range': (lft, rght)})
+    # A subquery on the link table instead of a join keeps one row per product
+    return queryset.filter(id__in=through.objects.filter(condition).values('product_id'))
+
+
+def filter_by_category_params(queryset, model, query_params, param):
+    """
+    Apply `?<param>=<name>` and `?<param>_id=<id>` filters (repeated or
+    comma-separated). Either form matches the category and all its descendants.
+    """
+    names = split_values(query_params.getlist(param))
+    ids = split_values(query_params.getlist(f'{param}_id'))
+    if not names and not ids:
+        return queryset
+    tree = get_category_tree(model)
+    return filter_by_categories(queryset, model, resolve_categories(tree, ids, names), tree)
@@ -0,0 +1,110 @@
+"""
+Checkout: turns a list of (product, quantity) lines into an Order in one
+transaction.
+
+The products are locked with SELECT ... FOR UPDATE in primary-key order (so two
+checkouts sharing products always lock them in the same order and can't
+deadlock), stock is taken with a single conditional UPDATE, and the items are
+written with one bulk INSERT. Prices and the order total come from the locked
+product rows, never from the client. The number of queries does not depend on
+the number of lines.
+"""
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, Q, When
+
+from . import cache as response_cache
+from .models import Order, OrderItem, Product
+
+
+class CheckoutError(Exception):
+    """A checkout that can't be placed as requested; nothing has been written."""
+    status_code = 400
+
+    def __init__(self, message, product_ids=()):
+        super().__init__(message)
+        self.product_ids = list(product_ids)
+
+
+class OutOfStock(CheckoutError):
+    status_code = 409
+
+
+def merge_lines(items):
+    """Validate (product_id, quantity) lines and merge repeated products."""
+    quantities = OrderedDict()
+    for item in items:
+        try:
+            product_id = int(item['product_id'])
+            quantity = int(item.get('quantity', 1))
+        except (KeyError, TypeError, ValueError):
+            raise CheckoutError('Each item needs a numeric product_id and quantity')
+        if quantity < 1:
+            raise CheckoutError('Quantity must be at least 1', [product_id])
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    if not quantities:
+        raise CheckoutError('The order has no items')
+    return quantities
+
+
+def reserve_stock(quantities):
+    """
+    Lock the products and take `quantities` off their stock. Must run inside
+    a transaction; returns the locked products by id.
+    """
+    products = (
+        Product.objects.select_for_update()
+        .defer('search_vector')
+        .order_by('id')
+        .in_bulk(quantities.keys())
+    )
+    missing = [pk for pk in quantities if pk not in products]
+    if missing:
+        raise CheckoutError('Product not found', missing)
+    short = [pk for pk, quantity in quantities.items() if products[pk].stock < quantity]
+    if short:
+        raise OutOfStock('Not enough stock', short)
+
+    # One UPDATE for all lines; the stock__gte guard makes it safe even where
+    # FOR UPDATE is a no-op (SQLite), since a short row is simply not updated.
+    condition = Q()
+    for pk, quantity in quantities.items():
+        condition |= Q(pk=pk, stock__gte=quantity)
+    updated = Product.objects.filter(condition).update(
+        stock=Case(
+            *[When(pk=pk, then=F('stock') - quantity) for pk, quantity in quantities.items()],
+            default=F('stock'),
+        )
+    )
+    if updated != len(quantities):
+        raise OutOfStock('Not enough stock', quantities.keys())
+    return products
+
+
+def place_order(user, items, **details):
+    """
+    Create an Order for `items` ([{'product_id', 'quantity'}, ...]) with the
+    customer/shipping fields in `details`. Raises CheckoutError (or OutOfStock)
+    and rolls everything back if any line can't be fulfilled.
+    """
+    quantities = merge_lines(items)
+    with transaction.atomic():
+        products = reserve_stock(quantities)
+        # Discounted the same way as the cart (models.discounted_price)
+        total = sum((products[pk].discounted_price * quantity for pk, quantity in quantities.items()), Decimal('0'))
+        order = Order.objects.create(user=user, status='pending', total_amount=total, **details)
+        OrderItem.objects.bulk_create(
+            OrderItem(
+                order=order,
+                product=products[pk],
+                product_name=products[pk].name,
+                quantity=quantity,
+                price=products[pk].discounted_price,
+            )
+            for pk, quantity in quantities.items()
+        )
+        # Stock is part of the product payload and update() sends no signals
+        response_cache.invalidate('products', *(f'product:{pk}' for pk in quantities))
+    return order
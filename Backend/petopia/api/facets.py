@@ -0,0 +1,90 @@
+"""
+Catalog facets: product counts per category node and a price histogram.
+
+Each facet is computed over the current filters *except its own*, so the
+sidebar can show how many products the other choices would return. Category
+counts are rolled up through the MPTT tree (a product in "Dogs > Puppies" is
+counted under "Dogs" too, once) with a single statement per tree, and the
+price facet is one aggregate plus one grouped histogram query.
+"""
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, F, IntegerField, Max, Min, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, Floor, Least
+
+from .categories import CATEGORY_MODELS
+from .models import Product
+
+DEFAULT_BUCKETS = 10
+MAX_BUCKETS = 50
+CENTS = Decimal('0.01')
+
+
+def category_counts(model, products):
+    """[{id, name, parent, count}] for every node of `model`'s trees, in tree order."""
+    through = getattr(Product, CATEGORY_MODELS[model]['field']).through
+    category = model._meta.model_name
+    subtree_products = (
+        through.objects
+        .filter(**{
+            'product_id__in': products.values('id'),
+            f'{category}__tree_id': OuterRef('tree_id'),
+            f'{category}__lft__gte': OuterRef('lft'),
+            f'{category}__lft__lte': OuterRef('rght'),
+        })
+        .order_by()
+        .values(f'{category}__tree_id')
+        .annotate(count=Count('product_id', distinct=True))
+        .values('count')
+    )
+    nodes = (
+        model.objects
+        .annotate(count=Coalesce(Subquery(subtree_products, output_field=IntegerField()), 0))
+        .order_by('tree_id', 'lft')
+        .values('id', 'name', 'parent_id', 'count')
+    )
+    return [
+        {'id': node['id'], 'name': node['name'], 'parent': node['parent_id'], 'count': node['count']}
+        for node in nodes
+    ]
+
+
+def price_facet(products, bucket_count=DEFAULT_BUCKETS):
+    """Min/max price and an equal-width histogram of `products`."""
+    products = products.order_by()
+    bounds = products.aggregate(min=Min('price'), max=Max('price'))
+    low, high = bounds['min'], bounds['max']
+    if low is None:
+        return {'min': None, 'max': None, 'buckets': []}
+
+    width = (high - low) / bucket_count
+    if width <= 0:
+        return {'min': low, 'max': high, 'buckets': [{'min': low, 'max': high, 'count': products.count()}]}
+
+    decimal = DecimalField(max_digits=12, decimal_places=2)
+    index = Least(
+        Cast(Floor((F('price') - Value(low, output_field=decimal)) / Value(width, output_field=decimal)), IntegerField()),
+        Value(bucket_count - 1),
+    )
+    counts = dict(
+        products.annotate(bucket=index).values('bucket').annotate(count=Count('id')).values_list('bucket', 'count')
+    )
+    return {
+        'min': low,
+        'max': high,
+        'buckets': [
+            {
+                'min': (low + width * i).quantize(CENTS),
+                'max': (low + width * (i + 1)).quantize(CENTS) if i < bucket_count - 1 else high,
+                'count': counts.get(i, 0),
+            }
+            for i in range(bucket_count)
+        ],
+    }
+
+
+def parse_bucket_count(value):
+    try:
+        return max(1, min(int(value), MAX_BUCKETS))
+    except (TypeError, ValueError):
+        return DEFAULT_BUCKETS
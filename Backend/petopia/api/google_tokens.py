@@ -0,0 +1,125 @@
+"""
+Google ID token verification.
+
+Google signs ID tokens with a handful of keys that rotate every few days and
+publishes their certificates with a Cache-Control max-age. The verifier keeps
+those certificates for as long as Google allows, fetches them over one pooled
+HTTP session, and checks signatures locally. Tokens that already passed are
+remembered until they expire, so a repeated login skips the RSA check too.
+"""
+import functools
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from google.auth import exceptions, jwt
+
+GOOGLE_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+
+MAX_AGE = re.compile(r'max-age=(\d+)')
+# A token signed with an unknown key forces a refetch at most this often
+MIN_REFRESH_INTERVAL = 60
+
+
+class GoogleTokenVerifier:
+    def __init__(self, audience, certs_url, timeout=10, max_tokens=1024):
+        self.audience = audience
+        self.certs_url = certs_url
+        self.timeout = timeout
+        self.max_tokens = max_tokens
+        self.session = requests.Session()
+        self._certs = {}
+        self._certs_expire = 0
+        self._certs_fetched = 0
+        self._certs_lock = threading.Lock()
+        self._tokens = OrderedDict()
+        self._tokens_lock = threading.Lock()
+
+    def _fetch_certs(self):
+        try:
+            response = self.session.get(self.certs_url, timeout=self.timeout)
+            response.raise_for_status()
+            certs = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise exceptions.TransportError(f'Could not fetch Google certificates: {e}') from e
+        match = MAX_AGE.search(response.headers.get('Cache-Control', ''))
+        return certs, time.time() + (int(match.group(1)) if match else 0)
+
+    def get_certs(self, refresh=False):
+        """Google's certificates by key id, fetched again once their max-age runs out."""
+        with self._certs_lock:
+            now = time.time()
+            if now >= self._certs_expire or (refresh and now - self._certs_fetched >= MIN_REFRESH_INTERVAL):
+                self._certs, self._certs_expire = self._fetch_certs()
+                self._certs_fetched = now
+            return self._certs
+
+    def _key(self, token):
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    def cached(self, token):
+        """Claims of a token verified earlier and not yet expired, or None."""
+        if not isinstance(token, str):
+            return None
+        key = self._key(token)
+        with self._tokens_lock:
+            claims = self._tokens.get(key)
+            if claims is None:
+                return None
+            if time.time() >= claims['exp']:
+                del self._tokens[key]
+                return None
+            self._tokens.move_to_end(key)
+            return claims
+
+    def _remember(self, token, claims):
+        key = self._key(token)
+        with self._tokens_lock:
+            self._tokens[key] = claims
+            self._tokens.move_to_end(key)
+            while len(self._tokens) > self.max_tokens:
+                self._tokens.popitem(last=False)
+
+    def verify(self, token):
+        """
+        Claims of a valid ID token for our client id. Raises ValueError for an
+        invalid token and TransportError when the certificates can't be fetched.
+        """
+        claims = self.cached(token)
+        if claims is not None:
+            return claims
+        if not isinstance(token, str) or not token:
+            raise ValueError('Missing token.')
+
+        kid = jwt.decode_header(token).get('kid')
+        certs = self.get_certs()
+        if kid not in certs:
+            # Google rotated its keys before our copy expired
+            certs = self.get_certs(refresh=True)
+        claims = jwt.decode(token, certs=certs, audience=self.audience)
+        if claims.get('iss') not in GOOGLE_ISSUERS:
+            raise ValueError('Wrong issuer.')
+        self._remember(token, claims)
+        return claims
+
+
+@functools.lru_cache(maxsize=None)
+def get_verifier():
+    """The verifier for the configured client id, shared by the whole process."""
+    return GoogleTokenVerifier(
+        settings.GOOGLE_OAUTH2_CLIENT_ID,
+        settings.GOOGLE_CERTS_URL,
+        timeout=settings.OUTBOUND_HTTP_TIMEOUT,
+    )
+
+
+@receiver(setting_changed)
+def _reset_verifier(setting, **kwargs):
+    if setting in ('GOOGLE_OAUTH2_CLIENT_ID', 'GOOGLE_CERTS_URL', 'OUTBOUND_HTTP_TIMEOUT'):
+        get_verifier.cache_clear()
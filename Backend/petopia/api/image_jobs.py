@@ -0,0 +1,162 @@
+"""
+Database-backed queue for image processing.
+
+Saving an upload only queues an ImageJob (one INSERT in the upload's own
+transaction). `manage.py process_image_jobs` claims pending jobs in batches
+with SELECT ... FOR UPDATE SKIP LOCKED, so several consumers can share the
+queue, and hands the decoding/resizing (api.imaging.render) to a process
+pool while it does the storage and database work itself. Failed jobs are
+retried with exponential backoff up to IMAGE_JOB_MAX_ATTEMPTS; jobs left
+running by a crashed consumer go back to the queue after IMAGE_JOB_TIMEOUT.
+"""
+import logging
+from concurrent.futures import as_completed
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import imaging
+from .models import ImageJob
+from .thumbnails import UNREADABLE, apply_rendered, read_source, record_unreadable, render_options, update_variants
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(instance, field_name):
+    """Queue processing of `instance`'s current file; a pending job for the same field is reused."""
+    file = getattr(instance, field_name)
+    if not file:
+        return None
+    job, created = ImageJob.objects.get_or_create(
+        model=instance._meta.label_lower,
+        object_id=instance.pk,
+        field=field_name,
+        status=ImageJob.PENDING,
+        defaults={'source': file.name},
+    )
+    if not created and job.source != file.name:
+        job.source, job.attempts, job.run_after = file.name, 0, timezone.now()
+        job.save(update_fields=['source', 'attempts', 'run_after'])
+    return job
+
+
+def schedule(instance, field_name):
+    if settings.IMAGE_JOBS_EAGER:
+        update_variants(instance, field_name)
+    else:
+        enqueue(instance, field_name)
+
+
+def requeue_stale():
+    """Put back jobs whose consumer died while running them."""
+    now = timezone.now()
+    stale = ImageJob.objects.filter(status=ImageJob.RUNNING, started_at__lt=now - timedelta(seconds=settings.IMAGE_JOB_TIMEOUT))
+    stale.filter(attempts__gte=settings.IMAGE_JOB_MAX_ATTEMPTS).update(
+        status=ImageJob.FAILED, last_error='Timed out', finished_at=now,
+    )
+    return stale.update(status=ImageJob.PENDING, last_error='Timed out')
+
+
+def claim(limit):
+    """Mark up to `limit` due jobs as running and return them."""
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            ImageJob.objects.select_for_update(skip_locked=True)
+            .filter(status=ImageJob.PENDING, run_after__lte=now)
+            .order_by('run_after', 'id')
+            .values_list('id', flat=True)[:limit]
+        )
+        ImageJob.objects.filter(id__in=ids).update(status=ImageJob.RUNNING, attempts=F('attempts') + 1, started_at=now)
+    return list(ImageJob.objects.filter(id__in=ids).order_by('id'))
+
+
+def _finish(job, status, error=''):
+    ImageJob.objects.filter(pk=job.pk).update(status=status, last_error=error, finished_at=timezone.now())
+
+
+def _fail(job, error, retry=True):
+    if retry and job.attempts < settings.IMAGE_JOB_MAX_ATTEMPTS:
+        delay = settings.IMAGE_JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+        ImageJob.objects.filter(pk=job.pk).update(
+            status=ImageJob.PENDING, last_error=error, run_after=timezone.now() + timedelta(seconds=delay),
+        )
+        logger.warning('Image job %s failed (attempt %s), retrying in %ss: %s', job.pk, job.attempts, delay, error)
+    else:
+        _finish(job, ImageJob.FAILED, error)
+        logger.error('Image job %s failed: %s', job.pk, error)
+
+
+def _load(job):
+    """The source bytes of a claimed job, or None if there is nothing left to do."""
+    model = apps.get_model(job.model)
+    if not model._default_manager.filter(pk=job.object_id, **{job.field: job.source}).exists():
+        # Deleted, or replaced by a newer upload with a job of its own
+        _finish(job, ImageJob.DONE, 'Superseded')
+        return None
+    storage = model._meta.get_field(job.field).storage
+    if not storage.exists(job.source):
+        _fail(job, f'File {job.source} not found', retry=False)
+        return None
+    return read_source(storage.open(job.source))
+
+
+def _complete(job, data, future):
+    model = apps.get_model(job.model)
+    try:
+        rendered = future.result()
+    except UNREADABLE as e:
+        record_unreadable(model, job.object_id, job.field, job.source)
+        _fail(job, f'Unreadable image: {e}', retry=False)
+        return
+    apply_rendered(model, job.object_id, job.field, job.source, data, rendered)
+    _finish(job, ImageJob.DONE)
+
+
+class InlineFuture:
+    """Stands in for a pool future when jobs run in the consumer process itself."""
+
+    def __init__(self, func, *args, **kwargs):
+        try:
+            self._result, self._error = func(*args, **kwargs), None
+        except Exception as e:
+            self._result, self._error = None, e
+
+    def result(self):
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+def run(jobs, pool=None):
+    """
+    Process claimed jobs: decoding and encoding run on `pool` (a
+    ProcessPoolExecutor) when given, storage and database work here.
+    """
+    pending = {}
+    options = render_options()
+    for job in jobs:
+        try:
+            data = _load(job)
+            if data is None:
+                continue
+            if pool is None:
+                future = InlineFuture(imaging.render, data, **options)
+            else:
+                future = pool.submit(imaging.render, data, **options)
+            pending[future] = (job, data)
+        except Exception as e:
+            _fail(job, f'{type(e).__name__}: {e}')
+
+    futures = as_completed(pending) if pool is not None else list(pending)
+    for future in futures:
+        job, data = pending[future]
+        try:
+            _complete(job, data, future)
+        except Exception as e:
+            logger.exception('Image job %s failed', job.pk)
+            _fail(job, f'{type(e).__name__}: {e}')
@@ -0,0 +1,63 @@
+"""
+Image decoding and encoding for uploads.
+
+Nothing here touches Django: `render` takes the uploaded bytes and returns
+encoded bytes, so it can run in the worker processes of
+`manage.py process_image_jobs` while the database and storage work stays in
+the parent.
+"""
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+# Formats whose originals are re-encoded when they carry EXIF metadata
+STRIPPABLE_FORMATS = ('JPEG', 'PNG', 'WEBP')
+
+
+def _encode(image, image_format, **options):
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+    buffer = BytesIO()
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def render(data, widths, image_format='WEBP', quality=80, original_quality=90):
+    """
+    Decode an uploaded image and return {'width', 'height', 'original',
+    'variants'}: `variants` maps each width below the image's own to the
+    downscaled copy in `image_format`; `original` is the upload re-encoded
+    without EXIF (GPS, camera data) when it had any, otherwise None.
+    Raises OSError/ValueError for files Pillow can't read.
+    """
+    with Image.open(BytesIO(data)) as source:
+        source_format = source.format
+        has_exif = len(source.getexif()) > 0
+        # Rotation comes from EXIF, so apply it before the metadata goes
+        image = ImageOps.exif_transpose(source)
+        image.load()
+        icc_profile = source.info.get('icc_profile')
+
+    original = None
+    if has_exif and source_format in STRIPPABLE_FORMATS:
+        options = {'icc_profile': icc_profile} if icc_profile else {}
+        if source_format in ('JPEG', 'WEBP'):
+            options['quality'] = original_quality
+        original = _encode(image, source_format, **options)
+
+    variants = {}
+    for width in sorted(widths):
+        if width >= image.width:
+            break
+        copy = image.copy()
+        # Height is unbounded, so only the width limits the size and the aspect ratio is kept
+        copy.thumbnail((width, image.height), Image.LANCZOS)
+        options = {'quality': quality}
+        if image_format == 'JPEG':
+            options.update(optimize=True, progressive=True)
+        elif image_format == 'WEBP':
+            options['method'] = 6
+        variants[width] = _encode(copy, image_format, **options)
+    return {'width': image.width, 'height': image.height, 'original': original, 'variants': variants}
@@ -1,11 +1,29 @@
 import base64
+import functools
 import hashlib
+import hmac
 import json
 
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
 class LiqPay:
-    def __init__(self, public_key, private_key):
+    def __init__(self, public_key, private_key, server_url=None, result_url=None):
         self.public_key = public_key
         self.private_key = private_key
+        self.server_url = server_url
+        self.result_url = result_url
+        # sha1(private_key + data + private_key): hash the key prefix once and copy it per signature
+        self._key = (private_key or '').encode('utf-8')
+        self._prefix = hashlib.sha1(self._key)
+
+    def sign(self, data):
+        digest = self._prefix.copy()
+        digest.update(data.encode('utf-8'))
+        digest.update(self._key)
+        return base64.b64encode(digest.digest()).decode('utf-8')
 
     def generate_payment_form(self, order_id, amount, description):
         # Prepare data for LiqPay
@@ -17,22 +35,33 @@ class LiqPay:
             'order_id': str(order_id),
             'version': '3',
             'public_key': self.public_key,
-            'result_url': f'http:localhost:3000/order/success?order_id={order_id}',
-            'server_url': 'https://0dd7-93-170-0-235.ngrok-free.app/api/liqpay/callback/'
+            'result_url': self.result_url.format(order_id=order_id),
+            'server_url': self.server_url,
         }
-        
-        # Generate signature
-        data = base64.b64encode(json.dumps(params).encode('utf-8'))
-        signature = base64.b64encode(hashlib.sha1((self.private_key + data.decode('utf-8') + self.private_key).encode('utf-8')).digest())
-        
+
+        data = base64.b64encode(json.dumps(params).encode('utf-8')).decode('utf-8')
         return {
-            'data': data.decode('utf-8'),
-            'signature': signature.decode('utf-8')
+            'data': data,
+            'signature': self.sign(data),
         }
 
     def verify_signature(self, data, signature):
-        calculated_signature = base64.b64encode(
-            hashlib.sha1((self.private_key + data + self.private_key).encode('utf-8')).digest()
-        ).decode('utf-8')
-        
-        return calculated_signature == signature
\ No newline at end of file
+        # Constant-time comparison, so the signature can't be guessed byte by byte
+        return hmac.compare_digest(self.sign(data).encode('utf-8'), str(signature).encode('utf-8'))
+
+
+@functools.lru_cache(maxsize=None)
+def get_client():
+    """The LiqPay client for the configured keys, built once per process."""
+    return LiqPay(
+        settings.LIQPAY_PUBLIC_KEY,
+        settings.LIQPAY_PRIVATE_KEY,
+        server_url=settings.LIQPAY_SERVER_URL,
+        result_url=settings.LIQPAY_RESULT_URL,
+    )
+
+
+@receiver(setting_changed)
+def _reset_client(setting, **kwargs):
+    if setting.startswith('LIQPAY_'):
+        get_client.cache_clear()
@@ -1,60 +1,64 @@
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
 from .models import Order
-from .liqpay import LiqPay
-import json
-import base64
+from .liqpay import get_client
+from .payments import InvalidPayload, decode_payload, record_callback
+from .async_views import request_data
+
+def payment_payload(order_id, amount, updated_at):
+    """Signed LiqPay checkout form for an order, cached until the order changes."""
+    client = get_client()
+    key = f'liqpay:payload:{client.public_key}:{order_id}:{amount}:{updated_at.timestamp()}'
+    payload = cache.get(key)
+    if payload is None:
+        payload = client.generate_payment_form(
+            order_id=order_id,
+            amount=float(amount),
+            description=f'Оплата замовлення #{order_id} на Petopia'
+        )
+        cache.set(key, payload, timeout=settings.LIQPAY_PAYLOAD_TIMEOUT)
+    return payload
+
 
 @api_view(['GET'])
 def order_payment(request, pk):
     try:
-        order = Order.objects.get(pk=pk)
-        
-        # Initialize LiqPay with your credentials
-        liqpay = LiqPay(settings.LIQPAY_PUBLIC_KEY, settings.LIQPAY_PRIVATE_KEY)
-        
-        # Generate payment form data
-        payment_data = liqpay.generate_payment_form(
-            order_id=order.id,
-            amount=float(order.total_amount),
-            description=f'Оплата замовлення #{order.id} на Petopia'
-        )
-        
-        return Response(payment_data)
+        # Only the columns the cache key needs
+        amount, updated_at = Order.objects.filter(pk=pk).values_list('total_amount', 'updated_at').get()
     except Order.DoesNotExist:
         return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    return Response(payment_payload(pk, amount, updated_at))
 
-@api_view(['POST'])
-def liqpay_callback(request):
-    print(request.data)
-    data = request.data.get('data')
-    signature = request.data.get('signature')
+@csrf_exempt
+@require_POST
+async def liqpay_callback(request):
+    # Async, so a burst of callbacks waits on the database, not on worker threads
+    data = request_data(request)
+    signature = data.get('signature')
+    data = data.get('data')
     
     if not data or not signature:
-        return Response({'error': 'Invalid data'}, status=status.HTTP_400_BAD_REQUEST)
-    
-    # Initialize LiqPay
-    liqpay = LiqPay(settings.LIQPAY_PUBLIC_KEY, settings.LIQPAY_PRIVATE_KEY)
+        return JsonResponse({'error': 'Invalid data'}, status=status.HTTP_400_BAD_REQUEST)
     
     # Verify signature
-    if not liqpay.verify_signature(data, signature):
-        return Response({'error': 'Invalid signature'}, status=status.HTTP_400_BAD_REQUEST)
-    
-    # Decode payment data
-    payment_data = json.loads(base64.b64decode(data).decode('utf-8'))
+    if not get_client().verify_signature(data, signature):
+        return JsonResponse({'error': 'Invalid signature'}, status=status.HTTP_400_BAD_REQUEST)
     
-    # Check payment status
-    if payment_data.get('status') == 'success':
-        order_id = payment_data.get('order_id')
-        
-        try:
-            order = Order.objects.get(id=order_id)
-            order.paid = True
-            order.save()
-            print(f"Order {order_id} marked as paid")
-        except Order.DoesNotExist:
-            return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+    # Store the event and mark the order paid; e-mails etc. run in the background
+    try:
+        await sync_to_async(record_callback)(decode_payload(data))
+    except InvalidPayload as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Order.DoesNotExist:
+        return JsonResponse({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
     
-    return Response({'status': 'OK'})
\ No newline at end of file
+    # Replays get the same answer, so LiqPay stops retrying
+    return JsonResponse({'status': 'OK'})
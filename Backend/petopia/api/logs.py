@@ -0,0 +1,137 @@
+"""
+Logging plumbing, wired up by LOGGING in settings.
+
+A logging call in a request only filters the record, tags it with the
+request id and puts it on a queue; BackgroundStreamHandler's listener thread
+does the JSON encoding, traceback formatting and the write to stdout, so slow
+output never shows up in request latency. DEBUG records can be sampled
+(LOG_DEBUG_SAMPLE_RATE), and loggers below LOG_LEVEL return before building
+anything, so use %-style arguments rather than f-strings.
+
+This module is imported while logging is configured, before the apps are
+loaded: it must not import models.
+"""
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+request_id = ContextVar('request_id', default=None)
+
+# An incoming X-Request-ID (e.g. from nginx) is kept if it looks like an id
+VALID_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+# Attributes every LogRecord has; anything else came in through `extra`
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'request_id'}
+
+
+def new_request_id(incoming=None):
+    if incoming and VALID_REQUEST_ID.match(incoming):
+        return incoming
+    return uuid.uuid4().hex
+
+
+class RequestIdFilter(logging.Filter):
+    """Tags records with the id of the request being handled (set by RequestIdMiddleware)."""
+
+    def filter(self, record):
+        current = request_id.get()
+        if current is None:
+            # django.request logs error responses after the middleware has returned
+            current = getattr(getattr(record, 'request', None), 'request_id', None)
+        record.request_id = current
+        return True
+
+
+class SampleFilter(logging.Filter):
+    """Lets through only a `rate` share of DEBUG records; other levels pass."""
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = float(rate)
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with `extra` fields as top-level keys."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in RECORD_ATTRIBUTES)
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc_info'] = record.exc_text
+        if record.stack_info:
+            entry['stack_info'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class BackgroundStreamHandler(logging.Handler):
+    """
+    Queues records for a listener thread that formats them and writes them to
+    `stream`. The formatter set on this handler is used by that thread.
+
+    Not a QueueHandler: dictConfig configures those differently from 3.12 on.
+    The thread is started by the first record, and again in a forked child
+    (gunicorn --preload), which inherits the queue but not the thread.
+    logging.shutdown() closes the handler at exit, which drains the queue.
+    """
+
+    def __init__(self, stream=None):
+        super().__init__()
+        self.queue = queue.SimpleQueue()
+        self.target = logging.StreamHandler(stream)
+        self.listener = None
+        self._pid = None
+
+    def _start(self):
+        self.listener = logging.handlers.QueueListener(self.queue, self.target)
+        self.listener.start()
+        self._pid = os.getpid()
+
+    def setFormatter(self, fmt):
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Merge the arguments now, as they may change once the call returns;
+        # everything else is left to the listener thread
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        return record
+
+    def emit(self, record):
+        # handle() holds the handler lock, so only one caller starts the thread
+        try:
+            if self._pid != os.getpid():
+                self._start()
+            self.queue.put_nowait(self.prepare(record))
+        except Exception:
+            self.handleError(record)
+
+    def stop(self):
+        """Write out what is queued and stop the thread; the next record starts it again."""
+        with self.lock:
+            if self.listener is not None and self._pid == os.getpid():
+                self.listener.stop()
+            self.listener = self._pid = None
+
+    def close(self):
+        self.stop()
+        self.target.close()
+        super().close()
@@ -0,0 +1,73 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import Client, override_settings
+
+
+def percentile(timings, fraction):
+    return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+
+def ms(seconds):
+    return f'{seconds * 1000:.1f} ms'
+
+
+class Command(BaseCommand):
+    help = (
+        'Send GET requests through the whole Django stack from several threads and report latency '
+        'percentiles, e.g. to compare DB_CONN_MAX_AGE / DB_POOL settings against the real database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='/api/products/')
+        parser.add_argument('--requests', type=int, default=1000, help='Requests per run (after warm-up)')
+        parser.add_argument('--concurrency', type=int, default=8, help='Threads sending requests')
+        parser.add_argument('--warmup', type=int, default=50, help='Requests sent first and not measured')
+        parser.add_argument('--cached', action='store_true', help='Keep the catalog response cache (off by default, so every request queries the database)')
+
+    def worker(self, path, count):
+        host = next((host for host in settings.ALLOWED_HOSTS if host not in ('*', '') and not host.startswith('.')), 'localhost')
+        client = Client(HTTP_HOST=host)
+        timings, errors = [], 0
+        try:
+            for _ in range(count):
+                start = time.perf_counter()
+                response = client.get(path)
+                timings.append(time.perf_counter() - start)
+                errors += response.status_code >= 400
+        finally:
+            # Like a server thread exiting; pooled connections go back to the pool
+            connections.close_all()
+        return timings, errors
+
+    def run(self, path, total, concurrency):
+        counts = [total // concurrency + (i < total % concurrency) for i in range(concurrency)]
+        with ThreadPoolExecutor(concurrency) as pool:
+            results = list(pool.map(lambda count: self.worker(path, count), counts))
+        return sorted(t for timings, _ in results for t in timings), sum(errors for _, errors in results)
+
+    def handle(self, *args, path, **options):
+        caches = settings.CACHES
+        if not options['cached']:
+            caches = {**caches, 'catalog': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+        database = settings.DATABASES['default']
+        self.stdout.write(
+            f"{path}: CONN_MAX_AGE={database['CONN_MAX_AGE']}, "
+            f"pool={database.get('OPTIONS', {}).get('pool', False)}, concurrency={options['concurrency']}"
+        )
+
+        with override_settings(CACHES=caches):
+            if options['warmup']:
+                self.run(path, options['warmup'], options['concurrency'])
+            start = time.perf_counter()
+            timings, errors = self.run(path, options['requests'], options['concurrency'])
+            elapsed = time.perf_counter() - start
+
+        self.stdout.write(
+            f'{len(timings)} requests in {elapsed:.2f} s ({len(timings) / elapsed:.0f} req/s), {errors} errors\n'
+            f'p50 {ms(percentile(timings, 0.5))}, p95 {ms(percentile(timings, 0.95))}, '
+            f'p99 {ms(percentile(timings, 0.99))}, max {ms(timings[-1])}'
+        )
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from api.storage import content_digest
+from api.thumbnails import IMAGE_FIELDS, is_referenced, variants_field
+
+
+class Command(BaseCommand):
+    help = 'Move uploads saved before content-addressed storage to their hashed names, merging duplicates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be moved')
+
+    def handle(self, *args, **options):
+        moved, legacy = 0, set()
+        for model, field_name in IMAGE_FIELDS.items():
+            storage = model._meta.get_field(field_name).storage
+            rows = model._default_manager.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+            for pk, name, variants in rows.values_list('pk', field_name, variants_field(field_name)).iterator():
+                if content_digest(name) or not storage.exists(name):
+                    continue
+                moved += 1
+                legacy.add((storage, name))
+                if options['dry_run']:
+                    continue
+                with storage.open(name, 'rb') as file:
+                    stored = storage.save(name, file)
+                if variants and variants.get('source') == name:
+                    # Same bytes, so the variants stay valid under the new name
+                    variants = dict(variants, source=stored)
+                model._default_manager.filter(pk=pk, **{field_name: name}).update(
+                    **{field_name: stored, variants_field(field_name): variants},
+                )
+
+        freed = 0
+        for storage, name in legacy:
+            if options['dry_run'] or is_referenced(name):
+                continue
+            freed += storage.size(name)
+            storage.delete(name)
+        verb = 'Would move' if options['dry_run'] else 'Moved'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {moved} files, freed {freed} bytes'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from api.thumbnails import IMAGE_FIELDS, update_variants, variants_field
+
+
+class Command(BaseCommand):
+    help = 'Build responsive image variants for images uploaded before they existed or whose files changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Rebuild variants even if they look up to date')
+
+    def handle(self, *args, **options):
+        built = 0
+        for model, field_name in IMAGE_FIELDS.items():
+            for instance in model._default_manager.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True}).iterator():
+                if options['force']:
+                    setattr(instance, variants_field(field_name), {})
+                before = getattr(instance, variants_field(field_name))
+                if update_variants(instance, field_name) != before:
+                    built += 1
+        self.stdout.write(self.style.SUCCESS(f'Built variants for {built} images'))
@@ -0,0 +1,46 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api import image_jobs
+
+
+class Command(BaseCommand):
+    help = 'Process queued image uploads (EXIF stripping, responsive variants) on a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                            help='Worker processes for decoding and encoding; 0 runs jobs in this process')
+        parser.add_argument('--batch', type=int, default=0, help='Jobs claimed at a time (default: 2 per process)')
+        parser.add_argument('--poll', type=float, default=2.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        batch = options['batch'] or max(processes, 1) * 2
+        # Workers run only api.imaging, which needs no Django; spawn keeps them
+        # from inheriting this process's database connections
+        pool = ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('spawn')) if processes else None
+        processed = 0
+        try:
+            while True:
+                close_old_connections()
+                image_jobs.requeue_stale()
+                jobs = image_jobs.claim(batch)
+                if jobs:
+                    image_jobs.run(jobs, pool)
+                    processed += len(jobs)
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(options['poll'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} image jobs'))
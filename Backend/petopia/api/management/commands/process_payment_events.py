@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.models import PaymentEvent
+from api.payments import process_event
+
+
+class Command(BaseCommand):
+    help = 'Run follow-up work for payment events the background worker did not finish (e.g. after a restart)'
+
+    def handle(self, *args, **options):
+        pending = list(PaymentEvent.objects.filter(processed_at__isnull=True).order_by('created_at').values_list('id', flat=True))
+        for event_id in pending:
+            process_event(event_id)
+        self.stdout.write(self.style.SUCCESS(f'Processed {len(pending)} payment events'))
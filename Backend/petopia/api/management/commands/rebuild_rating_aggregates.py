@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Recompute Product.rating_sum / rating_count / rating_avg from ProductRating rows'
+
+    def handle(self, *args, **options):
+        updated = Product.objects.rebuild_rating_aggregates()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rating aggregates for {updated} products'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api.search import is_postgres, product_index, update_search_vectors
+
+
+class Command(BaseCommand):
+    help = 'Recompute Product.search_vector for every product (e.g. after a bulk import or a config change)'
+
+    def handle(self, *args, **options):
+        if not is_postgres():
+            product_index.clear()
+            self.stdout.write('Database has no full-text search; the in-process index will be rebuilt on next search.')
+            return
+        updated = update_search_vectors()
+        self.stdout.write(self.style.SUCCESS(f'Updated search vectors for {updated} products'))
@@ -0,0 +1,208 @@
+"""
+Serving uploaded media and collected static files.
+
+`serve_file` handles what a file server would: conditional GET (ETag,
+Last-Modified), single byte ranges, and the .br/.gz copies collectstatic
+writes next to text assets (api.storage). Names that can never change go out
+with a long `Cache-Control: immutable`: content-addressed uploads, whose ETag
+is taken from the name itself, and the hashed names of the static manifest.
+
+With FILE_SENDFILE set, Django only checks the request and answers with
+headers; X-Accel-Redirect (nginx) or X-Sendfile (Apache) hands the transfer
+to the web server, so file downloads don't hold app workers.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe
+
+from .storage import content_digest
+
+# Precompressed copies, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+SINGLE_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+REJECTED = re.compile(r'^q=0(\.0*)?$')
+# ManifestStaticFilesStorage names: app.3f2a9c1b04de.css
+HASHED_STATIC = re.compile(r'^(?P<base>.+)\.[0-9a-f]{12}(?P<extension>\.[^./]+)?$')
+CHUNK_SIZE = 64 * 1024
+
+
+def _accepted_encodings(header):
+    accepted = set()
+    for part in header.split(','):
+        coding, *params = [item.strip() for item in part.split(';')]
+        if coding and not any(REJECTED.match(param) for param in params):
+            accepted.add(coding.lower())
+    return accepted
+
+
+def _select(request, fullpath):
+    """The file to send, its Content-Encoding, and whether compressed copies exist at all."""
+    accepted = _accepted_encodings(request.headers.get('Accept-Encoding', ''))
+    varies = False
+    for encoding, suffix in ENCODINGS:
+        if os.path.isfile(fullpath + suffix):
+            varies = True
+            if encoding in accepted:
+                return fullpath + suffix, encoding, True
+    return fullpath, None, varies
+
+
+def _byte_range(header, size):
+    """
+    (start, end) of a single `bytes=` range, None to send the whole file
+    (no range, several ranges or a malformed one), or False if it can't be
+    satisfied.
+    """
+    match = SINGLE_RANGE.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        # bytes=-N: the last N bytes
+        if not last:
+            return None
+        if int(last) == 0 or size == 0:
+            return False
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size:
+        return False
+    if end < start:
+        return None
+    return start, end
+
+
+def _if_range_passes(request, etag, last_modified):
+    if_range = request.headers.get('If-Range')
+    if if_range is None:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def _read(file, start, length):
+    try:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+def _file_response(request, selected, content_type, size, etag, last_modified):
+    byte_range = None
+    if 'Range' in request.headers and _if_range_passes(request, etag, last_modified):
+        byte_range = _byte_range(request.headers['Range'], size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    file = open(selected, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(_read(file, start, end - start + 1), status=206, content_type=content_type)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def _sendfile_response(fullpath, relative, internal_url, content_type):
+    # The web server handles ranges and its own precompressed files (gzip_static)
+    response = HttpResponse(content_type=content_type)
+    if settings.FILE_SENDFILE == 'nginx':
+        response['X-Accel-Redirect'] = quote(internal_url + relative)
+    else:
+        response['X-Sendfile'] = fullpath
+    return response
+
+
+def serve_file(request, root, path, internal_url, cache_max_age=None, etag=None):
+    """
+    Send the file `path` under `root`. `cache_max_age` is given for names that
+    never change and makes the response immutable; `etag` replaces the one
+    built from the file's mtime and size. `internal_url` is where the web
+    server maps `root` for FILE_SENDFILE = 'nginx'.
+    """
+    relative = posixpath.normpath(path).lstrip('/')
+    try:
+        fullpath = safe_join(root, relative)
+    except SuspiciousFileOperation:
+        raise Http404('Invalid path')
+    if not os.path.isfile(fullpath):
+        raise Http404(f'"{relative}" does not exist')
+
+    if settings.FILE_SENDFILE:
+        selected, encoding, varies = fullpath, None, False
+    else:
+        selected, encoding, varies = _select(request, fullpath)
+    stat = os.stat(selected)
+    last_modified = int(stat.st_mtime)
+    if etag is None:
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    elif encoding:
+        # Each encoding is a representation of its own
+        etag = f'{etag[:-1]}-{encoding}"'
+    content_type = mimetypes.guess_type(fullpath)[0] or 'application/octet-stream'
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        if settings.FILE_SENDFILE:
+            response = _sendfile_response(fullpath, relative, internal_url, content_type)
+        else:
+            response = _file_response(request, selected, content_type, stat.st_size, etag, last_modified)
+            if encoding:
+                response['Content-Encoding'] = encoding
+
+    if response.status_code in (200, 206, 304):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        if varies:
+            patch_vary_headers(response, ['Accept-Encoding'])
+        if cache_max_age is not None:
+            patch_cache_control(response, public=True, max_age=cache_max_age, immutable=True)
+    return response
+
+
+def serve_media(request, path):
+    digest = content_digest(path)
+    if digest is None:
+        # Legacy name: it may be overwritten, so only revalidation
+        return serve_file(request, settings.MEDIA_ROOT, path, settings.SENDFILE_URL + 'media/')
+    return serve_file(
+        request, settings.MEDIA_ROOT, path, settings.SENDFILE_URL + 'media/',
+        cache_max_age=settings.MEDIA_CACHE_MAX_AGE, etag=f'"{digest}"',
+    )
+
+
+def is_hashed_static(path):
+    """Whether `path` is a hashed name from the static manifest, i.e. never changes."""
+    match = HASHED_STATIC.match(path)
+    hashed_files = getattr(staticfiles_storage, 'hashed_files', None)
+    if match is None or not hashed_files:
+        return False
+    return hashed_files.get(match['base'] + (match['extension'] or '')) == path
+
+
+def serve_static(request, path):
+    cache_max_age = settings.STATIC_CACHE_MAX_AGE if is_hashed_static(path) else None
+    return serve_file(request, settings.STATIC_ROOT, path, settings.SENDFILE_URL + 'static/', cache_max_age=cache_max_age)
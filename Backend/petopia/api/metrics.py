@@ -0,0 +1,253 @@
+"""
+Request instrumentation.
+
+InstrumentationMiddleware measures every request: wall time, database
+queries and their time (an execute wrapper installed on each connection as
+it is opened), time spent building serializer data, and response size. The
+numbers go out in a `Server-Timing` header, are aggregated per view in
+`registry`, and are exposed in Prometheus text format by `metrics_view`
+(/metrics, internal only). A view that runs the same SQL many times in one
+request (an N+1 pattern) is logged.
+
+Aggregates are per process; scrape each worker, or sum them in Prometheus.
+"""
+import functools
+import ipaddress
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+from .cache import stats as cache_stats
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.duration = 0.0
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializing = False
+        self.statements = Counter()
+
+    def repeated_statements(self):
+        """SQL run at least N_PLUS_ONE_THRESHOLD times, most frequent first."""
+        return [(sql, count) for sql, count in self.statements.most_common() if count >= settings.N_PLUS_ONE_THRESHOLD]
+
+
+_current = ContextVar('request_metrics', default=None)
+
+
+@contextmanager
+def measure():
+    """Collect the numbers of the code inside the block (one request, in InstrumentationMiddleware)."""
+    metrics = RequestMetrics()
+    token = _current.set(metrics)
+    start = time.perf_counter()
+    try:
+        yield metrics
+    finally:
+        metrics.duration = time.perf_counter() - start
+        _current.reset(token)
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_time += time.perf_counter() - start
+        metrics.db_queries += 1
+        metrics.statements[sql] += 1
+
+
+@receiver(connection_created)
+def _install_query_wrapper(sender, connection, **kwargs):
+    # Wrappers belong to the connection object, which outlives reconnects
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def _timed_data(fget):
+    @functools.wraps(fget)
+    def data(serializer):
+        metrics = _current.get()
+        if metrics is None or metrics.serializing:
+            # Serializers nested through .data are counted by the outer one
+            return fget(serializer)
+        metrics.serializing = True
+        start = time.perf_counter()
+        try:
+            return fget(serializer)
+        finally:
+            metrics.serializer_time += time.perf_counter() - start
+            metrics.serializing = False
+    data.instrumented = True
+    return data
+
+
+def instrument_serializers():
+    """Time `.data` of DRF serializers; called once from ApiConfig.ready."""
+    from rest_framework import serializers
+
+    for cls in (serializers.Serializer, serializers.ListSerializer):
+        prop = cls.__dict__['data']
+        if not getattr(prop.fget, 'instrumented', False):
+            cls.data = property(_timed_data(prop.fget))
+
+
+class ViewStats:
+    def __init__(self):
+        self.statuses = Counter()
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.duration = 0.0
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.response_bytes = 0
+        self.n_plus_one = 0
+
+
+class Registry:
+    """Per-process aggregates by (view, method)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = defaultdict(ViewStats)
+
+    def observe(self, view, method, status, metrics, size, n_plus_one):
+        with self._lock:
+            stats = self._views[view, method]
+            stats.statuses[status] += 1
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if metrics.duration <= bound:
+                    stats.buckets[i] += 1
+            stats.duration += metrics.duration
+            stats.db_queries += metrics.db_queries
+            stats.db_time += metrics.db_time
+            stats.serializer_time += metrics.serializer_time
+            stats.response_bytes += size
+            stats.n_plus_one += n_plus_one
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.extend(samples)
+
+        with self._lock:
+            views = sorted(self._views.items())
+            family('petopia_requests_total', 'counter', 'Requests handled, by view and status.', [
+                f'petopia_requests_total{_labels(view=view, method=method, status=status)} {count}'
+                for (view, method), stats in views for status, count in sorted(stats.statuses.items())
+            ])
+            durations = []
+            for (view, method), stats in views:
+                count = sum(stats.statuses.values())
+                for bound, observed in zip(DURATION_BUCKETS, stats.buckets):
+                    durations.append(f'petopia_request_duration_seconds_bucket{_labels(view=view, method=method, le=bound)} {observed}')
+                durations.append(f'petopia_request_duration_seconds_bucket{_labels(view=view, method=method, le="+Inf")} {count}')
+                durations.append(f'petopia_request_duration_seconds_sum{_labels(view=view, method=method)} {stats.duration}')
+                durations.append(f'petopia_request_duration_seconds_count{_labels(view=view, method=method)} {count}')
+            family('petopia_request_duration_seconds', 'histogram', 'Wall time of requests.', durations)
+            for name, attribute, help_text in (
+                ('petopia_db_queries_total', 'db_queries', 'Database queries run by requests.'),
+                ('petopia_db_time_seconds_total', 'db_time', 'Time spent in database queries.'),
+                ('petopia_serializer_time_seconds_total', 'serializer_time', 'Time spent building serializer data.'),
+                ('petopia_response_bytes_total', 'response_bytes', 'Response body bytes (streamed bodies count when their length is known).'),
+                ('petopia_n_plus_one_total', 'n_plus_one', 'Requests that repeated the same query N_PLUS_ONE_THRESHOLD times or more.'),
+            ):
+                family(name, 'counter', help_text, [
+                    f'{name}{_labels(view=view, method=method)} {getattr(stats, attribute)}' for (view, method), stats in views
+                ])
+
+        cache_samples = []
+        for endpoint, counter in sorted(cache_stats.snapshot().items()):
+            for result in ('hits', 'misses'):
+                cache_samples.append(f'petopia_response_cache_total{_labels(endpoint=endpoint, result=result)} {counter[result]}')
+        family('petopia_response_cache_total', 'counter', 'Catalog response cache lookups.', cache_samples)
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in labels.items()) + '}'
+
+
+registry = Registry()
+
+
+def view_label(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    # Unnamed routes would otherwise be labelled with the function's import path
+    return match.view_name if match.url_name else match.route
+
+
+def server_timing(metrics):
+    return ', '.join([
+        f'app;dur={metrics.duration * 1000:.1f}',
+        f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.db_queries} queries"',
+        f'serialize;dur={metrics.serializer_time * 1000:.1f}',
+    ])
+
+
+def response_size(response):
+    if not response.streaming:
+        return len(response.content)
+    return int(response.get('Content-Length') or 0)
+
+
+def finish_request(request, response, metrics):
+    """Record the numbers `measure` collected for the request and add Server-Timing."""
+    view = view_label(request)
+    repeated = metrics.repeated_statements()
+    if repeated:
+        sql, count = repeated[0]
+        logger.warning('Possible N+1 in %s: the same query ran %s times (%s queries in total): %.300s',
+                       view, count, metrics.db_queries, sql)
+    registry.observe(view, request.method, response.status_code, metrics, response_size(response), bool(repeated))
+    if settings.SERVER_TIMING:
+        response['Server-Timing'] = server_timing(metrics)
+    return response
+
+
+def _allowed(request):
+    token = settings.METRICS_TOKEN
+    if token:
+        return constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network, strict=False) for network in settings.METRICS_ALLOWED_IPS)
+
+
+def metrics_view(request):
+    if not _allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
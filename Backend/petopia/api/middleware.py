@@ -0,0 +1,112 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from social_django import middleware as social_middleware
+
+from . import logs, metrics, replicas
+
+
+class SocialAuthExceptionMiddleware(social_middleware.SocialAuthExceptionMiddleware):
+    """
+    social_django's middleware is sync-only, which makes Django run every
+    view in a thread under ASGI. It only acts in process_exception, so it can
+    pass async requests straight through.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
+
+
+class ReplicaMiddleware:
+    """Sets up read-replica routing for each request and pins clients that wrote (api.replicas)."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _finish(self, request, response, state):
+        if state.wrote and settings.REPLICA_DATABASES:
+            replicas.pin(request, response)
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with replicas.request_scope() as state:
+            response = self.get_response(request)
+        return self._finish(request, response, state)
+
+    async def __acall__(self, request):
+        with replicas.request_scope() as state:
+            response = await self.get_response(request)
+        return self._finish(request, response, state)
+
+
+class InstrumentationMiddleware:
+    """Wall time, queries, serializer time and response size of every request (api.metrics)."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with metrics.measure() as measured:
+            response = self.get_response(request)
+        return metrics.finish_request(request, response, measured)
+
+    async def __acall__(self, request):
+        with metrics.measure() as measured:
+            response = await self.get_response(request)
+        return metrics.finish_request(request, response, measured)
+
+
+class RequestIdMiddleware:
+    """Gives each request an id (kept from X-Request-ID if the proxy sent one) for its log records."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.request_id = logs.new_request_id(request.headers.get('X-Request-ID'))
+        token = logs.request_id.set(request.request_id)
+        try:
+            response = self.get_response(request)
+        finally:
+            logs.request_id.reset(token)
+        response['X-Request-ID'] = request.request_id
+        return response
+
+    async def __acall__(self, request):
+        request.request_id = logs.new_request_id(request.headers.get('X-Request-ID'))
+        token = logs.request_id.set(request.request_id)
+        try:
+            response = await self.get_response(request)
+        finally:
+            logs.request_id.reset(token)
+        response['X-Request-ID'] = request.request_id
+        return response
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:15
+
+import django.contrib.postgres.search
+from django.conf import settings
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+# GIN indexes only exist on PostgreSQL, so they are created here instead of in
+# Product.Meta.indexes (which would break migrations on SQLite).
+CREATE_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS api_product_search_vector_gin ON api_product USING gin (search_vector)',
+    'CREATE INDEX IF NOT EXISTS api_product_name_trgm ON api_product USING gin (name gin_trgm_ops)',
+]
+DROP_INDEXES = [
+    'DROP INDEX IF EXISTS api_product_search_vector_gin',
+    'DROP INDEX IF EXISTS api_product_name_trgm',
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in CREATE_INDEXES:
+        schema_editor.execute(sql)
+
+    config = getattr(settings, 'PRODUCT_SEARCH_CONFIG', 'simple')
+    Product = apps.get_model('api', 'Product')
+    Product.objects.using(schema_editor.connection.alias).update(
+        search_vector=SearchVector('name', weight='A', config=config)
+        + SearchVector('description', weight='B', config=config)
+    )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in DROP_INDEXES:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_order_orderitem'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:17
+
+from django.db import migrations, models
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Product = apps.get_model('api', 'Product')
+    ProductRating = apps.get_model('api', 'ProductRating')
+    db = schema_editor.connection.alias
+    totals = (
+        ProductRating.objects.using(db)
+        .values('product')
+        .annotate(total=models.Sum('rating'), count=models.Count('id'))
+    )
+    products = []
+    for row in totals:
+        products.append(Product(
+            pk=row['product'],
+            rating_sum=row['total'],
+            rating_count=row['count'],
+            rating_avg=row['total'] / row['count'],
+        ))
+    Product.objects.using(db).bulk_update(products, ['rating_sum', 'rating_count', 'rating_avg'], batch_size=1000)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_avg',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-rating_avg', '-rating_count', '-id'], name='product_top_rated_idx'),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_product_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='animal_category',
+            index=models.Index(fields=['tree_id', 'lft'], name='animal_category_subtree_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item_category',
+            index=models.Index(fields=['tree_id', 'lft'], name='item_category_subtree_idx'),
+        ),
+    ]
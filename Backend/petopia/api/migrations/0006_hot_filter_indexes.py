@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_category_subtree_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='animal_category',
+            index=models.Index(fields=['name'], name='animal_category_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['user', 'product'], name='cart_user_product_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item_category',
+            index=models.Index(fields=['name'], name='item_category_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('user__isnull', False)), fields=['user', '-created_at'], name='order_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price', 'id'], name='product_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['created_at', 'id'], name='product_created_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:30
+
+from django.db import migrations, models
+
+
+def merge_duplicate_lines(apps, schema_editor):
+    # Fold repeated (user, product) rows into the oldest one before the
+    # unique constraint is added
+    Cart = apps.get_model('api', 'Cart')
+    carts = Cart.objects.using(schema_editor.connection.alias)
+    duplicates = (
+        carts.values('user_id', 'product_id')
+        .annotate(rows=models.Count('id'), total=models.Sum('quantity'), keep=models.Min('id'))
+        .filter(rows__gt=1)
+    )
+    for line in duplicates:
+        carts.filter(id=line['keep']).update(quantity=line['total'])
+        carts.filter(user_id=line['user_id'], product_id=line['product_id']).exclude(id=line['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_lines, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='cart',
+            name='cart_user_product_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='cart_user_product_uniq'),
+        ),
+    ]
@@ -1,5 +1,10 @@
+from decimal import ROUND_HALF_UP, Decimal
+
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models.functions import Cast, Coalesce, NullIf, Round
+from django.utils import timezone
 from mptt.models import MPTTModel, TreeForeignKey
 class CustomUserManager(BaseUserManager):
     def create_user(self, email, username, password=None, **extra_fields):
@@ -33,6 +38,8 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     is_staff = models.BooleanField(default=False)
     date_joined = models.DateTimeField(auto_now_add=True)
     avatar = models.ImageField(upload_to='avatars/', blank=True, null=True)
+    # Downscaled copies of the avatar, kept up to date by api.thumbnails
+    avatar_variants = models.JSONField(default=dict, blank=True, editable=False)
     address = models.TextField(blank=True)
     date_birth = models.DateField(blank=True, null=True)
     phone = models.CharField(max_length=25, blank=True)
@@ -48,6 +55,48 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
         return self.email
 
 
+def rating_average(rating_sum, rating_count):
+    # SQL expression for sum / count that yields 0 instead of dividing by zero
+    return Coalesce(Cast(rating_sum, models.FloatField()) / NullIf(rating_count, 0), 0.0)
+
+
+def discounted_price(price='price', discount='discount'):
+    # SQL expression for the price less the percentage discount, rounded to kopecks
+    return Round(
+        models.F(price) * (100 - models.F(discount)) / 100, 2,
+        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+class ProductQuerySet(models.QuerySet):
+    def for_catalog(self):
+        """
+        Batched read path for product lists: ratings come from the denormalized
+        columns and images/categories are prefetched, so serialization issues no
+        per-row queries.
+        """
+        return self.defer('search_vector').prefetch_related('image_set', 'Animal_Category', 'Item_Category')
+
+    def adjust_ratings(self, sum_delta, count_delta):
+        """Apply a rating change in one UPDATE; concurrent raters can't lose updates."""
+        new_sum = models.F('rating_sum') + sum_delta
+        new_count = models.F('rating_count') + count_delta
+        return self.update(
+            rating_sum=new_sum,
+            rating_count=new_count,
+            rating_avg=rating_average(new_sum, new_count),
+        )
+
+    def rebuild_rating_aggregates(self):
+        """Recompute the rating columns from ProductRating rows in bulk."""
+        ratings = ProductRating.objects.filter(product=models.OuterRef('pk')).values('product')
+        self.update(
+            rating_sum=Coalesce(models.Subquery(ratings.annotate(total=models.Sum('rating')).values('total')), 0),
+            rating_count=Coalesce(models.Subquery(ratings.annotate(total=models.Count('id')).values('total')), 0),
+        )
+        return self.update(rating_avg=rating_average(models.F('rating_sum'), models.F('rating_count')))
+
+
 class Product(models.Model):
     name = models.CharField(max_length=100)
     price = models.DecimalField(max_digits=10, decimal_places=2)
@@ -57,15 +106,42 @@ class Product(models.Model):
     Item_Category = models.ManyToManyField('Item_Category')
     discount = models.PositiveSmallIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Weighted tsvector of name + description, kept up to date by api.search.
+    # Its GIN index and the trigram index on name are PostgreSQL-only and live
+    # in migration 0003 rather than Meta.indexes.
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Denormalized from ProductRating by api.signals; rebuild with
+    # `manage.py rebuild_rating_aggregates` after bulk changes.
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_avg = models.FloatField(default=0, editable=False)
+
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        # One index per catalog sort order (api.pagination.PRODUCT_ORDERINGS).
+        # The trailing id matches the tie-breaker, so ORDER BY ... LIMIT and
+        # keyset pages are read straight off the index in either direction.
+        indexes = [
+            models.Index(fields=['price', 'id'], name='product_price_idx'),
+            models.Index(fields=['created_at', 'id'], name='product_created_idx'),
+            models.Index(fields=['-rating_avg', '-rating_count', '-id'], name='product_top_rated_idx'),
+        ]
+
     def __str__(self):
         return self.name
-    
+
     @property
     def images(self):
         return self.image_set.all()
     @property
     def average_rating(self):
-        return self.ratings.aggregate(average=models.Avg('rating'))['average'] or 0
+        return self.rating_avg if self.rating_count else 0
+
+    @property
+    def discounted_price(self):
+        # Same rounding as the discounted_price() SQL expression
+        return (self.price * (100 - self.discount) / 100).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
     
 class ProductRating(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='ratings')
@@ -76,10 +152,19 @@ class ProductRating(models.Model):
     class Meta:
         unique_together = ('product', 'user')  # Один користувач може оцінити товар лише раз
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored value so signals can apply the difference on save
+        instance._stored_rating = instance.__dict__.get('rating')
+        return instance
+
 #create image class for product
 class Image(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     image = models.ImageField(upload_to='products/')
+    # Downscaled copies for srcset, kept up to date by api.thumbnails
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return self.product.name
@@ -88,27 +173,68 @@ class Image(models.Model):
 class Animal_Category(MPTTModel):
     name = models.CharField(max_length=100)
     image = models.ImageField(upload_to='categories/')
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     description = models.TextField(blank=True)
     parent = TreeForeignKey('self', blank=True, null=True, on_delete=models.CASCADE, related_name='children')
 
     class MPTTMeta:
         order_insertion_by = ['name']
 
+    class Meta:
+        # Subtree lookups (api.categories) are tree_id = T AND lft BETWEEN L AND R
+        indexes = [
+            models.Index(fields=['tree_id', 'lft'], name='animal_category_subtree_idx'),
+            models.Index(fields=['name'], name='animal_category_name_idx'),
+        ]
+
     def __str__(self):
         return self.name
     
 class Item_Category(MPTTModel):
     name = models.CharField(max_length=100)
     image = models.ImageField(upload_to='categories/')
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     description = models.TextField(blank=True)
     parent = TreeForeignKey('self', blank=True, null=True, on_delete=models.CASCADE, related_name='children')
 
     class MPTTMeta:
         order_insertion_by = ['name']
 
+    class Meta:
+        # Subtree lookups (api.categories) are tree_id = T AND lft BETWEEN L AND R
+        indexes = [
+            models.Index(fields=['tree_id', 'lft'], name='item_category_subtree_idx'),
+            models.Index(fields=['name'], name='item_category_name_idx'),
+        ]
+
     def __str__(self):
         return self.name
     
+class CartQuerySet(models.QuerySet):
+    def with_totals(self):
+        """
+        Cart lines with product data, discounted unit price and line total.
+        Every row also carries the cart-wide `cart_total` and `cart_quantity`
+        (window sums), so the whole cart is one query.
+        """
+        line_total = models.ExpressionWrapper(
+            discounted_price('product__price', 'product__discount') * models.F('quantity'),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        )
+        return (
+            self.select_related('product')
+            .defer('product__search_vector')
+            .prefetch_related(models.Prefetch('product__image_set', queryset=Image.objects.order_by('id')))
+            .annotate(
+                unit_price=discounted_price('product__price', 'product__discount'),
+                line_total=line_total,
+                cart_total=models.Window(models.Sum(line_total)),
+                cart_quantity=models.Window(models.Sum('quantity')),
+            )
+            .order_by('date_added', 'id')
+        )
+
+
 #create cart class
 class Cart(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
@@ -116,10 +242,32 @@ class Cart(models.Model):
     quantity = models.IntegerField()
     date_added = models.DateTimeField(auto_now_add=True)
 
+    objects = CartQuerySet.as_manager()
+
+    class Meta:
+        # One line per product: cart writes are upserts on (user, product).
+        # The constraint's index also serves the per-user cart listing.
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='cart_user_product_uniq'),
+        ]
+
 
 
 # Backend/petopia/api/models.py
 
+class OrderQuerySet(models.QuerySet):
+    def with_items(self):
+        """
+        Prefetch items, their products and product images in one query each,
+        so order serializers read only prefetched data.
+        """
+        return self.prefetch_related(
+            models.Prefetch('items', queryset=OrderItem.objects.order_by('id')),
+            models.Prefetch('items__product', queryset=Product.objects.defer('search_vector')),
+            models.Prefetch('items__product__image_set', queryset=Image.objects.order_by('id')),
+        )
+
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -150,6 +298,19 @@ class Order(models.Model):
     # Інформація про доставку
     shipping_city = models.CharField(max_length=100)
     shipping_address = models.TextField()
+
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        # Order history (newest first). Guest orders have no user and are never
+        # listed this way, so they are left out of the index.
+        indexes = [
+            models.Index(
+                fields=['user', '-created_at'],
+                name='order_user_created_idx',
+                condition=models.Q(user__isnull=False),
+            ),
+        ]
     
     def __str__(self):
         return f"Order #{self.id} - {self.status}"
@@ -162,4 +323,73 @@ class OrderItem(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)  # Ціна на момент замовлення
     
     def __str__(self):
-        return f"{self.quantity} x {self.product_name}"
\ No newline at end of file
+        return f"{self.quantity} x {self.product_name}"
+
+
+class PaymentEvent(models.Model):
+    """
+    A verified LiqPay callback. LiqPay retries callbacks, so (order, payment_id,
+    status) is unique and a replayed callback is recognised by the insert
+    conflicting with the stored row.
+    """
+    order = models.ForeignKey(Order, related_name='payment_events', on_delete=models.CASCADE)
+    payment_id = models.CharField(max_length=64)
+    status = models.CharField(max_length=32)
+    amount = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Set by the background worker once follow-up work (e-mail, ...) is done
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'payment_id', 'status'], name='payment_event_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at'], name='payment_event_pending_idx', condition=models.Q(processed_at__isnull=True)),
+        ]
+
+    def __str__(self):
+        return f"Payment {self.payment_id} for order #{self.order_id}: {self.status}"
+
+
+class ImageJob(models.Model):
+    """
+    Processing of an uploaded image (EXIF stripping, responsive variants),
+    queued by api.image_jobs and run by `manage.py process_image_jobs`. An
+    image field has at most one pending job; a newer upload takes it over.
+    """
+    PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    model = models.CharField(max_length=50)  # app_label.model_name
+    object_id = models.BigIntegerField()
+    field = models.CharField(max_length=50)
+    source = models.CharField(max_length=255)  # file name when the job was queued
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    run_after = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['model', 'object_id', 'field'],
+                name='image_job_pending_uniq',
+                condition=models.Q(status='pending'),
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['run_after', 'id'], name='image_job_pending_idx', condition=models.Q(status='pending')),
+        ]
+
+    def __str__(self):
+        return f"{self.model}#{self.object_id}.{self.field}: {self.status}"
@@ -0,0 +1,160 @@
+import json
+from base64 import b64decode, b64encode
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination, PageNumberPagination
+from rest_framework.utils.urls import replace_query_param
+
+from .models import Product
+
+# sort_by values accepted by the catalog, mapped to a stable ordering.
+# The trailing id keeps ties (same price / same timestamp) in a fixed order.
+PRODUCT_ORDERINGS = {
+    'price_asc': ('price', 'id'),
+    'price_desc': ('-price', '-id'),
+    'newest': ('-created_at', '-id'),
+    'top_rated': ('-rating_avg', '-rating_count', '-id'),
+}
+DEFAULT_PRODUCT_ORDERING = ('id',)
+
+
+def get_product_ordering(sort_by):
+    return PRODUCT_ORDERINGS.get(sort_by, DEFAULT_PRODUCT_ORDERING)
+
+
+class ProductPageNumberPagination(PageNumberPagination):
+    page_size = 24
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+def keyset_filter(ordering, position):
+    """
+    Rows that come after `position` (values of the `ordering` fields) in that
+    ordering: `(price, id) > (10, 42)` spelled out as
+    `price > 10 OR (price = 10 AND id > 42)`.
+    """
+    condition, equal = Q(), Q()
+    for field, value in zip(ordering, position):
+        name = field.lstrip('-')
+        condition |= equal & Q(**{f"{name}__{'lt' if field.startswith('-') else 'gt'}": value})
+        equal &= Q(**{name: value})
+    if len(ordering) > 1:
+        # Redundant, but gives the planner a range on the leading index column
+        first = ordering[0]
+        condition &= Q(**{f"{first.lstrip('-')}__{'lte' if first.startswith('-') else 'gte'}": position[0]})
+    return condition
+
+
+def _reverse(field):
+    return field[1:] if field.startswith('-') else f'-{field}'
+
+
+class ProductCursorPagination(CursorPagination):
+    """
+    Keyset pagination. The cursor holds all the ordering values of the last
+    product sent, id included, and the next page is fetched with
+    `WHERE (price, id) > (<last price>, <last id>)` instead of OFFSET, so deep
+    pages and long runs of equal prices cost the same as the first page.
+    (DRF's CursorPagination keys on the first field only and steps through
+    ties with OFFSET.)
+    """
+    page_size = 24
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def get_ordering(self, request, queryset, view):
+        return get_product_ordering(request.query_params.get('sort_by'))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        position, reverse = self.decode_cursor(request)
+
+        # Previous pages are read backwards from the first product shown
+        ordering = [_reverse(field) for field in self.ordering] if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(keyset_filter(ordering, position))
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_more = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        if self.has_next or self.has_previous:
+            self.display_page_controls = True
+        return self.page
+
+    def _fields(self):
+        return [Product._meta.get_field(field.lstrip('-')) for field in self.ordering]
+
+    def decode_cursor(self, request):
+        """(position, reverse) from the cursor parameter; (None, False) on the first page."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            cursor = json.loads(b64decode(encoded.encode('ascii')).decode('utf-8'))
+            values = cursor['p']
+            if len(values) != len(self.ordering):
+                raise ValueError
+            position = [field.to_python(value) for field, value in zip(self._fields(), values)]
+            return position, bool(cursor.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, product, reverse=False):
+        cursor = {'p': [field.value_to_string(product) for field in self._fields()]}
+        if reverse:
+            cursor['r'] = 1
+        encoded = b64encode(json.dumps(cursor, separators=(',', ':')).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+
+class OrderPagination(PageNumberPagination):
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 50
+
+
+class ProductPagination(BasePagination):
+    """
+    Page-number pagination by default (`?page=3`), switching to keyset mode
+    when the client asks for it with `?pagination=cursor` or follows a cursor link.
+    """
+    mode_query_param = 'pagination'
+
+    def get_paginator(self, request):
+        cursor_mode = (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or ProductCursorPagination.cursor_query_param in request.query_params
+        )
+        return ProductCursorPagination() if cursor_mode else ProductPageNumberPagination()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.paginator = self.get_paginator(request)
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return ProductPageNumberPagination().get_paginated_response_schema(schema)
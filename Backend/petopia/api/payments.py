@@ -0,0 +1,98 @@
+"""
+LiqPay callback processing.
+
+A verified callback is stored as a PaymentEvent and applied to its order in
+one short transaction (an INSERT plus a targeted UPDATE), so the webhook
+answers in constant time. Anything slower (the confirmation e-mail) runs on
+the background worker after commit. LiqPay retries callbacks; a replay hits
+the PaymentEvent unique key and changes nothing.
+"""
+import base64
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Order, PaymentEvent
+from .worker import worker
+
+SUCCESS_STATUSES = ('success',)
+# A successful payment made with test credentials; it only pays orders with LIQPAY_SANDBOX on
+SANDBOX_STATUS = 'sandbox'
+
+
+def is_successful(status):
+    return status in SUCCESS_STATUSES or (status == SANDBOX_STATUS and settings.LIQPAY_SANDBOX)
+
+
+class InvalidPayload(Exception):
+    pass
+
+
+def decode_payload(data):
+    try:
+        payload = json.loads(base64.b64decode(data).decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidPayload('Malformed data')
+    if not isinstance(payload, dict):
+        raise InvalidPayload('Malformed data')
+    return payload
+
+
+def _amount(payload):
+    try:
+        return Decimal(str(payload['amount']))
+    except (KeyError, InvalidOperation):
+        return None
+
+
+def record_callback(payload):
+    """
+    Store and apply a verified callback. Returns (event, created); `created`
+    is False for a replay. Raises Order.DoesNotExist for an unknown order.
+    """
+    try:
+        order_id = int(payload.get('order_id'))
+    except (TypeError, ValueError):
+        raise InvalidPayload('Missing order_id')
+    if not Order.objects.filter(pk=order_id).exists():
+        raise Order.DoesNotExist(order_id)
+
+    status = str(payload.get('status', ''))
+    successful = is_successful(status)
+    with transaction.atomic():
+        event, created = PaymentEvent.objects.get_or_create(
+            order_id=order_id,
+            payment_id=str(payload.get('payment_id') or payload.get('transaction_id') or ''),
+            status=status,
+            defaults={
+                'amount': _amount(payload),
+                'payload': payload,
+                # Only successful payments have follow-up work
+                'processed_at': None if successful else timezone.now(),
+            },
+        )
+        if created and successful:
+            Order.objects.filter(pk=order_id, paid=False).update(paid=True, updated_at=timezone.now())
+            worker.submit_on_commit(process_event, event.pk)
+    return event, created
+
+
+def process_event(event_id):
+    """Follow-up work for a successful payment; safe to run more than once."""
+    event = PaymentEvent.objects.select_related('order').get(pk=event_id)
+    if event.processed_at is not None:
+        return
+    order = event.order
+    if order.email:
+        send_mail(
+            f'Petopia: замовлення #{order.id} оплачено',
+            f'Дякуємо! Оплату замовлення #{order.id} на суму {order.total_amount} грн отримано.',
+            None,
+            [order.email],
+        )
+    # Stock was already reserved at checkout (api.checkout), so nothing else to finalize
+    PaymentEvent.objects.filter(pk=event.pk, processed_at__isnull=True).update(processed_at=timezone.now())
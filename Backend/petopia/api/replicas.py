@@ -0,0 +1,210 @@
+"""
+Read replicas.
+
+Read-only views opt in with ReplicaReadsMixin (viewsets) or @replica_reads
+(function views); while such a view handles a GET, ReplicaRouter sends its
+reads to one of REPLICA_DATABASES. Everything else, and any read inside a
+transaction, stays on the primary.
+
+Read-your-writes: once a request writes, the rest of it reads from the
+primary, and the client is pinned there for REPLICA_PIN_SECONDS by a cookie
+and, for signed-in users, an entry in the shared catalog cache, so the order page right after
+checkout or the product right after rating it never shows stale data. A
+replica that is down or more than REPLICA_MAX_LAG seconds behind is skipped
+until it is checked again, REPLICA_CHECK_INTERVAL seconds later.
+
+The per-request state lives in a context variable set by ReplicaMiddleware.
+"""
+import functools
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+
+from .cache import get_cache
+
+logger = logging.getLogger(__name__)
+
+PIN_COOKIE = 'read_primary'
+
+# Seconds of replay the replica is behind; 0 when it has applied everything it received
+LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+class RequestState:
+    def __init__(self):
+        self.reads = False    # the view reads from a replica
+        self.wrote = False    # the request has written to the primary
+        self.alias = None     # replica chosen for this request
+
+
+_state = ContextVar('replica_state', default=None)
+
+
+@contextmanager
+def request_scope():
+    """Routing state for one request (ReplicaMiddleware); outside of it all queries use the primary."""
+    state = RequestState()
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+def replica_lag(connection):
+    if connection.vendor != 'postgresql':
+        connection.ensure_connection()
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(LAG_SQL)
+        return float(cursor.fetchone()[0])
+
+
+class ReplicaHealth:
+    """Which replicas may be read from; each one is checked at most every REPLICA_CHECK_INTERVAL."""
+
+    def __init__(self):
+        self._status = {}
+
+    def _check(self, alias):
+        try:
+            lag = replica_lag(connections[alias])
+        except DatabaseError:
+            logger.warning('Replica %s is unavailable, reading from the primary', alias, exc_info=True)
+            return False
+        if lag > settings.REPLICA_MAX_LAG:
+            logger.warning('Replica %s is %.1fs behind, reading from the primary', alias, lag)
+            return False
+        return True
+
+    def available(self, alias):
+        now = time.monotonic()
+        checked = self._status.get(alias)
+        if checked is None or now - checked[0] >= settings.REPLICA_CHECK_INTERVAL:
+            checked = self._status[alias] = (now, self._check(alias))
+        return checked[1]
+
+    def mark_down(self, alias):
+        self._status[alias] = (time.monotonic(), False)
+
+    def reset(self):
+        self._status.clear()
+
+    def choose(self):
+        """A healthy replica, or None to read from the primary."""
+        candidates = [alias for alias in settings.REPLICA_DATABASES if self.available(alias)]
+        if not candidates:
+            return None
+        alias = random.choice(candidates)
+        try:
+            # Reconnects if the connection kept from an earlier request has died
+            connections[alias].ensure_connection()
+        except DatabaseError:
+            logger.warning('Replica %s is unavailable, reading from the primary', alias, exc_info=True)
+            self.mark_down(alias)
+            return None
+        return alias
+
+
+health = ReplicaHealth()
+
+
+def _pin_key(user):
+    return f'replica-pin:{user.pk}'
+
+
+def is_pinned(request):
+    """Whether the client wrote recently and must read from the primary."""
+    if PIN_COOKIE in request.COOKIES:
+        return True
+    user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_authenticated and get_cache().get(_pin_key(user)))
+
+
+def pin(request, response):
+    response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax')
+    # DRF puts the token-authenticated user on the Django request too
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        get_cache().set(_pin_key(user), True, settings.REPLICA_PIN_SECONDS)
+
+
+def read_from_replica(request):
+    """Let the rest of this read-only request read from a replica."""
+    state = _state.get()
+    if state is None or not settings.REPLICA_DATABASES or request.method not in SAFE_METHODS:
+        return
+    if not is_pinned(request):
+        state.reads = True
+
+
+@contextmanager
+def primary_reads():
+    """Read from the primary inside the block, e.g. to retry a lookup that may have hit replica lag."""
+    state = _state.get()
+    reads = state.reads if state is not None else False
+    if state is not None:
+        state.reads = False
+    try:
+        yield
+    finally:
+        if state is not None:
+            state.reads = reads
+
+
+def replica_reads(view):
+    """Decorator for read-only function views (below @api_view)."""
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        read_from_replica(request)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaReadsMixin:
+    """GET requests to the viewset read from a replica; its writes use the primary."""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        read_from_replica(request)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.reads:
+            return None
+        if state.wrote or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if state.alias is None:
+            state.alias = health.choose() or DEFAULT_DB_ALIAS
+        return state.alias
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        # Also for objects loaded from a replica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *settings.REPLICA_DATABASES}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db in settings.REPLICA_DATABASES:
+            return False
+        return None
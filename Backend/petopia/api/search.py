@@ -0,0 +1,211 @@
+"""
+Product search.
+
+On PostgreSQL products are matched against `Product.search_vector` (a weighted
+tsvector backed by a GIN index) with prefix matching for as-you-type queries,
+plus pg_trgm similarity on the name for typo tolerance. Results are ranked by
+ts_rank + trigram similarity.
+
+Other databases (SQLite in local test runs) have no full-text search, so the
+same behaviour is approximated by ProductSearchIndex, an in-process inverted
+index kept in sync by the Product signals.
+"""
+import re
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.db import connections
+from django.db.models import Case, F, FloatField, Q, Value, When
+
+from .models import Product
+
+TOKEN_RE = re.compile(r'\w+')
+
+NAME_WEIGHT = 1.0
+DESCRIPTION_WEIGHT = 0.4
+PREFIX_MATCH = 0.8
+TRIGRAM_THRESHOLD = 0.3  # same default as pg_trgm.similarity_threshold
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+def get_search_config():
+    return getattr(settings, 'PRODUCT_SEARCH_CONFIG', 'simple')
+
+
+def is_postgres(using='default'):
+    return connections[using].vendor == 'postgresql'
+
+
+def product_search_vector():
+    config = get_search_config()
+    return (
+        SearchVector('name', weight='A', config=config)
+        + SearchVector('description', weight='B', config=config)
+    )
+
+
+def update_search_vectors(queryset=None):
+    """Recompute search_vector in a single UPDATE (PostgreSQL only)."""
+    if queryset is None:
+        queryset = Product.objects.all()
+    if not is_postgres(queryset.db):
+        return 0
+    return queryset.update(search_vector=product_search_vector())
+
+
+def search_products(queryset, text):
+    """
+    Filter `queryset` down to products matching `text` and annotate each one
+    with `search_rank` (higher is better).
+    """
+    terms = tokenize(text)
+    if not terms:
+        return _no_results(queryset)
+    if is_postgres(queryset.db):
+        return _postgres_search(queryset, terms, text)
+    return _fallback_search(queryset, terms)
+
+
+def _no_results(queryset):
+    return queryset.annotate(search_rank=Value(0.0, output_field=FloatField())).none()
+
+
+def _postgres_search(queryset, terms, text):
+    # Terms are \w+ only, so they are safe to splice into a raw tsquery.
+    # `:*` turns every term into a prefix match ("корм" finds "кормом").
+    query = SearchQuery(
+        ' & '.join(f'{term}:*' for term in terms),
+        search_type='raw',
+        config=get_search_config(),
+    )
+    return queryset.annotate(
+        search_rank=SearchRank(F('search_vector'), query) + TrigramSimilarity('name', text),
+    ).filter(Q(search_vector=query) | Q(name__trigram_similar=text))
+
+
+def _fallback_search(queryset, terms):
+    scores = product_index.search(terms)
+    if not scores:
+        return _no_results(queryset)
+    return queryset.filter(id__in=scores.keys()).annotate(
+        search_rank=Case(
+            *[When(id=product_id, then=Value(score)) for product_id, score in scores.items()],
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+    )
+
+
+def trigrams(word):
+    # Padded the same way as pg_trgm: two spaces in front, one behind
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(a, b):
+    ta, tb = trigrams(a), trigrams(b)
+    return len(ta & tb) / len(ta | tb)
+
+
+class ProductSearchIndex:
+    """In-process inverted index over product name/description tokens."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._documents = {}                 # product id -> {token: weight}
+        self._postings = defaultdict(dict)   # token -> {product id: weight}
+        self._trigrams = defaultdict(set)    # trigram -> tokens
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            for product_id, name, description in Product.objects.values_list('id', 'name', 'description'):
+                self._add(product_id, name, description)
+            self._loaded = True
+
+    def _add(self, product_id, name, description):
+        self._remove(product_id)
+        document = {}
+        for token in tokenize(description):
+            document[token] = DESCRIPTION_WEIGHT
+        for token in tokenize(name):
+            document[token] = NAME_WEIGHT
+        for token, weight in document.items():
+            if token not in self._postings:
+                for trigram in trigrams(token):
+                    self._trigrams[trigram].add(token)
+            self._postings[token][product_id] = weight
+        self._documents[product_id] = document
+
+    def _remove(self, product_id):
+        for token in self._documents.pop(product_id, ()):
+            postings = self._postings[token]
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[token]
+                for trigram in trigrams(token):
+                    self._trigrams[trigram].discard(token)
+
+    def add(self, product):
+        with self._lock:
+            if self._loaded:
+                self._add(product.pk, product.name, product.description)
+
+    def remove(self, product_id):
+        with self._lock:
+            self._remove(product_id)
+
+    def clear(self):
+        with self._lock:
+            self._documents.clear()
+            self._postings.clear()
+            self._trigrams.clear()
+            self._loaded = False
+
+    def _matching_tokens(self, term):
+        """Yield (token, quality) for exact, prefix and trigram-similar tokens."""
+        candidates = set()
+        for trigram in trigrams(term):
+            candidates |= self._trigrams.get(trigram, set())
+        for token in self._postings:
+            if token.startswith(term):
+                candidates.add(token)
+        for token in candidates:
+            if token == term:
+                yield token, 1.0
+            elif token.startswith(term):
+                yield token, PREFIX_MATCH
+            else:
+                score = similarity(term, token)
+                if score >= TRIGRAM_THRESHOLD:
+                    yield token, score * PREFIX_MATCH
+
+    def search(self, terms):
+        """Return {product id: score} for products matching every term."""
+        self._ensure_loaded()
+        with self._lock:
+            scores = None
+            for term in terms:
+                term_scores = {}
+                for token, quality in self._matching_tokens(term):
+                    for product_id, weight in self._postings[token].items():
+                        term_scores[product_id] = max(term_scores.get(product_id, 0), quality * weight)
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {pid: scores[pid] + s for pid, s in term_scores.items() if pid in scores}
+                if not scores:
+                    return {}
+            return scores
+
+
+product_index = ProductSearchIndex()
@@ -1,11 +1,27 @@
 from rest_framework import serializers
-from django.db import models
+from .cart import ADD, MAX_QUANTITY, OPERATIONS
 from .models import CustomUser, Product, Image, Item_Category, Animal_Category, Cart, ProductRating
+from .thumbnails import srcset
+
+
+class SrcsetField(serializers.Field):
+    """Read-only srcset of the object's downscaled image variants (api.thumbnails)."""
+
+    def __init__(self, image_field='image', **kwargs):
+        self.image_field = image_field
+        kwargs.update(source='*', read_only=True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        return srcset(instance, self.image_field, self.context.get('request'))
+
 
 class CustomUserSerializer(serializers.ModelSerializer):
+    avatar_srcset = SrcsetField('avatar')
+
     class Meta:
         model = CustomUser
-        fields = '__all__'
+        exclude = ['avatar_variants']
         
     def update(self, instance, validated_data):
         for key, value in validated_data.items():
@@ -15,14 +31,18 @@ class CustomUserSerializer(serializers.ModelSerializer):
     
     
 class ImageSerializer(serializers.ModelSerializer):
+    srcset = SrcsetField()
+
     class Meta:
         model = Image
-        fields = '__all__'
+        exclude = ['image_variants']
 
 class AnimalSerializer(serializers.ModelSerializer):
+    srcset = SrcsetField()
+
     class Meta:
         model = Animal_Category
-        fields = '__all__'
+        exclude = ['image_variants']
 
 class ProductRatingSerializer(serializers.ModelSerializer):
     class Meta:
@@ -30,9 +50,11 @@ class ProductRatingSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 class ItemCategorySerializer(serializers.ModelSerializer):
+    srcset = SrcsetField()
+
     class Meta:
         model = Item_Category
-        fields = '__all__'
+        exclude = ['image_variants']
 
 class ProductSerializer(serializers.ModelSerializer):
     average_rating = serializers.SerializerMethodField()
@@ -43,32 +65,82 @@ class ProductSerializer(serializers.ModelSerializer):
     Item_Category = ItemCategorySerializer(many=True)
     class Meta:
         model = Product
-        fields = '__all__'
+        exclude = ['search_vector', 'rating_sum', 'rating_count', 'rating_avg']
 
     def get_user_count(self, obj):
-        return obj.ratings.count()
+        return obj.rating_count
 
     def get_average_rating(self, obj):
-        # Aggregate ratings and calculate the average
-        average = obj.ratings.aggregate(models.Avg('rating'))['rating__avg']
-        return round(average, 1) if average is not None else "no review"
+        return round(obj.rating_avg, 1) if obj.rating_count else "no review"
 
 class ItemSerialiazer(serializers.ModelSerializer):
+    srcset = SrcsetField()
+
     class Meta:
         model = Item_Category
-        fields = '__all__'
+        exclude = ['image_variants']
+
+class CartProductSerializer(serializers.ModelSerializer):
+    image = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'price', 'discount', 'stock', 'image']
+
+    def get_image(self, obj):
+        image = first_image(obj)
+        return image.image.url if image else None
 
-class CartSerializer(serializers.ModelSerializer):
-    user = serializers.PrimaryKeyRelatedField(queryset=CustomUser.objects.all())
-    product = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all())
+class CartItemSerializer(serializers.ModelSerializer):
+    # Read from Cart.objects.with_totals() annotations
+    product = CartProductSerializer(read_only=True)
+    unit_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    line_total = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
 
     class Meta:
         model = Cart
-        fields = '__all__'
+        fields = ['id', 'product', 'quantity', 'unit_price', 'line_total', 'date_added']
+
+class CartSummarySerializer(serializers.Serializer):
+    items = CartItemSerializer(many=True)
+    total_quantity = serializers.IntegerField()
+    total = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+class CartOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=OPERATIONS, default='add')
+    product_id = serializers.IntegerField(min_value=1)
+    # 0 only with `set`, where it removes the line
+    quantity = serializers.IntegerField(min_value=0, max_value=MAX_QUANTITY, default=1)
+
+    def validate(self, attrs):
+        if attrs['op'] == ADD and attrs['quantity'] < 1:
+            raise serializers.ValidationError({'quantity': 'Ensure this value is greater than or equal to 1.'})
+        return attrs
+
+class CartBatchSerializer(serializers.Serializer):
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=100)
+
+class GuestCartItemSerializer(serializers.Serializer):
+    # Accepts the browser cart as stored by the frontend ({id, quantity, ...})
+    product_id = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1, max_value=MAX_QUANTITY, default=1)
+
+    def to_internal_value(self, data):
+        if isinstance(data, dict) and 'product_id' not in data and 'id' in data:
+            data = dict(data, product_id=data['id'])
+        return super().to_internal_value(data)
 
 
+import re
+
 from rest_framework import serializers
-from .models import Order, OrderItem, Product
+from .models import Order, OrderItem
+
+def first_image(product):
+    # Reads the prefetched image_set (Order.objects.with_items()); .first() would query again
+    images = product.images if product is not None else []
+    return images[0] if images else None
+
 
 class OrderItemSerializer(serializers.ModelSerializer):
     image = serializers.SerializerMethodField()
@@ -78,56 +150,31 @@ class OrderItemSerializer(serializers.ModelSerializer):
         fields = ['id', 'product_id', 'product_name', 'quantity', 'price', 'image']
     
     def get_image(self, obj):
-        try:
-            product = Product.objects.get(id=obj.product_id)
-            image = product.images.first()
-            if image:
-                request = self.context.get('request')
-                if request is not None:
-                    # This creates absolute URLs including domain
-                    return request.build_absolute_uri(image.image.url)
-                return image.image.url
-            return None
-        except Product.DoesNotExist:
-            return None
-            
-    def get_product_details(self, obj):
-        try:
-            product = Product.objects.get(id=obj.product_id)
-            return {
-                'id': product.id,
-                'name': product.name,
-                'images': [{'image': image.image.url} for image in product.images.all()[:1]]
-            }
-        except Product.DoesNotExist:
-            return None
+        image = first_image(obj.product)
+        if image:
+            request = self.context.get('request')
+            if request is not None:
+                # This creates absolute URLs including domain
+                return request.build_absolute_uri(image.image.url)
+            return image.image.url
+        return None
+
 class OrderSerializer(serializers.ModelSerializer):
-    items = serializers.SerializerMethodField()
+    items = OrderItemSerializer(many=True, read_only=True)
     
     class Meta:
         model = Order
         fields = ['id', 'status', 'created_at', 'total_amount', 'payment_method',
                   'first_name', 'last_name', 'email', 'phone',
                   'shipping_city', 'shipping_address', 'items']
-    
-    def get_items(self, obj):
-        order_items = OrderItem.objects.filter(order=obj)
-        return OrderItemSerializer(order_items, many=True).data
 
-class OrderDetailSerializer(serializers.ModelSerializer):
-    items = serializers.SerializerMethodField()
-    
+class OrderSummarySerializer(serializers.ModelSerializer):
+    # Annotated by the view (Count('items')), so no items are loaded
+    item_count = serializers.IntegerField(read_only=True)
+
     class Meta:
         model = Order
-        fields = [
-            'id', 'status', 'created_at', 'total_amount', 'payment_method',
-            'first_name', 'last_name', 'email', 'phone',
-            'shipping_city', 'shipping_address', 'items'
-        ]
-    
-    def get_items(self, obj):
-        order_items = OrderItem.objects.filter(order=obj)
-        return OrderItemWithProductSerializer(order_items, many=True).data
+        fields = ['id', 'status', 'total_amount', 'created_at', 'item_count']
 
 class OrderItemWithProductSerializer(serializers.ModelSerializer):
     product = serializers.SerializerMethodField()
@@ -137,12 +184,68 @@ class OrderItemWithProductSerializer(serializers.ModelSerializer):
         fields = ['id', 'product_id', 'product_name', 'quantity', 'price', 'product']
     
     def get_product(self, obj):
-        try:
-            product = Product.objects.get(id=obj.product_id)
-            return {
-                'id': product.id,
-                'name': product.name,
-                'images': [{'image': image.image.url} for image in product.images.all()[:1]]
-            }
-        except Product.DoesNotExist:
-            return None
\ No newline at end of file
+        product = obj.product
+        if product is None:
+            return None
+        image = first_image(product)
+        return {
+            'id': product.id,
+            'name': product.name,
+            'images': [{'image': image.image.url}] if image else [],
+        }
+
+class OrderDetailSerializer(serializers.ModelSerializer):
+    items = OrderItemWithProductSerializer(many=True, read_only=True)
+    
+    class Meta:
+        model = Order
+        fields = [
+            'id', 'status', 'created_at', 'total_amount', 'payment_method',
+            'first_name', 'last_name', 'email', 'phone',
+            'shipping_city', 'shipping_address', 'items'
+        ]
+
+
+# Legacy multipart checkout: items[0][product_id]=1&items[0][quantity]=2&...
+LEGACY_ITEM_KEY = re.compile(r'^items\[(\d+)\]\[(\w+)\]$')
+CHECKOUT_MAX_ITEMS = 100
+
+
+def legacy_checkout_items(data):
+    """Collect `items[i][field]` form keys into a list of dicts, in index order."""
+    items = {}
+    for key in data.keys():
+        match = LEGACY_ITEM_KEY.match(key)
+        if match:
+            items.setdefault(int(match.group(1)), {})[match.group(2)] = data.get(key)
+    return [items[index] for index in sorted(items)]
+
+
+class CheckoutItemSerializer(serializers.Serializer):
+    # Any client-side price is ignored; api.checkout prices lines from the database
+    product_id = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1, max_value=1000, default=1)
+
+
+class CheckoutSerializer(serializers.Serializer):
+    """
+    Checkout payload: customer/shipping fields plus an `items` array. Only
+    shape is validated here, so a bad payload is rejected without touching the
+    database; product existence and stock are checked by api.checkout.
+    """
+    first_name = serializers.CharField(max_length=100, allow_blank=True, default='')
+    last_name = serializers.CharField(max_length=100, allow_blank=True, default='')
+    email = serializers.EmailField(allow_blank=True, default='')
+    phone = serializers.CharField(max_length=20, allow_blank=True, default='')
+    shipping_city = serializers.CharField(max_length=100, allow_blank=True, default='')
+    shipping_address = serializers.CharField(allow_blank=True, default='')
+    payment_method = serializers.ChoiceField(choices=Order.PAYMENT_CHOICES, default='cash')
+    items = CheckoutItemSerializer(many=True, allow_empty=False, max_length=CHECKOUT_MAX_ITEMS)
+
+    def to_internal_value(self, data):
+        if 'items' not in data and hasattr(data, 'getlist'):
+            # Form-encoded request from an older client
+            items = legacy_checkout_items(data)
+            data = {key: data.get(key) for key in self.fields if key in data}
+            data['items'] = items
+        return super().to_internal_value(data)
@@ -0,0 +1,109 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+from mptt.signals import node_moved
+
+from .cache import invalidate, invalidate_product
+from .models import Animal_Category, Image, Item_Category, Product, ProductRating
+from .search import product_index, update_search_vectors
+from . import image_jobs
+from .thumbnails import IMAGE_FIELDS
+
+
+@receiver(post_save, sender=Product)
+def update_product_search(sender, instance, using, raw=False, **kwargs):
+    if raw:
+        return
+    update_search_vectors(Product.objects.using(using).filter(pk=instance.pk))
+    product_index.add(instance)
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_from_search(sender, instance, **kwargs):
+    product_index.remove(instance.pk)
+
+
+@receiver(post_save, sender=ProductRating)
+def apply_rating_save(sender, instance, created, using, raw=False, **kwargs):
+    if raw:
+        return
+    products = Product.objects.using(using).filter(pk=instance.product_id)
+    rating = int(instance.rating)
+    previous = getattr(instance, '_stored_rating', None)
+    if created:
+        products.adjust_ratings(rating, 1)
+    elif previous is not None:
+        products.adjust_ratings(rating - int(previous), 0)
+    else:
+        # Saved from an instance we did not load, so the old value is unknown
+        products.rebuild_rating_aggregates()
+    instance._stored_rating = rating
+
+
+@receiver(post_delete, sender=ProductRating)
+def apply_rating_delete(sender, instance, using, **kwargs):
+    rating = getattr(instance, '_stored_rating', None) or instance.rating
+    Product.objects.using(using).filter(pk=instance.product_id).adjust_ratings(-int(rating), -1)
+
+
+def mark_image_upload(sender, instance, raw=False, **kwargs):
+    # A freshly assigned upload is not committed to storage until the save itself
+    file = getattr(instance, IMAGE_FIELDS[sender])
+    instance._image_uploaded = not raw and bool(file) and not file._committed
+
+
+def process_image_upload(sender, instance, raw=False, **kwargs):
+    if getattr(instance, '_image_uploaded', False):
+        instance._image_uploaded = False
+        image_jobs.schedule(instance, IMAGE_FIELDS[sender])
+
+
+for model in IMAGE_FIELDS:
+    pre_save.connect(mark_image_upload, sender=model, dispatch_uid=f'image_upload_{model.__name__}')
+    post_save.connect(process_image_upload, sender=model, dispatch_uid=f'image_upload_{model.__name__}')
+
+
+# Response cache invalidation
+
+CATEGORY_CACHE_GROUPS = {
+    Animal_Category: 'animal_categories',
+    Item_Category: 'item_categories',
+}
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_cache(sender, instance, **kwargs):
+    invalidate_product(instance.pk)
+
+
+@receiver(post_save, sender=Image)
+@receiver(post_delete, sender=Image)
+@receiver(post_save, sender=ProductRating)
+@receiver(post_delete, sender=ProductRating)
+def invalidate_product_related_cache(sender, instance, **kwargs):
+    invalidate_product(instance.product_id)
+
+
+@receiver(m2m_changed, sender=Product.Animal_Category.through)
+@receiver(m2m_changed, sender=Product.Item_Category.through)
+def invalidate_product_categories_cache(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate_product(instance.pk)
+    elif pk_set:
+        for pk in pk_set:
+            invalidate_product(pk)
+    else:
+        # Category cleared from all of its products; pk_set is not provided
+        invalidate('products', *CATEGORY_CACHE_GROUPS.values())
+
+
+@receiver(post_save, sender=Animal_Category)
+@receiver(post_delete, sender=Animal_Category)
+@receiver(node_moved, sender=Animal_Category)
+@receiver(post_save, sender=Item_Category)
+@receiver(post_delete, sender=Item_Category)
+@receiver(node_moved, sender=Item_Category)
+def invalidate_category_cache(sender, **kwargs):
+    invalidate(CATEGORY_CACHE_GROUPS[sender])
@@ -0,0 +1,145 @@
+"""
+Content-addressed storage for uploads.
+
+A file is stored as <upload dir>/<h[:2]>/<h>.<ext>, where h is the first 32
+hex digits of the SHA-256 of its bytes. Identical uploads end up as one file,
+and since a name always means the same bytes, media URLs can be cached
+forever (see api.media). Files are written to a temporary name and renamed
+into place, so concurrent uploads of the same bytes can't clash.
+
+Static files use the hashed names of ManifestStaticFilesStorage, with
+compressed copies of text assets written once by collectstatic.
+"""
+import gzip
+import hashlib
+import os
+import re
+import tempfile
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# products/ab/ab12....jpg, and variants/ab/ab12.../320.webp (api.thumbnails)
+CONTENT_ADDRESSED = re.compile(r'(?:^|/)(?P<prefix>[0-9a-f]{2})/(?P<digest>(?P=prefix)[0-9a-f]{30})(?:\.\w+|/(?P<variant>\w+)\.\w+)$')
+
+
+def _match(name):
+    return CONTENT_ADDRESSED.search(name.replace('\\', '/'))
+
+
+def content_digest(name):
+    """The content hash a stored name embeds (with the variant, if any), or None for legacy names."""
+    match = _match(name)
+    if match is None:
+        return None
+    return f"{match['digest']}-{match['variant']}" if match['variant'] else match['digest']
+
+
+def file_digest(content):
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()[:32]
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def content_name(self, name, content):
+        directory, filename = os.path.split(name.replace('\\', '/'))
+        if content_digest(name):
+            # Re-saving a stored file (e.g. with EXIF removed): keep its upload dir
+            directory = os.path.dirname(directory)
+        extension = os.path.splitext(filename)[1].lower()
+        digest = file_digest(content)
+        return '/'.join(part for part in (directory, digest[:2], digest + extension) if part)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        match = _match(name)
+        if not (match and match['variant']):
+            # Variants are already named after the content of their source
+            name = self.content_name(name, content)
+        if self.exists(name):
+            # Same bytes are already stored
+            return name
+        return super().save(name, content, max_length=max_length)
+
+    def get_available_name(self, name, max_length=None):
+        if content_digest(name):
+            # The name is the content, so an existing file is the same file
+            return name
+        return super().get_available_name(name, max_length=max_length)
+
+    def _save(self, name, content):
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as output:
+                for chunk in content.chunks():
+                    output.write(chunk)
+            os.chmod(temporary, self.file_permissions_mode or 0o644)
+            os.replace(temporary, full_path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        return name
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Hashed static names plus .gz (and, with the brotli package, .br) copies of
+    text assets next to them, so responses don't compress on the fly.
+    """
+    compressible = ('.css', '.js', '.mjs', '.map', '.svg', '.json', '.txt', '.html', '.xml', '.ico')
+    min_compress_size = 256
+
+    def compressors(self):
+        yield '.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0)
+        if brotli is not None:
+            yield '.br', brotli.compress
+
+    def compress(self, name):
+        with self.open(name) as file:
+            data = file.read()
+        if len(data) < self.min_compress_size:
+            return
+        for suffix, compress in self.compressors():
+            compressed = compress(data)
+            if len(compressed) >= len(data):
+                # Already compressed (or too small to gain anything)
+                continue
+            if self.exists(name + suffix):
+                self.delete(name + suffix)
+            self._save(name + suffix, ContentFile(compressed))
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # Missing from the manifest (collectstatic hasn't run): the plain name
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if name.lower().endswith(self.compressible) and self.exists(name):
+                self.compress(name)
@@ -1,3 +1,1608 @@
-from django.test import TestCase
+import asyncio
+import base64
+import datetime
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections
+from django.http import HttpResponse
+from django.test import TestCase, TransactionTestCase, override_settings, tag
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.request import Request
+from google.auth import crypt, jwt as google_jwt
+from PIL import Image as PILImage
+from rest_framework.test import APIClient, APIRequestFactory
+
+from . import cache as response_cache, logs, metrics, replicas
+from .models import CustomUser, Product, ProductRating, Image, ImageJob, Animal_Category, Item_Category, Cart, Order, OrderItem, PaymentEvent
+from . import cart as cart_module
+from .cart import CartError, apply_operations, merge_guest_cart
+from .checkout import OutOfStock, place_order
+from .google_tokens import GoogleTokenVerifier
+from .liqpay import get_client
+from .serializer import CHECKOUT_MAX_ITEMS, legacy_checkout_items
+from .views import ProductViewSet
+from .worker import BackgroundWorker, worker
+
+
+def make_product(name='Корм', price=100, **kwargs):
+    kwargs.setdefault('description', f'{name} description')
+    kwargs.setdefault('stock', 10)
+    return Product.objects.create(name=name, price=price, **kwargs)
+
+
+class CatalogTestCase(TestCase):
+    """Starts every test with an empty response cache and a fresh API client."""
+
+    def setUp(self):
+        response_cache.get_cache().clear()
+        response_cache.stats.reset()
+        self.client = APIClient()
+
+
+class ProductListTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dogs = Animal_Category.objects.create(name='Dogs', image='categories/dogs.jpg')
+        self.food = Item_Category.objects.create(name='Food', image='categories/food.jpg')
+        self.users = [
+            CustomUser.objects.create_user(email=f'user{i}@example.com', username=f'user{i}', password='pass')
+            for i in range(3)
+        ]
+
+    def add_products(self, count):
+        for i in range(count):
+            product = make_product(name=f'Product {Product.objects.count()}', price=10 + i)
+            product.Animal_Category.add(self.dogs)
+            product.Item_Category.add(self.food)
+            Image.objects.create(product=product, image='products/p.jpg')
+            for rating, user in enumerate(self.users, start=3):
+                ProductRating.objects.create(product=product, user=user, rating=rating)
+
+    def test_list_query_count_does_not_grow_with_products(self):
+        self.add_products(2)
+        with self.assertNumQueries(5):
+            response = self.client.get('/api/products/')
+        self.assertEqual(len(response.data['results']), 2)
+
+        self.add_products(8)
+        with self.assertNumQueries(5):
+            response = self.client.get('/api/products/')
+        self.assertEqual(len(response.data['results']), 10)
+
+    def test_list_reads_annotated_ratings(self):
+        self.add_products(1)
+        make_product(name='Unrated')
+        response = self.client.get('/api/products/', {'sort_by': 'price_asc'})
+        rated, unrated = response.data['results']
+        self.assertEqual(rated['average_rating'], 4.0)
+        self.assertEqual(rated['user_count'], 3)
+        self.assertEqual(len(rated['images']), 1)
+        self.assertEqual(rated['Animal_Category'][0]['name'], 'Dogs')
+        self.assertEqual(unrated['average_rating'], 'no review')
+        self.assertEqual(unrated['user_count'], 0)
+
+
+class ProductPaginationTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(7):
+            make_product(name=f'Product {i}', price=[30, 10, 20, 10, 50, 40, 10][i])
+
+    def walk(self, params):
+        names, response = [], self.client.get('/api/products/', params)
+        while True:
+            names += [p['name'] for p in response.data['results']]
+            if not response.data['next']:
+                return names
+            response = self.client.get(response.data['next'])
+
+    def test_page_number_mode(self):
+        response = self.client.get('/api/products/', {'page_size': 3, 'page': 3})
+        self.assertEqual(response.data['count'], 7)
+        self.assertEqual([p['name'] for p in response.data['results']], ['Product 6'])
+
+    def test_cursor_mode_skips_count(self):
+        # products + three prefetches, no COUNT(*)
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/products/', {'pagination': 'cursor', 'page_size': 3})
+        self.assertNotIn('count', response.data)
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_cursor_mode_follows_sort_by(self):
+        expected = list(
+            Product.objects.order_by('-price', '-id').values_list('name', flat=True)
+        )
+        names = self.walk({'pagination': 'cursor', 'sort_by': 'price_desc', 'page_size': 2})
+        self.assertEqual(names, expected)
+
+        expected = list(Product.objects.order_by('price', 'id').values_list('name', flat=True))
+        names = self.walk({'pagination': 'cursor', 'sort_by': 'price_asc', 'page_size': 2})
+        self.assertEqual(names, expected)
+
+    def test_cursor_pages_through_ties_without_offset(self):
+        Product.objects.all().delete()
+        for i in range(60):
+            make_product(name=f'Tie {i}', price=10)
+        make_product(name='Cheap', price=5)
+        params = {'pagination': 'cursor', 'sort_by': 'price_asc', 'page_size': 7}
+        with CaptureQueriesContext(connection) as queries:
+            names = self.walk(params)
+        self.assertEqual(names, ['Cheap'] + [f'Tie {i}' for i in range(60)])
+        self.assertFalse([q['sql'] for q in queries if 'OFFSET' in q['sql'].upper()])
+
+        # Newest first, all created at the same moment: only the id orders them
+        Product.objects.update(created_at=timezone.now())
+        names = self.walk({**params, 'sort_by': 'newest'})
+        self.assertEqual(names, list(Product.objects.order_by('-id').values_list('name', flat=True)))
+
+        # Removing a product already sent does not shift the next page (as it would with OFFSET)
+        first = self.client.get('/api/products/', params).json()
+        Product.objects.filter(name='Tie 0').delete()
+        second = self.client.get(first['next']).json()
+        self.assertEqual([p['name'] for p in second['results']], [f'Tie {i}' for i in range(6, 13)])
+
+    def test_cursor_previous_link(self):
+        params = {'pagination': 'cursor', 'sort_by': 'price_asc', 'page_size': 2}
+        first = self.client.get('/api/products/', params)
+        self.assertIsNone(first.data['previous'])
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(back.data['results'], first.data['results'])
+        self.assertIsNone(back.data['previous'])
+        with self.assertLogs('django.request', 'WARNING'):
+            self.assertEqual(self.client.get('/api/products/', {**params, 'cursor': 'broken'}).status_code, 404)
+
+
+class ProductSearchTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        make_product(name='Сухий корм для собак', description='Повноцінний раціон')
+        make_product(name='Іграшка м\'ячик', description='Гумовий м\'ячик, не корм')
+        make_product(name='Нашийник', description='Шкіряний нашийник для собак')
+
+    def search(self, text, **params):
+        response = self.client.get('/api/products/', {'search': text, **params})
+        return [p['name'] for p in response.data['results']]
+
+    def test_name_matches_rank_above_description_matches(self):
+        self.assertEqual(self.search('корм'), ['Сухий корм для собак', 'Іграшка м\'ячик'])
+
+    def test_all_terms_must_match(self):
+        self.assertEqual(self.search('корм собак'), ['Сухий корм для собак'])
+
+    def test_prefix_and_typo_tolerance(self):
+        self.assertEqual(self.search('наший'), ['Нашийник'])
+        self.assertEqual(self.search('нашейник'), ['Нашийник'])
+
+    def test_index_follows_product_changes(self):
+        product = Product.objects.get(name='Нашийник')
+        product.name = 'Повідець'
+        product.save()
+        self.assertEqual(self.search('повідець'), ['Повідець'])
+        product.delete()
+        self.assertEqual(self.search('повідець'), [])
+
+    def test_explicit_sort_overrides_relevance(self):
+        Product.objects.filter(name='Сухий корм для собак').update(price=500)
+        self.assertEqual(
+            self.search('корм', sort_by='price_desc'),
+            ['Сухий корм для собак', 'Іграшка м\'ячик'],
+        )
+
+
+class ProductRatingAggregateTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = make_product()
+        self.users = [
+            CustomUser.objects.create_user(email=f'rater{i}@example.com', username=f'rater{i}', password='pass')
+            for i in range(2)
+        ]
+
+    def assertAggregates(self, rating_sum, rating_count):
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_sum, self.product.rating_count), (rating_sum, rating_count))
+
+    def rate(self, user, rating):
+        self.client.force_authenticate(user)
+        return self.client.post(f'/api/products/{self.product.pk}/rate/', {'rating': rating})
+
+    def test_rate_updates_aggregates(self):
+        self.assertEqual(self.rate(self.users[0], 5).data, {'average_rating': 5.0})
+        self.assertEqual(self.rate(self.users[1], 2).data, {'average_rating': 3.5})
+        # Re-rating replaces the user's previous vote
+        self.assertEqual(self.rate(self.users[0], 4).data, {'average_rating': 3.0})
+        self.assertAggregates(6, 2)
+
+    def test_delete_updates_aggregates(self):
+        ProductRating.objects.create(product=self.product, user=self.users[0], rating=5)
+        ProductRating.objects.create(product=self.product, user=self.users[1], rating=1)
+        ProductRating.objects.get(user=self.users[1]).delete()
+        self.assertAggregates(5, 1)
+        self.assertEqual(self.product.rating_avg, 5.0)
+        ProductRating.objects.all().delete()
+        self.assertAggregates(0, 0)
+        self.assertEqual(self.product.average_rating, 0)
+
+    def test_rebuild_command(self):
+        ProductRating.objects.create(product=self.product, user=self.users[0], rating=4)
+        Product.objects.update(rating_sum=0, rating_count=0, rating_avg=0)
+        call_command('rebuild_rating_aggregates', stdout=StringIO())
+        self.assertAggregates(4, 1)
+        self.assertEqual(self.product.rating_avg, 4.0)
+
+    def test_sort_by_top_rated(self):
+        other = make_product(name='Other')
+        ProductRating.objects.create(product=self.product, user=self.users[0], rating=3)
+        ProductRating.objects.create(product=other, user=self.users[0], rating=5)
+        response = self.client.get('/api/products/', {'sort_by': 'top_rated'})
+        self.assertEqual([p['name'] for p in response.data['results']], ['Other', self.product.name])
+
+
+class ResponseCacheTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dogs = Animal_Category.objects.create(name='Dogs', image='categories/dogs.jpg')
+        self.cats = Animal_Category.objects.create(name='Cats', image='categories/cats.jpg')
+        self.product = make_product()
+        self.product.Animal_Category.add(self.dogs)
+
+    def get(self, url, params=None):
+        response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def assertCached(self, url, params=None):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get(url, params)['X-Cache'], 'HIT')
+
+    def assertNotCached(self, url, params=None):
+        self.assertEqual(self.get(url, params)['X-Cache'], 'MISS')
+
+    def test_repeated_requests_are_served_from_cache(self):
+        for url in ['/api/products/', '/api/products/max_price/', '/api/animal_categories/',
+                    '/api/item_categories/', f'/api/products/{self.product.pk}/']:
+            self.assertNotCached(url)
+            self.assertCached(url)
+        self.assertEqual(response_cache.stats.snapshot()['products'], {'hits': 1, 'misses': 1})
+
+    def test_equivalent_query_params_share_an_entry(self):
+        self.get('/api/products/', {'animal_category': ['Dogs', 'Cats'], 'search': ' Корм ', 'min_price': ''})
+        self.assertCached('/api/products/', {'animal_category': ['Cats', 'Dogs', 'Cats'], 'search': 'корм'})
+        self.assertNotCached('/api/products/', {'animal_category': ['Cats']})
+
+    def test_product_changes_invalidate_lists_and_detail(self):
+        other = make_product(name='Other')
+        detail, other_detail = f'/api/products/{self.product.pk}/', f'/api/products/{other.pk}/'
+        user = CustomUser.objects.create_user(email='u@example.com', username='u', password='pass')
+        changes = [
+            lambda: Product.objects.get(pk=self.product.pk).save(),
+            lambda: Image.objects.create(product=self.product, image='products/p.jpg'),
+            lambda: ProductRating.objects.create(product=self.product, user=user, rating=5),
+            lambda: self.product.Animal_Category.add(self.cats),
+            lambda: self.cats.product_set.remove(self.product),
+        ]
+        for change in changes:
+            for url in ['/api/products/', detail, other_detail, '/api/products/max_price/']:
+                self.get(url)
+            change()
+            self.assertNotCached('/api/products/')
+            self.assertNotCached(detail)
+            self.assertNotCached('/api/products/max_price/')
+            self.assertCached(other_detail)
+
+    def test_category_changes_invalidate_categories_and_products(self):
+        self.get('/api/animal_categories/')
+        self.get('/api/item_categories/')
+        self.get('/api/products/')
+        self.dogs.name = 'Собаки'
+        self.dogs.save()
+        self.assertNotCached('/api/animal_categories/')
+        self.assertCached('/api/item_categories/')
+        response = self.get('/api/products/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][0]['Animal_Category'][0]['name'], 'Собаки')
+
+    def test_stats_endpoint_requires_admin(self):
+        self.get('/api/products/')
+        self.assertEqual(self.client.get('/api/cache-stats/').status_code, 401)
+        admin = CustomUser.objects.create_superuser(email='a@example.com', username='admin', password='pass')
+        self.client.force_authenticate(admin)
+        self.assertEqual(self.get('/api/cache-stats/').data['products'], {'hits': 0, 'misses': 1})
+
+    def test_per_process_cache_with_several_workers_is_reported(self):
+        with mock.patch.dict(os.environ, {'WEB_CONCURRENCY': '4'}):
+            self.assertEqual([warning.id for warning in response_cache.check_shared_cache(None)], ['api.W001'])
+            with override_settings(REPLICA_DATABASES=['replica1']):
+                self.assertEqual([warning.id for warning in response_cache.check_shared_cache(None)], ['api.W001', 'api.W002'])
+            with override_settings(CACHES={
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                'catalog': {'BACKEND': 'django.core.cache.backends.redis.RedisCache'},
+            }):
+                self.assertEqual(response_cache.check_shared_cache(None), [])
+
+
+class CategoryFilterTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dogs = Animal_Category.objects.create(name='Dogs', image='categories/dogs.jpg')
+        self.puppies = Animal_Category.objects.create(name='Puppies', parent=self.dogs, image='categories/p.jpg')
+        self.cats = Animal_Category.objects.create(name='Cats', image='categories/cats.jpg')
+        self.food = Item_Category.objects.create(name='Food', image='categories/food.jpg')
+        for name, animals in [('Dog bowl', [self.dogs]), ('Puppy food', [self.puppies]),
+                              ('Cat food', [self.cats]), ('Pet food', [self.puppies, self.cats])]:
+            product = make_product(name=name)
+            product.Animal_Category.set(animals)
+            if 'food' in name:
+                product.Item_Category.add(self.food)
+
+    def names(self, **params):
+        response = self.client.get('/api/products/', params)
+        return sorted(p['name'] for p in response.data['results'])
+
+    def test_parent_includes_descendants(self):
+        self.assertEqual(self.names(animal_category_id=self.dogs.pk), ['Dog bowl', 'Pet food', 'Puppy food'])
+        self.assertEqual(self.names(animal_category='Dogs'), ['Dog bowl', 'Pet food', 'Puppy food'])
+        self.assertEqual(self.names(animal_category='Puppies'), ['Pet food', 'Puppy food'])
+
+    def test_multiple_categories_and_comma_lists(self):
+        # A product in two selected categories is returned once
+        self.assertEqual(self.names(animal_category='Puppies,Cats'), ['Cat food', 'Pet food', 'Puppy food'])
+        self.assertEqual(
+            self.names(animal_category_id=[self.dogs.pk, self.puppies.pk], item_category='Food'),
+            ['Pet food', 'Puppy food'],
+        )
+
+    def test_unknown_category_matches_nothing(self):
+        self.assertEqual(self.names(animal_category='Birds'), [])
+        self.assertEqual(self.names(animal_category_id='999'), [])
+
+    def test_tree_map_is_rebuilt_when_tree_changes(self):
+        self.assertEqual(self.names(animal_category='Cats'), ['Cat food', 'Pet food'])
+        self.cats.refresh_from_db()
+        self.puppies.refresh_from_db()
+        self.puppies.move_to(self.cats)
+        self.assertEqual(self.names(animal_category='Cats'), ['Cat food', 'Pet food', 'Puppy food'])
+        self.assertEqual(self.names(animal_category='Dogs'), ['Dog bowl'])
+
+
+class FacetTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dogs = Animal_Category.objects.create(name='Dogs', image='categories/dogs.jpg')
+        self.puppies = Animal_Category.objects.create(name='Puppies', parent=self.dogs, image='categories/p.jpg')
+        self.cats = Animal_Category.objects.create(name='Cats', image='categories/cats.jpg')
+        self.food = Item_Category.objects.create(name='Food', image='categories/food.jpg')
+        self.toys = Item_Category.objects.create(name='Toys', image='categories/toys.jpg')
+        for name, price, animals, items in [
+            ('Dog bowl', 100, [self.dogs], [self.toys]),
+            ('Puppy food', 20, [self.dogs, self.puppies], [self.food]),
+            ('Cat food', 40, [self.cats], [self.food]),
+            ('Pet food', 60, [self.puppies, self.cats], [self.food]),
+        ]:
+            product = make_product(name=name, price=price)
+            product.Animal_Category.set(animals)
+            product.Item_Category.set(items)
+
+    def facets(self, **params):
+        response = self.client.get('/api/products/facets/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def counts(self, nodes):
+        return {node['name']: node['count'] for node in nodes}
+
+    def test_category_counts_roll_up_once_per_product(self):
+        data = self.facets()
+        self.assertEqual(self.counts(data['animal_categories']), {'Cats': 2, 'Dogs': 3, 'Puppies': 2})
+        self.assertEqual(self.counts(data['item_categories']), {'Food': 3, 'Toys': 1})
+        puppies = next(node for node in data['animal_categories'] if node['name'] == 'Puppies')
+        self.assertEqual(puppies['parent'], self.dogs.pk)
+
+    def test_price_histogram(self):
+        price = self.facets(buckets=4)['price']
+        self.assertEqual((price['min'], price['max']), (20, 100))
+        self.assertEqual([bucket['count'] for bucket in price['buckets']], [1, 1, 1, 1])
+        self.assertEqual([bucket['min'] for bucket in price['buckets']], [20, 40, 60, 80])
+
+    def test_facets_ignore_their_own_filter(self):
+        data = self.facets(animal_category='Cats', max_price=50)
+        # Animal counts keep the price filter but not the animal filter
+        self.assertEqual(self.counts(data['animal_categories']), {'Cats': 1, 'Dogs': 1, 'Puppies': 1})
+        # Item counts use both filters
+        self.assertEqual(self.counts(data['item_categories']), {'Food': 1, 'Toys': 0})
+        # Price facet keeps the animal filter but not the price filter
+        self.assertEqual((data['price']['min'], data['price']['max']), (40, 60))
+
+    def test_fixed_number_of_queries(self):
+        self.facets()
+        response_cache.get_cache().clear()
+        for i in range(5):
+            make_product(name=f'Extra {i}', price=10 * i).Animal_Category.add(self.cats)
+        # Search index load, animal tree (for the item facet), two category
+        # counts, price bounds and histogram -- independent of catalog size
+        with self.assertNumQueries(6):
+            self.facets(search='food', animal_category='Cats')
+        with self.assertNumQueries(0):
+            self.facets(search='food', animal_category='Cats')
+
+
+class OrderReadTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='buyer@example.com', username='buyer', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_orders(self, count, items=5):
+        for _ in range(count):
+            order = Order.objects.create(
+                user=self.user, total_amount=100, payment_method='cash', first_name='Ivan', last_name='Petrenko',
+                email='buyer@example.com', phone='+380000000000', shipping_city='Kyiv', shipping_address='Main St 1',
+            )
+            for i in range(items):
+                product = make_product(name=f'Product {i}')
+                Image.objects.create(product=product, image=f'products/{product.pk}-a.jpg')
+                Image.objects.create(product=product, image=f'products/{product.pk}-b.jpg')
+                OrderItem.objects.create(order=order, product=product, product_name=product.name, quantity=1, price=10)
+        return order
+
+    def test_order_history_query_count_is_constant(self):
+        self.add_orders(2)
+        # Count, orders, items, products, images
+        with self.assertNumQueries(5):
+            response = self.client.get('/api/get-orders/')
+        self.assertEqual(len(response.data['results']), 2)
+
+        self.add_orders(8)
+        with self.assertNumQueries(5):
+            response = self.client.get('/api/get-orders/')
+        self.assertEqual(len(response.data['results']), 10)
+        item = response.data['results'][0]['items'][0]
+        self.assertEqual(item['product_name'], 'Product 0')
+        self.assertTrue(item['image'].endswith('-a.jpg'))
+
+    def test_order_history_is_paginated(self):
+        self.add_orders(12, items=1)
+        first = self.client.get('/api/get-orders/')
+        self.assertEqual(first.data['count'], 12)
+        self.assertEqual(len(first.data['results']), 10)
+        second = self.client.get(first.data['next'])
+        self.assertEqual(len(second.data['results']), 2)
+        ids = [order['id'] for order in first.data['results'] + second.data['results']]
+        self.assertEqual(len(set(ids)), 12)
+
+    def test_summary_mode_counts_items_without_loading_them(self):
+        self.add_orders(3, items=4)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/get-orders/', {'fields': 'summary', 'page_size': 2})
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(
+            response.data['results'][0].keys(),
+            {'id', 'status', 'total_amount', 'created_at', 'item_count'},
+        )
+        self.assertEqual([order['item_count'] for order in response.data['results']], [4, 4])
+
+    def test_order_detail_query_count_is_constant(self):
+        order = self.add_orders(1, items=6)
+        order.items.first().product.delete()
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/api/orders/{order.pk}/')
+        items = response.data['items']
+        self.assertEqual(len(items), 6)
+        self.assertIsNone(items[0]['product'])
+        self.assertEqual(items[1]['product']['name'], 'Product 1')
+        self.assertEqual(len(items[1]['product']['images']), 1)
+
+
+class CheckoutTests(CatalogTestCase):
+    CUSTOMER = {
+        'first_name': 'Ivan', 'last_name': 'Petrenko', 'email': 'buyer@example.com', 'phone': '+380000000000',
+        'shipping_city': 'Kyiv', 'shipping_address': 'Main St 1', 'payment_method': 'cash',
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.products = [make_product(name=f'Product {i}', price=10 * (i + 1), stock=5) for i in range(10)]
+
+    def checkout(self, lines, **extra):
+        data = dict(self.CUSTOMER, **extra)
+        for index, (product_id, quantity) in enumerate(lines):
+            data[f'items[{index}][product_id]'] = product_id
+            data[f'items[{index}][quantity]'] = quantity
+            data[f'items[{index}][price]'] = 1  # ignored: prices come from the database
+        return self.client.post('/api/orders/', data)
+
+    def stock(self):
+        return list(Product.objects.order_by('id').values_list('stock', flat=True))
+
+    def test_total_and_prices_come_from_products(self):
+        response = self.checkout([(self.products[0].pk, 2), (self.products[2].pk, 1), (self.products[0].pk, 1)],
+                                 total_amount='0.01')
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get(pk=response.data['id'])
+        self.assertEqual(order.total_amount, 60)
+        self.assertEqual(
+            list(order.items.order_by('id').values_list('product_name', 'quantity', 'price')),
+            [('Product 0', 3, 10), ('Product 2', 1, 30)],
+        )
+        self.assertEqual(self.stock()[:3], [2, 5, 4])
+
+    def test_query_count_does_not_grow_with_lines(self):
+        # Savepoint, locked SELECT, stock UPDATE, order INSERT, items INSERT, release
+        with self.assertNumQueries(6):
+            self.checkout([(product.pk, 1) for product in self.products[:2]])
+        with self.assertNumQueries(6):
+            self.checkout([(product.pk, 1) for product in self.products])
+
+    def test_out_of_stock_rolls_back_everything(self):
+        response = self.checkout([(self.products[0].pk, 1), (self.products[1].pk, 6)])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['product_ids'], [self.products[1].pk])
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(set(self.stock()), {5})
+
+    def test_unknown_product_and_bad_quantity(self):
+        self.assertEqual(self.checkout([(999, 1)]).status_code, 400)
+        self.assertEqual(self.checkout([(self.products[0].pk, 0)]).status_code, 400)
+        self.assertEqual(self.checkout([]).status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_json_payload(self):
+        response = self.client.post('/api/orders/', dict(self.CUSTOMER, items=[
+            {'product_id': self.products[1].pk, 'quantity': 2, 'price': 1},
+            {'product_id': self.products[3].pk},
+        ]), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['total_amount'], 80)
+
+    def test_invalid_payload_reports_each_item_without_queries(self):
+        with self.assertNumQueries(0):
+            response = self.client.post('/api/orders/', dict(self.CUSTOMER, payment_method='barter', items=[
+                {'product_id': self.products[0].pk, 'quantity': 1},
+                {'product_id': 'abc', 'quantity': 0},
+            ]), format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('payment_method', response.data)
+        # Errors are keyed by item index; valid items are left out
+        self.assertEqual(set(response.data['items']), {1})
+        self.assertEqual(set(response.data['items'][1]), {'product_id', 'quantity'})
+
+    def test_item_count_limit(self):
+        items = [{'product_id': self.products[0].pk, 'quantity': 1}] * (CHECKOUT_MAX_ITEMS + 1)
+        response = self.client.post('/api/orders/', dict(self.CUSTOMER, items=items), format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('items', response.data)
+
+    def test_legacy_form_items_keep_index_order(self):
+        self.assertEqual(
+            legacy_checkout_items({
+                'items[10][product_id]': '3', 'items[2][product_id]': '1', 'items[2][quantity]': '4', 'email': 'x',
+            }),
+            [{'product_id': '1', 'quantity': '4'}, {'product_id': '3'}],
+        )
+
+    def test_checkout_invalidates_cached_stock(self):
+        product = self.products[0]
+        self.client.get(f'/api/products/{product.pk}/')
+        self.checkout([(product.pk, 2)])
+        response = self.client.get(f'/api/products/{product.pk}/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['stock'], 3)
+
+
+class CartTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='buyer@example.com', username='buyer', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.bowl = make_product(name='Bowl', price='100.00', discount=15)
+        self.food = make_product(name='Food', price='19.99')
+        Image.objects.create(product=self.bowl, image='products/bowl.jpg')
+
+    def batch(self, *operations):
+        return self.client.post('/api/cart/', {'operations': list(operations)}, format='json')
+
+    def test_cart_lines_and_totals(self):
+        response = self.batch(
+            {'op': 'add', 'product_id': self.bowl.pk, 'quantity': 2},
+            {'op': 'add', 'product_id': self.food.pk},
+            {'op': 'add', 'product_id': self.food.pk, 'quantity': 2},
+        )
+        self.assertEqual(response.status_code, 200)
+        bowl, food = response.data['items']
+        self.assertEqual((bowl['unit_price'], bowl['line_total']), ('85.00', '170.00'))
+        self.assertEqual(bowl['product']['image'], '/media/products/bowl.jpg')
+        self.assertEqual((food['quantity'], food['line_total']), (3, '59.97'))
+        self.assertEqual((response.data['total_quantity'], response.data['total']), (5, '229.97'))
+
+    def test_reading_the_cart_is_constant_in_queries(self):
+        self.batch(*[{'product_id': make_product(name=f'P{i}').pk} for i in range(10)])
+        # Lines with totals, product images
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/cart/')
+        self.assertEqual(response.data['total_quantity'], 10)
+
+    def test_batch_is_applied_with_upserts(self):
+        self.batch({'product_id': self.bowl.pk, 'quantity': 4}, {'product_id': self.food.pk})
+        toy = make_product(name='Toy')
+        # Product check, savepoint, delete, upsert of set lines, upsert of
+        # added lines, release, then the cart read (lines, images)
+        with self.assertNumQueries(8):
+            response = self.batch(
+                {'op': 'add', 'product_id': self.bowl.pk, 'quantity': 1},
+                {'op': 'remove', 'product_id': self.food.pk},
+                {'op': 'set', 'product_id': self.food.pk, 'quantity': 7},
+                {'op': 'add', 'product_id': toy.pk},
+                {'op': 'set', 'product_id': self.bowl.pk, 'quantity': 0},
+            )
+        self.assertEqual([(line['product']['name'], line['quantity']) for line in response.data['items']], [('Food', 7), ('Toy', 1)])
+        self.assertEqual(Cart.objects.count(), 2)
+
+    def test_unknown_product_and_invalid_operation(self):
+        response = self.batch({'product_id': 999})
+        self.assertEqual((response.status_code, response.data['product_ids']), (400, [999]))
+        response = self.batch({'op': 'swap', 'product_id': self.bowl.pk})
+        self.assertEqual(set(response.data['operations'][0]), {'op'})
+        self.assertFalse(Cart.objects.exists())
+
+    def test_adding_nothing_is_rejected(self):
+        response = self.batch({'op': 'add', 'product_id': self.bowl.pk, 'quantity': 0})
+        self.assertEqual(set(response.data['operations'][0]), {'quantity'})
+        self.assertFalse(Cart.objects.exists())
+        self.batch({'op': 'add', 'product_id': self.bowl.pk, 'quantity': 2})
+        self.assertEqual(self.batch({'op': 'set', 'product_id': self.bowl.pk, 'quantity': 0}).status_code, 200)
+        self.assertFalse(Cart.objects.exists())
+
+    def test_added_quantities_are_capped(self):
+        self.batch(*[{'product_id': self.bowl.pk, 'quantity': 1000}] * 3)
+        self.batch({'op': 'set', 'product_id': self.food.pk, 'quantity': 999}, {'product_id': self.food.pk, 'quantity': 5})
+        self.assertEqual(dict(Cart.objects.values_list('product__name', 'quantity')), {'Bowl': 1000, 'Food': 1000})
+        # On top of a stored line, the sum is capped by the upsert itself
+        Cart.objects.filter(product=self.food).update(quantity=990)
+        self.batch({'product_id': self.food.pk, 'quantity': 20})
+        self.assertEqual(Cart.objects.get(product=self.food).quantity, 1000)
+
+    def test_cart_is_per_user(self):
+        other = CustomUser.objects.create_user(email='other@example.com', username='other', password='pass')
+        Cart.objects.create(user=other, product=self.bowl, quantity=1)
+        self.assertEqual(self.client.get('/api/cart/').data['items'], [])
+        self.assertEqual(APIClient().get('/api/cart/').status_code, 401)
+
+    def test_guest_cart_is_merged_at_login(self):
+        Cart.objects.create(user=self.user, product=self.bowl, quantity=3)
+        guest_cart = [{'id': self.bowl.pk, 'quantity': 1, 'name': 'Bowl'}, {'id': self.food.pk, 'quantity': 2},
+                      {'id': 999, 'quantity': 1}]
+        for _ in range(2):
+            response = APIClient().post('/api/login/', {
+                'email': 'buyer@example.com', 'password': 'pass', 'cart': guest_cart,
+            }, format='json')
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            dict(Cart.objects.values_list('product__name', 'quantity')),
+            {'Bowl': 3, 'Food': 2},
+        )
+
+    def test_checkout_charges_the_cart_total(self):
+        cart = self.batch({'product_id': self.bowl.pk, 'quantity': 2}, {'product_id': self.food.pk}).data
+        order = self.client.post('/api/orders/', {
+            'payment_method': 'cash',
+            'items': [{'product_id': line['product']['id'], 'quantity': line['quantity']} for line in cart['items']],
+        }, format='json')
+        self.assertEqual(str(order.data['total_amount']), cart['total'])
+
+
+@override_settings(LIQPAY_PUBLIC_KEY='public', LIQPAY_PRIVATE_KEY='private')
+class LiqPayClientTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.order = Order.objects.create(
+            total_amount=250, payment_method='liqpay', first_name='Ivan', last_name='Petrenko',
+            email='buyer@example.com', phone='', shipping_city='Kyiv', shipping_address='Main St 1',
+        )
+
+    def test_signature_round_trip(self):
+        client = get_client()
+        form = client.generate_payment_form(order_id=7, amount=10.5, description='Test')
+        expected = base64.b64encode(hashlib.sha1(f"private{form['data']}private".encode('utf-8')).digest())
+        self.assertEqual(form['signature'], expected.decode('utf-8'))
+        self.assertTrue(client.verify_signature(form['data'], form['signature']))
+        self.assertFalse(client.verify_signature(form['data'], form['signature'][:-2]))
+        self.assertFalse(client.verify_signature(form['data'], 'підпис'))
+
+    def test_client_follows_settings(self):
+        self.assertEqual(get_client().public_key, 'public')
+        with override_settings(LIQPAY_PUBLIC_KEY='rotated'):
+            self.assertEqual(get_client().public_key, 'rotated')
+        self.assertIs(get_client(), get_client())
+
+    def test_payment_payload_is_cached_until_the_order_changes(self):
+        client = get_client()
+        with mock.patch.object(client, 'generate_payment_form', wraps=client.generate_payment_form) as generate:
+            first = self.client.get(f'/api/orders/{self.order.pk}/payment/').data
+            with self.assertNumQueries(1):
+                self.assertEqual(self.client.get(f'/api/orders/{self.order.pk}/payment/').data, first)
+            self.assertEqual(generate.call_count, 1)
+
+            self.order.total_amount = 300
+            self.order.save()
+            changed = self.client.get(f'/api/orders/{self.order.pk}/payment/').data
+        self.assertNotEqual(changed['data'], first['data'])
+        self.assertEqual(json.loads(base64.b64decode(changed['data']))['amount'], 300)
+
+    def test_unknown_order(self):
+        self.assertEqual(self.client.get('/api/orders/999/payment/').status_code, 404)
+
+    def test_signatures_are_compared_in_constant_time(self):
+        client = get_client()
+        data = client.generate_payment_form(order_id=1, amount=99.99, description='Оплата замовлення')['data']
+        signature = client.sign(data)
+        with mock.patch('api.liqpay.hmac.compare_digest', wraps=hmac.compare_digest) as compare:
+            self.assertTrue(client.verify_signature(data, signature))
+        compare.assert_called_once_with(signature.encode('utf-8'), signature.encode('utf-8'))
+
+
+@override_settings(LIQPAY_PUBLIC_KEY='public', LIQPAY_PRIVATE_KEY='private', BACKGROUND_TASKS_EAGER=True)
+class PaymentCallbackTests(TestCase):
+    def setUp(self):
+        self.order = Order.objects.create(
+            total_amount=250, payment_method='liqpay', first_name='Ivan', last_name='Petrenko',
+            email='buyer@example.com', phone='', shipping_city='Kyiv', shipping_address='Main St 1',
+        )
+
+    def callback(self, signature=None, **payload):
+        payload = dict({'order_id': str(self.order.pk), 'payment_id': 1001, 'status': 'success', 'amount': 250}, **payload)
+        data = base64.b64encode(json.dumps(payload).encode('utf-8')).decode('utf-8')
+        if signature is None:
+            signature = base64.b64encode(hashlib.sha1(f'private{data}private'.encode('utf-8')).digest()).decode('utf-8')
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/liqpay/callback/', {'data': data, 'signature': signature})
+
+    def test_success_marks_order_paid_and_queues_follow_up(self):
+        self.assertEqual(self.callback().status_code, 200)
+        self.order.refresh_from_db()
+        self.assertTrue(self.order.paid)
+        event = PaymentEvent.objects.get()
+        self.assertEqual((event.payment_id, event.status, event.amount), ('1001', 'success', 250))
+        self.assertIsNotNone(event.processed_at)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['buyer@example.com'])
+
+    def test_replayed_callback_is_a_no_op(self):
+        self.callback()
+        response = self.callback()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(PaymentEvent.objects.count(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_failed_payment_is_recorded_without_paying(self):
+        self.callback(status='failure', payment_id=1002)
+        self.order.refresh_from_db()
+        self.assertFalse(self.order.paid)
+        self.assertEqual(PaymentEvent.objects.get().status, 'failure')
+        self.assertEqual(mail.outbox, [])
+
+    def test_sandbox_payments_only_pay_in_sandbox_mode(self):
+        with override_settings(LIQPAY_SANDBOX=False):
+            self.callback(status='sandbox', payment_id=1003)
+        self.order.refresh_from_db()
+        self.assertFalse(self.order.paid)
+        self.assertEqual(mail.outbox, [])
+        with override_settings(LIQPAY_SANDBOX=True):
+            self.callback(status='sandbox', payment_id=1004)
+        self.order.refresh_from_db()
+        self.assertTrue(self.order.paid)
+
+    def test_rejects_bad_signature_and_unknown_order(self):
+        self.assertEqual(self.callback(signature='forged').status_code, 400)
+        self.assertEqual(self.callback(order_id='999').status_code, 404)
+        self.assertFalse(PaymentEvent.objects.exists())
+
+    def test_unfinished_events_are_replayed_by_command(self):
+        with override_settings(BACKGROUND_TASKS_EAGER=False), mock.patch.object(worker, 'submit'):
+            self.callback()
+        self.assertEqual(mail.outbox, [])
+        call_command('process_payment_events', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIsNotNone(PaymentEvent.objects.get().processed_at)
+
+
+class BackgroundWorkerTests(TestCase):
+    def test_jobs_run_off_thread_and_failures_are_contained(self):
+        background = BackgroundWorker(name='test-worker')
+        threads = []
+        with self.assertLogs('api.worker', 'ERROR'):
+            background.submit(lambda: 1 / 0)
+            background.submit(lambda: threads.append(threading.current_thread().name))
+            background.join()
+        self.assertEqual(threads, ['test-worker'])
+
+
+class GoogleKeyServer:
+    """Local stand-in for Google's certificate endpoint, signing tokens with its own keys."""
+
+    def __init__(self, max_age=3600):
+        self.max_age = max_age
+        self.keys = {}
+        self.requests = 0
+        self.rotate('key-1')
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests += 1
+                body = json.dumps({kid: cert for kid, (_, cert) in server.keys.items()}).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Cache-Control', f'public, max-age={server.max_age}, must-revalidate')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.httpd.server_port}/certs'
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def rotate(self, kid):
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, kid)])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        cert = (
+            x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now).not_valid_after(now + datetime.timedelta(days=1))
+            .sign(key, hashes.SHA256())
+        )
+        private_pem = key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+        )
+        self.keys[kid] = (crypt.RSASigner.from_string(private_pem, key_id=kid),
+                          cert.public_bytes(serialization.Encoding.PEM).decode('utf-8'))
+
+    def token(self, kid='key-1', **claims):
+        now = int(time.time())
+        payload = {'iss': 'https://accounts.google.com', 'aud': 'client-id', 'iat': now, 'exp': now + 3600,
+                   'sub': '42', 'email': 'g@example.com', 'name': 'Олена Коваль', **claims}
+        return google_jwt.encode(self.keys[kid][0], payload).decode('utf-8')
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def slow_verify(self, token):
+    time.sleep(0.5)
+    return {'email': 'g@example.com', 'exp': time.time() + 60}
+
+
+class GoogleAuthTests(CatalogTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.google = GoogleKeyServer()
+        cls.addClassCleanup(cls.google.close)
+
+    def setUp(self):
+        super().setUp()
+        self.google.requests = 0
+        self.google.max_age = 3600
+        settings = override_settings(GOOGLE_CERTS_URL=self.google.url, GOOGLE_OAUTH2_CLIENT_ID='client-id')
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def login(self, token, **data):
+        return self.client.post('/api/auth/google/', {'google_token': token, **data}, format='json')
+
+    def test_login_creates_the_user_and_merges_the_cart(self):
+        bowl = make_product(name='Bowl')
+        response = self.login(self.google.token(), cart=[{'id': bowl.pk, 'quantity': 2}])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', response.json())
+        user = CustomUser.objects.get(email='g@example.com')
+        self.assertEqual((user.first_name, user.last_name), ('Олена', 'Коваль'))
+        self.assertEqual(list(Cart.objects.values_list('user', 'quantity')), [(user.pk, 2)])
+        self.assertEqual(self.login(self.google.token()).json()['id'], user.pk)
+
+    def test_invalid_tokens_are_rejected(self):
+        forged = self.google.token().rsplit('.', 1)[0] + '.' + self.google.token(sub='43').rsplit('.', 1)[1]
+        for token in [
+            self.google.token(aud='someone-else'),
+            self.google.token(iss='https://evil.example.com'),
+            self.google.token(iat=int(time.time()) - 7200, exp=int(time.time()) - 3600),
+            forged, 'not-a-jwt', '',
+        ]:
+            self.assertEqual(self.login(token).status_code, 400, token)
+        self.assertFalse(CustomUser.objects.exists())
+
+    def test_certificates_and_verified_tokens_are_cached(self):
+        token = self.google.token()
+        for _ in range(3):
+            self.assertEqual(self.login(token).status_code, 200)
+        self.assertEqual(self.login(self.google.token(sub='other')).status_code, 200)
+        self.assertEqual(self.google.requests, 1)
+        # A repeated token doesn't even need the signature check
+        with mock.patch('api.google_tokens.jwt.decode') as decode:
+            self.assertEqual(self.login(token).status_code, 200)
+        decode.assert_not_called()
+
+    def test_certificates_are_refetched_on_expiry_and_rotation(self):
+        self.google.max_age = 0
+        self.login(self.google.token())
+        self.login(self.google.token(sub='other'))
+        self.assertEqual(self.google.requests, 2)
+
+        self.google.max_age = 3600
+        self.google.rotate('key-2')
+        self.assertEqual(self.login(self.google.token('key-2')).status_code, 200)
+        self.assertEqual(self.google.requests, 3)
+        # Tokens signed with unknown keys don't make us hammer the key server
+        self.google.rotate('key-3')
+        unknown = self.google.token('key-3')
+        del self.google.keys['key-3']
+        self.assertEqual(self.login(unknown).status_code, 400)
+        self.assertEqual(self.google.requests, 3)
+
+    def test_key_server_failures(self):
+        with override_settings(GOOGLE_CERTS_URL='http://127.0.0.1:9/certs'):
+            self.assertEqual(self.login(self.google.token()).status_code, 502)
+        with override_settings(OUTBOUND_HTTP_TIMEOUT=0.05), \
+                mock.patch.object(GoogleTokenVerifier, 'verify', slow_verify):
+            self.assertEqual(self.login(self.google.token()).status_code, 504)
+        self.assertFalse(CustomUser.objects.exists())
+
+    @mock.patch.object(GoogleTokenVerifier, 'verify', slow_verify)
+    async def test_slow_google_does_not_hold_up_catalog_reads(self):
+        await sync_to_async(make_product)()
+        self.assertEqual((await self.async_client.get('/api/products/'))['X-Cache'], 'MISS')
+        started = time.monotonic()
+
+        async def catalog():
+            response = await self.async_client.get('/api/products/')
+            return response['X-Cache'], time.monotonic() - started
+
+        login, (cache_status, elapsed) = await asyncio.gather(
+            self.async_client.post('/api/auth/google/', {'google_token': 'token'}, content_type='application/json'),
+            catalog(),
+        )
+        self.assertEqual((login.status_code, cache_status), (200, 'HIT'))
+        # The catalog answer doesn't wait for the 0.5 s token check
+        self.assertLess(elapsed, 0.25)
+
+
+def make_upload(name='photo.jpg', size=(1024, 768), color=(200, 120, 40), exif=None):
+    buffer = BytesIO()
+    PILImage.new('RGB', size, color).save(buffer, 'JPEG', **({'exif': exif.tobytes()} if exif else {}))
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class MediaTestCase(CatalogTestCase):
+    """Uploads go to a temporary MEDIA_ROOT."""
+    image_jobs_eager = True
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(
+            MEDIA_ROOT=media.name, IMAGE_VARIANT_WIDTHS=(160, 320, 640, 960),
+            IMAGE_JOBS_EAGER=self.image_jobs_eager, IMAGE_JOB_MAX_ATTEMPTS=2,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.media = media.name
+
+    def variant_files(self):
+        return sorted(os.path.relpath(os.path.join(root, name), self.media)
+                      for root, _, names in os.walk(os.path.join(self.media, 'variants')) for name in names)
+
+
+class ImageVariantTests(MediaTestCase):
+
+    def test_uploads_get_downscaled_webp_variants(self):
+        category = Animal_Category.objects.create(name='Dogs', image=make_upload())
+        widths = {}
+        for path in self.variant_files():
+            with PILImage.open(os.path.join(self.media, path)) as image:
+                self.assertEqual(image.format, 'WEBP')
+                widths[image.width] = image.height
+        self.assertEqual(widths, {160: 120, 320: 240, 640: 480, 960: 720})
+
+        srcset = self.client.get('/api/animal_categories/').json()[0]['srcset']
+        candidates = [candidate.rsplit(' ', 1) for candidate in srcset.split(', ')]
+        self.assertEqual([width for _, width in candidates], ['160w', '320w', '640w', '960w', '1024w'])
+        self.assertTrue(candidates[0][0].startswith('http://testserver/media/variants/'))
+        self.assertEqual(candidates[-1][0], f'http://testserver{category.image.url}')
+
+    def test_variants_are_content_addressed(self):
+        product = make_product()
+        first = Image.objects.create(product=product, image=make_upload('a.jpg'))
+        files = self.variant_files()
+        second = Image.objects.create(product=product, image=make_upload('b.jpg'))
+        self.assertEqual(self.variant_files(), files)
+        self.assertEqual(first.image_variants['files'], second.image_variants['files'])
+
+        first.image = make_upload('c.jpg', color=(0, 0, 255))
+        first.save()
+        self.assertNotEqual(first.image_variants['hash'], second.image_variants['hash'])
+        self.assertEqual(len(self.variant_files()), 2 * len(files))
+        product_data = self.client.get(f'/api/products/{product.pk}/').json()
+        self.assertEqual(len({image['srcset'] for image in product_data['images']}), 2)
+
+    def test_small_and_broken_images_have_no_srcset(self):
+        item = Item_Category.objects.create(name='Toys', image=make_upload(size=(120, 90)))
+        self.assertEqual(item.image_variants['files'], {})
+        with self.assertLogs('api.thumbnails', 'WARNING'):
+            broken = Item_Category.objects.create(
+                name='Food', image=SimpleUploadedFile('broken.jpg', b'not an image', content_type='image/jpeg'),
+            )
+        self.assertEqual(broken.image_variants, {'source': broken.image.name, 'files': {}})
+        self.assertEqual([category['srcset'] for category in self.client.get('/api/item_categories/').json()], [None, None])
+
+    def test_command_builds_missing_variants(self):
+        user = CustomUser.objects.create_user(email='a@example.com', username='a', password='pass', avatar=make_upload())
+        self.assertEqual(len(user.avatar_variants['files']), 4)
+        CustomUser.objects.update(avatar_variants={})
+        call_command('generate_image_variants', stdout=StringIO())
+        user.refresh_from_db()
+        self.assertEqual(len(user.avatar_variants['files']), 4)
+
+
+class ImageJobTests(MediaTestCase):
+    image_jobs_eager = False
+
+    def setUp(self):
+        super().setUp()
+        self.product = make_product()
+
+    def process(self, processes=0):
+        call_command('process_image_jobs', '--once', f'--processes={processes}', stdout=StringIO())
+
+    def test_uploads_are_queued_and_processed_later(self):
+        image = Image.objects.create(product=self.product, image=make_upload())
+        self.assertEqual(Image.objects.get().image_variants, {})
+        image.save()
+        image.image = make_upload('newer.jpg')
+        image.save()
+        job = ImageJob.objects.get()
+        self.assertEqual((job.status, job.source), (ImageJob.PENDING, image.image.name))
+
+        detail = f'/api/products/{self.product.pk}/'
+        self.assertIsNone(self.client.get(detail).json()['images'][0]['srcset'])
+        self.process()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (ImageJob.DONE, 1))
+        self.assertIn('960w', self.client.get(detail).json()['images'][0]['srcset'])
+
+    def test_exif_is_stripped_from_originals(self):
+        exif = PILImage.Exif()
+        exif[0x0112] = 6  # Orientation: rotate 90° clockwise
+        exif[0x010F] = 'PhoneMaker'
+        user = CustomUser.objects.create_user(email='a@example.com', username='a', password='pass',
+                                              avatar=make_upload('me.jpg', exif=exif))
+        uploaded = user.avatar.name
+        self.process()
+        user.refresh_from_db()
+        self.assertNotEqual(user.avatar.name, uploaded)
+        self.assertFalse(os.path.exists(os.path.join(self.media, uploaded)))
+        with PILImage.open(user.avatar.path) as image:
+            self.assertEqual((image.size, len(image.getexif())), ((768, 1024), 0))
+        self.assertEqual(user.avatar_variants['source'], user.avatar.name)
+        self.assertEqual((user.avatar_variants['width'], user.avatar_variants['height']), (768, 1024))
+
+    def test_failures_are_retried_then_recorded(self):
+        Image.objects.create(product=self.product, image=make_upload())
+        with mock.patch('api.imaging.render', side_effect=RuntimeError('disk full')), \
+                self.assertLogs('api.image_jobs', 'WARNING'):
+            self.process()
+        job = ImageJob.objects.get()
+        self.assertEqual((job.status, job.attempts, job.last_error), (ImageJob.PENDING, 1, 'RuntimeError: disk full'))
+        self.assertGreater(job.run_after, timezone.now())
+
+        ImageJob.objects.update(run_after=timezone.now())
+        with mock.patch('api.imaging.render', side_effect=RuntimeError('disk full')), \
+                self.assertLogs('api.image_jobs', 'ERROR'):
+            self.process()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (ImageJob.FAILED, 2))
+
+    def test_unreadable_and_missing_files_fail_without_retry(self):
+        broken = Image.objects.create(product=self.product, image=SimpleUploadedFile('broken.jpg', b'not an image'))
+        missing = Image.objects.create(product=self.product, image=make_upload())
+        os.remove(missing.image.path)
+        with self.assertLogs('api.image_jobs', 'ERROR'):
+            self.process()
+        self.assertEqual(list(ImageJob.objects.order_by('id').values_list('status', 'attempts')),
+                         [(ImageJob.FAILED, 1), (ImageJob.FAILED, 1)])
+        broken.refresh_from_db()
+        self.assertEqual(broken.image_variants, {'source': broken.image.name, 'files': {}})
+
+    def test_stale_running_jobs_are_requeued(self):
+        Image.objects.create(product=self.product, image=make_upload())
+        ImageJob.objects.update(status=ImageJob.RUNNING, attempts=1, started_at=timezone.now() - datetime.timedelta(hours=1))
+        self.process()
+        self.assertEqual(ImageJob.objects.get().status, ImageJob.DONE)
+
+    def test_process_pool(self):
+        for color in [(255, 0, 0), (0, 255, 0), (0, 0, 255)]:
+            Image.objects.create(product=self.product, image=make_upload(color=color))
+        self.process(processes=2)
+        self.assertEqual(set(ImageJob.objects.values_list('status', flat=True)), {ImageJob.DONE})
+        self.assertEqual(len({image.image_variants['hash'] for image in Image.objects.all()}), 3)
+
+
+
+class ContentAddressedMediaTests(MediaTestCase):
+
+    def stored_files(self, directory):
+        return sorted(os.path.relpath(os.path.join(root, name), self.media)
+                      for root, _, names in os.walk(os.path.join(self.media, directory)) for name in names)
+
+    def test_identical_uploads_share_one_file(self):
+        product = make_product()
+        first = Image.objects.create(product=product, image=make_upload('a.jpg'))
+        second = Image.objects.create(product=product, image=make_upload('b.jpg'))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r'^products/([0-9a-f]{2})/\1[0-9a-f]{30}\.jpg$')
+        self.assertEqual(self.stored_files('products'), [first.image.name])
+
+    def test_hashed_media_is_immutable(self):
+        category = Animal_Category.objects.create(name='Dogs', image=make_upload())
+        response = self.client.get(category.image.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+
+        response = self.client.get(category.image.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_legacy_media_is_not_immutable(self):
+        FileSystemStorage(location=self.media).save('animal_categories/old.jpg', make_upload())
+        response = self.client.get('/media/animal_categories/old.jpg')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Cache-Control', response)
+
+    def test_dedupe_media_merges_legacy_files(self):
+        legacy = FileSystemStorage(location=self.media)
+        names = [legacy.save(f'products/{name}', make_upload(name)) for name in ('a.jpg', 'b.jpg')]
+        product = make_product()
+        # Rows written before the storage change, bypassing it
+        Image.objects.bulk_create(Image(product=product, image=name) for name in names)
+
+        out = StringIO()
+        call_command('dedupe_media', stdout=out)
+        self.assertIn('Moved 2 files', out.getvalue())
+        stored = set(Image.objects.values_list('image', flat=True))
+        self.assertEqual(len(stored), 1)
+        self.assertEqual(self.stored_files('products'), sorted(stored))
+
+
+class FileServingTests(MediaTestCase):
+    CSS = b'body { color: #333; }\n' + b''.join(b'.item-%d { margin: %dpx; }\n' % (i, i) for i in range(100))
+
+    def collect_static(self):
+        source, root = tempfile.TemporaryDirectory(), tempfile.TemporaryDirectory()
+        self.addCleanup(source.cleanup)
+        self.addCleanup(root.cleanup)
+        with open(os.path.join(source.name, 'app.css'), 'wb') as file:
+            file.write(self.CSS)
+        settings = override_settings(STATICFILES_DIRS=[source.name], STATIC_ROOT=root.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        return root.name
+
+    def test_collectstatic_writes_compressed_copies(self):
+        root = self.collect_static()
+        url = staticfiles_storage.url('app.css')
+        self.assertRegex(url, r'^/static/app\.[0-9a-f]{12}\.css$')
+        self.assertTrue(os.path.isfile(os.path.join(root, url.removeprefix('/static/') + '.gz')))
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), self.CSS)
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(b''.join(response.streaming_content), self.CSS)
+        # The unhashed name may change with the next deploy
+        self.assertNotIn('Cache-Control', self.client.get('/static/app.css'))
+
+    def test_range_requests(self):
+        category = Animal_Category.objects.create(name='Dogs', image=make_upload())
+        url = category.image.url
+        with open(category.image.path, 'rb') as file:
+            data = file.read()
+
+        response = self.client.get(url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(data)}')
+        self.assertEqual(b''.join(response.streaming_content), data[10:20])
+        self.assertEqual(b''.join(self.client.get(url, HTTP_RANGE='bytes=-5').streaming_content), data[-5:])
+
+        response = self.client.get(url, HTTP_RANGE=f'bytes={len(data)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(data)}')
+        # The file changed since the client's partial copy: send all of it
+        response = self.client.get(url, HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(FILE_SENDFILE='nginx')
+    def test_sendfile_hands_transfer_to_web_server(self):
+        category = Animal_Category.objects.create(name='Dogs', image=make_upload())
+        response = self.client.get(category.image.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected/media/{category.image.name}')
+        self.assertEqual(response.content, b'')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(self.client.get(category.image.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+
+@override_settings(REPLICA_DATABASES=['replica'], REPLICA_CHECK_INTERVAL=60)
+class ReplicaRoutingTests(TransactionTestCase):
+    """The "replica" alias shares the test database's connection; the tests check where reads are routed."""
+
+    def setUp(self):
+        response_cache.get_cache().clear()
+        cache.clear()
+        connections['replica'] = connections['default']
+        self.addCleanup(connections.__delitem__, 'replica')
+        self.addCleanup(replicas.health.reset)
+
+        self.routed = []
+        route = replicas.ReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            alias = route(router, model, **hints)
+            self.routed.append(alias)
+            return alias
+        patcher = mock.patch.object(replicas.ReplicaRouter, 'db_for_read', record)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.client = APIClient()
+        self.product = make_product()
+        self.user = CustomUser.objects.create_user(email='u@example.com', username='u', password='pass')
+
+    def test_read_only_views_use_replica(self):
+        self.client.force_authenticate(self.user)
+        for url in ['/api/products/', f'/api/products/{self.product.pk}/', '/api/products/max_price/',
+                    '/api/animal_categories/', '/api/get-orders/']:
+            self.routed.clear()
+            self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertIn('replica', self.routed, url)
+            self.assertNotIn('default', self.routed, url)
+
+    def test_writes_pin_client_to_primary(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.post(f'/api/products/{self.product.pk}/rate/', {'rating': 4})
+        self.assertEqual(response.data, {'average_rating': 4.0})
+        self.assertIn(replicas.PIN_COOKIE, response.cookies)
+        # refresh_from_db after the write
+        self.assertNotIn('replica', self.routed)
+
+        self.routed.clear()
+        self.client.get(f'/api/products/{self.product.pk}/')
+        self.assertNotIn('replica', self.routed)
+
+        # Signed-in users are pinned without the cookie too, through the shared
+        # catalog cache rather than the default one, which is per process
+        cache.clear()
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.routed.clear()
+        client.get('/api/get-orders/')
+        self.assertNotIn('replica', self.routed)
+
+    def test_lagging_or_unavailable_replica_falls_back_to_primary(self):
+        for patch in [{'return_value': 60.0}, {'side_effect': OperationalError('connection refused')}]:
+            replicas.health.reset()
+            response_cache.get_cache().clear()
+            self.routed.clear()
+            with mock.patch('api.replicas.replica_lag', **patch), self.assertLogs('api.replicas', 'WARNING'):
+                self.assertEqual(self.client.get('/api/item_categories/').status_code, 200)
+            self.assertIn('default', self.routed)
+            self.assertNotIn('replica', self.routed)
+
+
+class InstrumentationTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.registry.reset()
+        make_product()
+
+    def test_server_timing_header(self):
+        timing = self.client.get('/api/products/')['Server-Timing']
+        parts = dict(part.split(';', 1) for part in timing.split(', '))
+        self.assertEqual(set(parts), {'app', 'db', 'serialize'})
+        self.assertRegex(parts['db'], r'^dur=[\d.]+;desc="[1-9]\d* queries"$')
+
+    def test_prometheus_metrics(self):
+        self.client.get('/api/products/')
+        self.client.get('/api/products/')
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('petopia_requests_total{view="product-list",method="GET",status="200"} 2', body)
+        self.assertIn('petopia_request_duration_seconds_count{view="product-list",method="GET"} 2', body)
+        self.assertRegex(body, r'petopia_db_queries_total\{view="product-list",method="GET"\} [1-9]')
+        self.assertIn('petopia_response_cache_total{endpoint="products",result="hits"} 1', body)
+
+    def test_metrics_endpoint_is_internal(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.5').status_code, 403)
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret', REMOTE_ADDR='203.0.113.5').status_code, 200)
+
+    @override_settings(N_PLUS_ONE_THRESHOLD=3)
+    def test_repeated_queries_are_reported(self):
+        request = APIRequestFactory().get('/api/products/')
+        with metrics.measure() as measured:
+            for product in Product.objects.all()[:1]:
+                for _ in range(3):
+                    Product.objects.filter(pk=product.pk).exists()
+        with self.assertLogs('api.metrics', 'WARNING') as logs:
+            metrics.finish_request(request, HttpResponse(), measured)
+        self.assertIn('the same query ran 3 times', logs.output[0])
+        self.assertIn('petopia_n_plus_one_total{view="unmatched",method="GET"} 1', metrics.registry.render())
+
+
+class LoggingTests(CatalogTestCase):
+    def make_logger(self, *filters):
+        stream = StringIO()
+        handler = logs.BackgroundStreamHandler(stream)
+        handler.setFormatter(logs.JsonFormatter())
+        for log_filter in (logs.RequestIdFilter(), *filters):
+            handler.addFilter(log_filter)
+        logger = logging.getLogger(f'api.tests.{self._testMethodName}')
+        logger.addHandler(handler)
+        logger.propagate = False
+        logger.setLevel(logging.DEBUG)
+        self.addCleanup(logger.removeHandler, handler)
+        self.addCleanup(handler.close)
+        return logger, handler, stream
+
+    def records(self, handler, stream):
+        handler.stop()
+        return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    def test_records_are_written_as_json_by_the_listener(self):
+        logger, handler, stream = self.make_logger()
+        items = ['bowl']
+        token = logs.request_id.set('abc123')
+        try:
+            logger.warning('Order with %s', items, extra={'order_id': 7})
+        finally:
+            logs.request_id.reset(token)
+        # Arguments are taken when the call is made, not when the listener formats it
+        items.append('food')
+        try:
+            raise ValueError('broken')
+        except ValueError:
+            logger.exception('Failed')
+
+        first, second = self.records(handler, stream)
+        self.assertEqual(first['message'], "Order with ['bowl']")
+        self.assertEqual((first['level'], first['request_id'], first['order_id']), ('WARNING', 'abc123', 7))
+        self.assertIsNone(second['request_id'])
+        self.assertIn('ValueError: broken', second['exc_info'])
+
+    def test_debug_records_are_sampled(self):
+        logger, handler, stream = self.make_logger(logs.SampleFilter(rate=0))
+        logger.debug('Dropped')
+        logger.info('Kept')
+        self.assertEqual([record['message'] for record in self.records(handler, stream)], ['Kept'])
+
+    def test_settings_use_the_background_handler(self):
+        handler, = logging.getLogger().handlers
+        self.assertIsInstance(handler, logs.BackgroundStreamHandler)
+        # dictConfig expects QueueHandlers to be configured with `handlers`/`listener` from 3.12 on
+        self.assertNotIsInstance(handler, logging.handlers.QueueHandler)
+
+    def test_listener_is_restarted_after_a_fork(self):
+        logger, handler, stream = self.make_logger()
+        logger.info('Before')
+        handler.stop()
+        logger.info('Restarted')
+        # As seen from a forked child: the thread belongs to another process
+        parent_listener, handler._pid = handler.listener, -1
+        logger.info('In the child')
+        parent_listener.stop()
+        self.assertIsNot(handler.listener, parent_listener)
+        self.assertEqual([record['message'] for record in self.records(handler, stream)], ['Before', 'Restarted', 'In the child'])
+
+    def test_requests_get_an_id(self):
+        response = self.client.get('/api/animal_categories/')
+        self.assertRegex(response['X-Request-ID'], r'^[0-9a-f]{32}$')
+        self.assertEqual(self.client.get('/api/animal_categories/', HTTP_X_REQUEST_ID='edge-42')['X-Request-ID'], 'edge-42')
+        self.assertNotEqual(self.client.get('/api/animal_categories/', HTTP_X_REQUEST_ID='bad id\n')['X-Request-ID'], 'bad id\n')
+
+
+class CartProductDeletedTests(TransactionTestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='buyer@example.com', username='buyer', password='pass')
+        self.bowl, self.food = make_product(name='Bowl'), make_product(name='Food')
+
+    def deleted_after_check(self, product):
+        # The product passes the existence check, then is gone when the cart line is written
+        check, calls = cart_module._missing_products, []
+
+        def missing_products(product_ids):
+            calls.append(product_ids)
+            return [] if len(calls) == 1 else check(product_ids)
+        Product.objects.filter(pk=product.pk).delete()
+        return mock.patch.object(cart_module, '_missing_products', side_effect=missing_products)
+
+    def test_product_deleted_during_a_batch_is_reported(self):
+        with self.deleted_after_check(self.bowl), self.assertRaises(CartError) as raised:
+            apply_operations(self.user, [{'op': 'add', 'product_id': self.bowl.pk, 'quantity': 1}])
+        self.assertEqual(raised.exception.product_ids, [self.bowl.pk])
+        self.assertFalse(Cart.objects.exists())
+
+    def test_guest_merge_skips_a_product_deleted_meanwhile(self):
+        with self.deleted_after_check(self.bowl):
+            merge_guest_cart(self.user, [{'product_id': self.bowl.pk, 'quantity': 2}, {'product_id': self.food.pk, 'quantity': 1}])
+        self.assertEqual(dict(Cart.objects.values_list('product__name', 'quantity')), {'Food': 1})
+
+@skipUnless(connection.vendor == 'postgresql', 'concurrent upserts need a real database server')
+class ConcurrentCartTests(TransactionTestCase):
+    def test_concurrent_adds_of_a_new_product_are_all_counted(self):
+        user = CustomUser.objects.create_user(email='buyer@example.com', username='buyer', password='pass')
+        product = make_product()
+
+        def add():
+            try:
+                apply_operations(user, [{'op': 'add', 'product_id': product.pk, 'quantity': 1}])
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda _: add(), range(20)))
+        self.assertEqual(Cart.objects.get(user=user, product=product).quantity, 20)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'row locks need a real database server')
+class ConcurrentCheckoutTests(TransactionTestCase):
+    def test_concurrent_checkouts_do_not_oversell(self):
+        product = make_product(stock=10)
+
+        def buy():
+            try:
+                place_order(None, [{'product_id': product.pk, 'quantity': 1}], payment_method='cash')
+                return True
+            except OutOfStock:
+                return False
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda _: buy(), range(30)))
+        product.refresh_from_db()
+        self.assertEqual(results.count(True), 10)
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(Order.objects.count(), 10)
+
+
+@tag('benchmark')
+class QueryPlanTests(TestCase):
+    """
+    The hot catalog, order-history and cart queries must be answered from an
+    index and stay within QUERY_BUDGET_MS on a large synthetic data set.
+    Skip with `manage.py test --exclude-tag benchmark`.
+    """
+    PRODUCTS = 20000
+    USERS = 50
+    ORDERS_PER_USER = 40
+    CATEGORIES = 500
+    QUERY_BUDGET_MS = 50
+
+    @classmethod
+    def setUpTestData(cls):
+        Product.objects.bulk_create(
+            Product(name=f'Product {i}', description='', price=(i * 7919) % 5000, stock=i % 20)
+            for i in range(cls.PRODUCTS)
+        )
+        cls.users = CustomUser.objects.bulk_create(
+            CustomUser(email=f'user{i}@example.com', username=f'user{i}') for i in range(cls.USERS)
+        )
+        products = list(Product.objects.values_list('id', flat=True)[:cls.ORDERS_PER_USER])
+        Order.objects.bulk_create(
+            Order(user=user, total_amount=10, payment_method='cash', first_name='', last_name='',
+                  email=user.email, phone='', shipping_city='', shipping_address='')
+            for user in cls.users for _ in range(cls.ORDERS_PER_USER)
+        )
+        Cart.objects.bulk_create(
+            Cart(user=user, product_id=product_id, quantity=1) for user in cls.users for product_id in products
+        )
+        for model in (Animal_Category, Item_Category):
+            model.objects.bulk_create(
+                model(name=f'Category {i}', image='categories/c.jpg', tree_id=i + 1, lft=1, rght=2, level=0)
+                for i in range(cls.CATEGORIES)
+            )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def catalog_queryset(self, **params):
+        request = Request(APIRequestFactory().get('/api/products/', params))
+        view = ProductViewSet(request=request, format_kwarg=None, action='list')
+        return view.get_queryset()[:24]
+
+    # How each backend reports an explicit sort step in EXPLAIN output
+    SORT_MARKERS = {'sqlite': 'TEMP B-TREE', 'postgresql': 'Sort'}
+
+    def assertUsesIndex(self, queryset, index_name, ordered=False):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, f'{index_name} not used:\n{plan}')
+        if ordered and connection.vendor in self.SORT_MARKERS:
+            # The index must also deliver the rows in order
+            self.assertNotIn(self.SORT_MARKERS[connection.vendor], plan, f'extra sort step:\n{plan}')
+
+    def assertWithinBudget(self, queryset):
+        timings = []
+        for _ in range(5):
+            start = time.perf_counter()
+            list(queryset.all())
+            timings.append((time.perf_counter() - start) * 1000)
+        self.assertLess(min(timings), self.QUERY_BUDGET_MS)
+
+    def test_catalog_sorts_and_price_filter(self):
+        for params, index_name in [
+            ({'sort_by': 'price_asc'}, 'product_price_idx'),
+            ({'sort_by': 'price_desc'}, 'product_price_idx'),
+            ({'sort_by': 'price_asc', 'min_price': 100, 'max_price': 200}, 'product_price_idx'),
+            ({'sort_by': 'newest'}, 'product_created_idx'),
+            ({'sort_by': 'top_rated'}, 'product_top_rated_idx'),
+        ]:
+            with self.subTest(**params):
+                queryset = self.catalog_queryset(**params)
+                self.assertUsesIndex(queryset, index_name, ordered=True)
+                self.assertWithinBudget(queryset)
+
+    def test_order_history(self):
+        # Same query as views.get_user_orders
+        queryset = Order.objects.filter(user=self.users[0]).order_by('-created_at')
+        self.assertUsesIndex(queryset, 'order_user_created_idx', ordered=True)
+        self.assertWithinBudget(queryset)
+
+    def test_cart_lookup(self):
+        queryset = Cart.objects.filter(user=self.users[0], product_id=1)
+        # Served by the index behind the (user, product) unique constraint,
+        # which SQLite names after the table
+        index_name = 'sqlite_autoindex_api_cart' if connection.vendor == 'sqlite' else 'cart_user_product_uniq'
+        self.assertUsesIndex(queryset, index_name)
+        self.assertWithinBudget(queryset)
+
+    def test_category_by_name(self):
+        for model, index_name in [
+            (Animal_Category, 'animal_category_name_idx'),
+            (Item_Category, 'item_category_name_idx'),
+        ]:
+            with self.subTest(model=model.__name__):
+                queryset = model.objects.filter(name='Category 7')
+                self.assertUsesIndex(queryset, index_name)
+                self.assertWithinBudget(queryset)
@@ -0,0 +1,171 @@
+"""
+Responsive variants for uploaded images.
+
+Product photos, category pictures and avatars get downscaled copies (WebP by
+default) in a few widths, stored under variants/<content hash>/<width>.<ext>:
+identical uploads share their variants, and a replaced file never reuses a
+stale URL. Originals that carry EXIF are re-saved without it. What was
+generated is recorded on the row in `<field>_variants`, so serializers build
+the srcset without touching storage.
+
+Uploads are normally processed by `manage.py process_image_jobs` (see
+api.image_jobs); `update_variants` does the same work inline.
+"""
+import hashlib
+import logging
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image as PILImage
+
+from . import imaging
+from .cache import invalidate, invalidate_product
+from .models import Animal_Category, CustomUser, Image, Item_Category
+
+logger = logging.getLogger(__name__)
+
+# Model -> name of its image field
+IMAGE_FIELDS = {
+    Image: 'image',
+    Animal_Category: 'image',
+    Item_Category: 'image',
+    CustomUser: 'avatar',
+}
+
+EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+# What Pillow raises for files it can't decode; retrying won't help
+UNREADABLE = (OSError, ValueError, PILImage.DecompressionBombError)
+
+
+def variants_field(field_name):
+    return f'{field_name}_variants'
+
+
+def render_options():
+    return {
+        'widths': settings.IMAGE_VARIANT_WIDTHS,
+        'image_format': settings.IMAGE_VARIANT_FORMAT,
+        'quality': settings.IMAGE_VARIANT_QUALITY,
+    }
+
+
+def read_source(file):
+    file.open('rb')
+    try:
+        return file.read()
+    finally:
+        file.close()
+
+
+def _invalidate(model, pk):
+    # The row is changed with update(), which sends no signals
+    if model is Image:
+        product_id = Image.objects.filter(pk=pk).values_list('product_id', flat=True).first()
+        if product_id is not None:
+            invalidate_product(product_id)
+    elif model is Animal_Category:
+        invalidate('animal_categories')
+    elif model is Item_Category:
+        invalidate('item_categories')
+
+
+def _record(model, pk, field_name, source, values):
+    """Update the row only if it still points at `source`; returns whether it did."""
+    updated = model._default_manager.filter(pk=pk, **{field_name: source}).update(**values)
+    if updated:
+        _invalidate(model, pk)
+    return bool(updated)
+
+
+def is_referenced(name):
+    """Whether any image field still points at the stored file `name` (uploads are deduplicated)."""
+    return any(model._default_manager.filter(**{field_name: name}).exists() for model, field_name in IMAGE_FIELDS.items())
+
+
+def record_unreadable(model, pk, field_name, source):
+    variants = {'source': source, 'files': {}}
+    _record(model, pk, field_name, source, {variants_field(field_name): variants})
+    return variants
+
+
+def apply_rendered(model, pk, field_name, source, data, rendered):
+    """
+    Store the output of imaging.render for the row's file `source` and record
+    it. Returns (name, variants), where name is the stripped original's new
+    file name, or None if the row has moved on to another file meanwhile.
+    """
+    storage = model._meta.get_field(field_name).storage
+    digest = hashlib.sha256(data).hexdigest()[:32]
+    extension = EXTENSIONS[settings.IMAGE_VARIANT_FORMAT]
+    files = {}
+    for width, content in rendered['variants'].items():
+        path = f'variants/{digest[:2]}/{digest}/{width}.{extension}'
+        if not storage.exists(path):
+            path = storage.save(path, ContentFile(content))
+        files[str(width)] = path
+
+    name = source
+    if rendered['original'] is not None:
+        name = storage.save(source, ContentFile(rendered['original']))
+    variants = {'source': name, 'hash': digest, 'width': rendered['width'], 'height': rendered['height'], 'files': files}
+    if not _record(model, pk, field_name, source, {field_name: name, variants_field(field_name): variants}):
+        if name != source and not is_referenced(name):
+            storage.delete(name)
+        return None
+    if name != source and not is_referenced(source):
+        # The copy with EXIF shouldn't stay reachable
+        storage.delete(source)
+    return name, variants
+
+
+def update_variants(instance, field_name=None):
+    """
+    Process `instance`'s image inline, if its recorded variants are for another
+    file, and return the variants. Unreadable images are recorded with no
+    variants, so they aren't retried.
+    """
+    field_name = field_name or IMAGE_FIELDS[type(instance)]
+    model, file = type(instance), getattr(instance, field_name)
+    current = getattr(instance, variants_field(field_name)) or {}
+    if not file:
+        if current:
+            model._default_manager.filter(pk=instance.pk).update(**{variants_field(field_name): {}})
+            setattr(instance, variants_field(field_name), {})
+        return {}
+    if current.get('source') == file.name:
+        return current
+    if not file.storage.exists(file.name):
+        # The row points at a file that isn't there (fixtures, media not copied yet);
+        # `manage.py generate_image_variants` picks it up later
+        logger.info('Image %s is missing, no variants built', file.name)
+        return current
+
+    data = read_source(file)
+    try:
+        rendered = imaging.render(data, **render_options())
+    except UNREADABLE:
+        logger.warning('Could not build variants for %s', file.name, exc_info=True)
+        variants = record_unreadable(model, instance.pk, field_name, file.name)
+    else:
+        result = apply_rendered(model, instance.pk, field_name, file.name, data, rendered)
+        if result is None:
+            return current
+        name, variants = result
+        if name != file.name:
+            file.name = name
+    setattr(instance, variants_field(field_name), variants)
+    return variants
+
+
+def srcset(instance, field_name, request=None):
+    """The srcset for the instance's image, or None until its variants exist."""
+    file = getattr(instance, field_name)
+    variants = getattr(instance, variants_field(field_name)) or {}
+    if not file or not variants.get('files') or variants.get('source') != file.name:
+        return None
+    candidates = [(file.storage.url(path), width) for width, path in variants['files'].items()]
+    candidates.append((file.url, variants['width']))
+    if request is not None:
+        candidates = [(request.build_absolute_uri(url), width) for url, width in candidates]
+    return ', '.join(f'{url} {width}w' for url, width in sorted(candidates, key=lambda candidate: int(candidate[1])))
@@ -4,19 +4,23 @@ from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from .views import CustomUserViewSet, ProductViewSet, ImageViewSet, ItemCategoryViewSet, AnimalCategoryViewSet, CartViewSet
 from rest_framework.routers import DefaultRouter
 from django.urls import path, include
-from . import views, liqpay_api
+from . import views, liqpay_api, async_views
 router = DefaultRouter()
 router.register(r'user', CustomUserViewSet)
 router.register(r'products', ProductViewSet)
 router.register(r'images', ImageViewSet)
 router.register(r'item_categories', ItemCategoryViewSet)
 router.register(r'animal_categories', AnimalCategoryViewSet)
-router.register(r'carts', CartViewSet)
+router.register(r'cart', CartViewSet, basename='cart')
 
 urlpatterns = [
     path('token/', TokenObtainPairView.as_view, name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
-    path('auth/google/', views.google_auth, name='google_auth'),
+    path('auth/google/', async_views.google_auth, name='google_auth'),
+    # Async front for the hottest catalog reads; must come before the router
+    path('products/', async_views.product_list, name='product-list'),
+    path('products/facets/', async_views.product_facets, name='product-facets'),
+    path('products/<int:pk>/', async_views.product_detail, name='product-detail'),
     path('', include(router.urls)),
     path('change-password/', views.change_password, name='change-password'),
     path('delete-account/', views.delete_account, name='delete-account'),
@@ -29,5 +33,6 @@ urlpatterns = [
     path('get-orders/', views.get_user_orders, name='user-orders'),
     path('orders/<int:pk>/payment/', liqpay_api.order_payment, name='order_payment'),
     path('liqpay/callback/', liqpay_api.liqpay_callback, name='liqpay_callback'),
+    path('cache-stats/', views.cache_stats, name='cache-stats'),
 
 ]
@@ -0,0 +1,61 @@
+"""
+In-process background worker for follow-up work that must not hold up a
+request (e-mails after a payment, ...).
+
+Jobs are plain callables run one at a time on a daemon thread. They are not
+persisted: anything that must survive a restart keeps its own state in the
+database and can be replayed (see `manage.py process_payment_events`).
+With BACKGROUND_TASKS_EAGER = True jobs run inline, which tests rely on.
+"""
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundWorker:
+    def __init__(self, name='api-worker'):
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            func, args, kwargs = self._queue.get()
+            try:
+                close_old_connections()
+                func(*args, **kwargs)
+            except Exception:
+                logger.exception('Background job %s failed', getattr(func, '__name__', func))
+            finally:
+                close_old_connections()
+                self._queue.task_done()
+
+    def submit(self, func, *args, **kwargs):
+        if getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+            func(*args, **kwargs)
+            return
+        self._ensure_started()
+        self._queue.put((func, args, kwargs))
+
+    def submit_on_commit(self, func, *args, **kwargs):
+        """Queue `func` once the current transaction commits, so it sees the committed rows."""
+        transaction.on_commit(lambda: self.submit(func, *args, **kwargs))
+
+    def join(self):
+        """Block until every queued job has run."""
+        self._queue.join()
+
+
+worker = BackgroundWorker()
@@ -0,0 +1,29 @@
+"""
+Production ASGI server: gunicorn managing uvicorn workers.
+
+    gunicorn petopia.asgi:application -c gunicorn.conf.py
+
+Each worker is one process with one event loop. Async views (api/async_views.py)
+run on the loop; sync views run in the worker's thread pool, sized by
+ASGI_THREADS. Blocking outbound calls use their own pool (OUTBOUND_HTTP_THREADS),
+so a slow Google or LiqPay can't take every thread.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv('BIND', '0.0.0.0:8000')
+worker_class = 'uvicorn_worker.UvicornWorker'
+# Requests are mostly I/O-bound, so one process per core is enough; the event
+# loop and the thread pool take care of concurrency inside a process
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+# Recycle workers now and then to cap slow memory growth
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+accesslog = '-'
+errorlog = '-'
@@ -41,6 +41,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'api',
     'mptt',
     'django_mptt_admin',
@@ -57,6 +58,18 @@ AUTHENTICATION_BACKENDS = (
 # LiqPay Configuration
 LIQPAY_PUBLIC_KEY = os.getenv('LIQPAY_PUBLIC_KEY')  # Replace with your actual LiqPay public key
 LIQPAY_PRIVATE_KEY = os.getenv('LIQPAY_PRIVATE_KEY')  # Replace with your actual LiqPay private key
+LIQPAY_SERVER_URL = os.getenv('LIQPAY_SERVER_URL', 'https://0dd7-93-170-0-235.ngrok-free.app/api/liqpay/callback/')
+LIQPAY_RESULT_URL = os.getenv('LIQPAY_RESULT_URL', 'http://localhost:3000/order/success?order_id={order_id}')
+# Accept test-mode ('sandbox') payments as paid; never in production
+LIQPAY_SANDBOX = os.getenv('LIQPAY_SANDBOX', str(DEBUG)) == 'True'
+# Signed checkout payloads are cached per (order, amount, updated_at)
+LIQPAY_PAYLOAD_TIMEOUT = int(os.getenv('LIQPAY_PAYLOAD_TIMEOUT', 3600))
+
+# Follow-up work for payments (confirmation e-mails) runs on an in-process
+# background worker (api/worker.py); set BACKGROUND_TASKS_EAGER=True to run it inline.
+BACKGROUND_TASKS_EAGER = os.getenv('BACKGROUND_TASKS_EAGER', 'False') == 'True'
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'Petopia <noreply@petopia.local>')
 
 SOCIAL_AUTH_LOGIN_ERROR_URL = '/user/error/'
 SOCIAL_AUTH_RAISE_EXCEPTIONS = False
@@ -64,6 +77,47 @@ GOOGLE_OAUTH2_CLIENT_ID = os.getenv('NEXT_PUBLIC_GOOGLE_CLIENT_ID')
 # Змініть з SOCIAL_AIUTH_GOOGLE_OAUTH2_KEY на правильний варіант:
 SOCIAL_AUTH_GOOGLE_OAUTH2_KEY = os.getenv('GOOGLE_CLIENT_ID')
 SOCIAL_AUTH_GOOGLE_OAUTH2_SECRET = os.getenv('GOOGLE_CLIENT_SECRET')
+# Certificates for Google ID tokens (api/google_tokens.py), cached per their max-age
+GOOGLE_CERTS_URL = os.getenv('GOOGLE_CERTS_URL', 'https://www.googleapis.com/oauth2/v1/certs')
+
+# Blocking outbound calls made from async views (Google token verification)
+# run on their own thread pool, so a slow upstream can't starve other requests
+OUTBOUND_HTTP_THREADS = int(os.getenv('OUTBOUND_HTTP_THREADS', 8))
+OUTBOUND_HTTP_TIMEOUT = float(os.getenv('OUTBOUND_HTTP_TIMEOUT', 10))
+
+# Text search configuration used for Product.search_vector. Product texts are
+# mostly Ukrainian, which PostgreSQL has no stemmer for, so 'simple' is the default.
+PRODUCT_SEARCH_CONFIG = os.getenv('PRODUCT_SEARCH_CONFIG', 'simple')
+
+# Response cache for catalog/category endpoints (see api/cache.py).
+# Local-memory LRU per process by default, which is only right for a single
+# process: invalidations don't reach other processes, so they serve stale
+# responses for up to CATALOG_CACHE_TIMEOUTS. Point CATALOG_CACHE_URL at Redis
+# (redis://host:6379/1, as docker-compose does) whenever there are several
+# workers; `manage.py check` warns otherwise (api.W001).
+CATALOG_CACHE_URL = os.getenv('CATALOG_CACHE_URL')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CATALOG_CACHE_URL,
+        'KEY_PREFIX': 'petopia',
+    } if CATALOG_CACHE_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'petopia-catalog',
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('CATALOG_CACHE_MAX_ENTRIES', 2000))},
+    },
+}
+# Seconds a cached response stays valid; per-endpoint overrides below
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', 300))
+CATALOG_CACHE_TIMEOUTS = {
+    'products': 60,
+    'product': 60,
+    'animal_categories': 3600,
+    'item_categories': 3600,
+}
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
@@ -107,7 +161,10 @@ CORS_ALLOW_HEADERS = list(default_headers) + [
     'Cross-Origin-Embedder-Policy',
 ]
 MIDDLEWARE = [
-    'social_django.middleware.SocialAuthExceptionMiddleware',
+    'api.middleware.RequestIdMiddleware',
+    'api.middleware.InstrumentationMiddleware',
+    'api.middleware.SocialAuthExceptionMiddleware',
+    'api.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -119,6 +176,45 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Request instrumentation (api/metrics.py): Server-Timing header, N+1 warnings
+# and Prometheus metrics at /metrics, open to METRICS_ALLOWED_IPS or, when
+# METRICS_TOKEN is set, to `Authorization: Bearer <token>`
+SERVER_TIMING = os.getenv('SERVER_TIMING', 'True') == 'True'
+N_PLUS_ONE_THRESHOLD = int(os.getenv('N_PLUS_ONE_THRESHOLD', 10))  # same SQL this many times in one request
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+METRICS_ALLOWED_IPS = os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+
+# Logging (api/logs.py): records are queued and written to stdout by a
+# background thread, as JSON lines with the request id (LOG_FORMAT=text for
+# plain lines). LOG_DEBUG_SAMPLE_RATE keeps that share of DEBUG records.
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'request_id': {'()': 'api.logs.RequestIdFilter'},
+        'sample_debug': {'()': 'api.logs.SampleFilter', 'rate': float(os.getenv('LOG_DEBUG_SAMPLE_RATE', 1.0))},
+    },
+    'formatters': {
+        'json': {'()': 'api.logs.JsonFormatter'},
+        'text': {'format': '%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s'},
+    },
+    'handlers': {
+        'background': {
+            'class': 'api.logs.BackgroundStreamHandler',
+            'stream': 'ext://sys.stdout',
+            'formatter': LOG_FORMAT,
+            'filters': ['request_id', 'sample_debug'],
+        },
+    },
+    'root': {'handlers': ['background'], 'level': LOG_LEVEL},
+    'loggers': {
+        # Instead of Django's own console handler, so nothing is written twice
+        'django': {'handlers': ['background'], 'level': os.getenv('DJANGO_LOG_LEVEL', 'INFO'), 'propagate': False},
+    },
+}
+
 ROOT_URLCONF = 'petopia.urls'
 
 TEMPLATES = [
@@ -143,6 +239,19 @@ WSGI_APPLICATION = 'petopia.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Connection reuse: with DB_POOL=True connections come from psycopg's pool
+# (needed under ASGI, where a persistent connection would be tied to one
+# thread); otherwise DB_CONN_MAX_AGE keeps each thread's connection open for
+# that many seconds (runserver/WSGI).
+DB_POOL = os.getenv('DB_POOL', 'False') == 'True'
+DB_OPTIONS = {}
+if DB_POOL:
+    DB_OPTIONS['pool'] = {
+        'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+        'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+        'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),  # seconds to wait for a free connection
+    }
+
 DATABASES = {
 #get data from ,env file
 #coonect postgresql
@@ -151,11 +260,35 @@ DATABASES = {
         'NAME': os.getenv('DB_NAME'),
         'USER': os.getenv('DB_USER'),
         'PASSWORD': os.getenv('DB_PASSWORD'),
-        'HOST': 'db',
-        'PORT': 5432,
+        'HOST': os.getenv('DB_HOST', 'db'),
+        'PORT': int(os.getenv('DB_PORT', 5432)),
+        # Pooled connections go back to the pool after each request
+        'CONN_MAX_AGE': 0 if DB_POOL else int(os.getenv('DB_CONN_MAX_AGE', 0)),
+        # Check a reused connection before the request uses it, so a restarted database isn't an error
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True',
+        'OPTIONS': DB_OPTIONS,
 }
 }
 
+# Read replicas (api/replicas.py): comma-separated host[:port] list, same
+# database and credentials as the primary. Catalog and order-history reads go
+# to a replica that is up and at most REPLICA_MAX_LAG seconds behind.
+REPLICA_DATABASES = []
+for number, replica in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), 1):
+    host, _, port = replica.strip().partition(':')
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': int(port or DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICA_DATABASES.append(f'replica{number}')
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', 5))
+REPLICA_CHECK_INTERVAL = float(os.getenv('REPLICA_CHECK_INTERVAL', 5))
+# How long a client reads from the primary after writing
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 10))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -196,6 +329,31 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/' 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Uploads are stored under their content hash, static files under manifest
+# hashes with precompressed copies (api/storage.py); both are served with
+# far-future caching (api/media.py)
+STORAGES = {
+    'default': {'BACKEND': 'api.storage.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'api.storage.CompressedManifestStaticFilesStorage'},
+}
+MEDIA_CACHE_MAX_AGE = int(os.getenv('MEDIA_CACHE_MAX_AGE', 60 * 60 * 24 * 365))
+STATIC_CACHE_MAX_AGE = int(os.getenv('STATIC_CACHE_MAX_AGE', 60 * 60 * 24 * 365))
+# Let the web server in front send the files: '' (Django streams them itself),
+# 'nginx' (X-Accel-Redirect to SENDFILE_URL) or 'apache' (X-Sendfile)
+FILE_SENDFILE = os.getenv('FILE_SENDFILE', '')
+SENDFILE_URL = os.getenv('SENDFILE_URL', '/protected/')
+
+# Responsive variants of uploaded images (api/thumbnails.py)
+IMAGE_VARIANT_WIDTHS = tuple(int(width) for width in os.getenv('IMAGE_VARIANT_WIDTHS', '160,320,640,960').split(','))
+IMAGE_VARIANT_FORMAT = os.getenv('IMAGE_VARIANT_FORMAT', 'WEBP')  # or JPEG
+IMAGE_VARIANT_QUALITY = int(os.getenv('IMAGE_VARIANT_QUALITY', 80))
+# Uploads are processed by `manage.py process_image_jobs`; IMAGE_JOBS_EAGER=True
+# processes them inside the upload request instead
+IMAGE_JOBS_EAGER = os.getenv('IMAGE_JOBS_EAGER', 'False') == 'True'
+IMAGE_JOB_MAX_ATTEMPTS = int(os.getenv('IMAGE_JOB_MAX_ATTEMPTS', 5))
+IMAGE_JOB_RETRY_DELAY = int(os.getenv('IMAGE_JOB_RETRY_DELAY', 30))  # seconds, doubled per attempt
+IMAGE_JOB_TIMEOUT = int(os.getenv('IMAGE_JOB_TIMEOUT', 300))  # a running job older than this is requeued
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
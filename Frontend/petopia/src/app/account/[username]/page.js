@@ -37,6 +37,8 @@ export default function AccountPage() {
   const [orders, setOrders] = useState([])
   const [ordersLoading, setOrdersLoading] = useState(true)
   const [expandedOrders, setExpandedOrders] = useState({})
+  const [orderDetails, setOrderDetails] = useState({})
+  const [ordersNextPage, setOrdersNextPage] = useState(null)
 
   const [cropperOpen, setCropperOpen] = useState(false)
   const [croppedImage, setCroppedImage] = useState(null)
@@ -66,14 +68,13 @@ export default function AccountPage() {
     })
   }, [router])
   
-// Fetch user's order history
-const fetchOrders = async () => {
-  setOrdersLoading(true)
+// Fetch user's order history (summaries only; items are loaded when an order is expanded)
+const fetchOrders = async (page = 1) => {
+  if (page === 1) setOrdersLoading(true)
   try {
-    // Use the correct path without the 'api' prefix since it's likely already in the base URL
-    const response = await api.get('get-orders/');
-    setOrders(response.data);
-    console.log('Orders:', response.data);
+    const response = await api.get('get-orders/', { params: { fields: 'summary', page } });
+    setOrders(prev => page === 1 ? response.data.results : [...prev, ...response.data.results]);
+    setOrdersNextPage(response.data.next ? page + 1 : null);
   } catch (error) {
     console.error('Помилка завантаження замовлень:', error);
     toast({
@@ -86,6 +87,20 @@ const fetchOrders = async () => {
   }
 };
 
+const fetchOrderDetails = async (orderId) => {
+  try {
+    const response = await api.get(`orders/${orderId}/`);
+    setOrderDetails(prev => ({ ...prev, [orderId]: response.data }));
+  } catch (error) {
+    console.error('Помилка завантаження замовлення:', error);
+    toast({
+      variant: "destructive",
+      title: "Помилка",
+      description: "Не вдалося завантажити деталі замовлення",
+    });
+  }
+};
+
   // Helper function to get order status badge styling
   const getStatusBadgeVariant = (status) => {
     switch(status.toLowerCase()) {
@@ -325,6 +340,9 @@ const fetchOrders = async () => {
 
   // Toggle order expansion
   const toggleOrderExpansion = (orderId) => {
+    if (!expandedOrders[orderId] && !orderDetails[orderId]) {
+      fetchOrderDetails(orderId)
+    }
     setExpandedOrders(prev => ({
       ...prev,
       [orderId]: !prev[orderId]
@@ -484,19 +502,25 @@ const fetchOrders = async () => {
                               <div className="flex items-center">
                                 <div className="text-right mr-4">
                                   <p className="font-bold text-lg">{Number(order.total_amount).toFixed(2)} грн</p>
-                                  <p className="text-sm text-gray-500">{order.payment_method === 'cash' ? 'Накладений платіж' : 'Онлайн оплата'}</p>
+                                  <p className="text-sm text-gray-500">Товарів: {order.item_count}</p>
                                 </div>
                                 {expandedOrders[order.id] ? <ChevronUp className="h-5 w-5" /> : <ChevronDown className="h-5 w-5" />}
                               </div>
                             </div>
                             <CardContent className={`py-4 ${expandedOrders[order.id] ? 'block' : 'hidden'}`}>
+                              {!orderDetails[order.id] ? (
+                                <div className="space-y-3">
+                                  <Skeleton className="h-16 w-full" />
+                                  <Skeleton className="h-16 w-full" />
+                                </div>
+                              ) : (
                               <div className="space-y-5">
                                 <div className="grid grid-cols-1 md:grid-cols-2 gap-4">
                                   <div>
                                     <h4 className="font-medium text-gray-700 mb-2">Інформація про доставку</h4>
                                     <div className="bg-gray-50 p-3 rounded">
-                                      <p><span className="font-medium">Адреса:</span> {order.shipping_city}, {order.shipping_address}</p>
-                                      {order.shipping_phone && <p><span className="font-medium">Телефон:</span> {order.shipping_phone}</p>}
+                                      <p><span className="font-medium">Адреса:</span> {orderDetails[order.id].shipping_city}, {orderDetails[order.id].shipping_address}</p>
+                                      {orderDetails[order.id].shipping_phone && <p><span className="font-medium">Телефон:</span> {orderDetails[order.id].shipping_phone}</p>}
                                     </div>
                                   </div>
                                   <div>
@@ -509,9 +533,9 @@ const fetchOrders = async () => {
                                         order.status === 'delivered' ? 'Доставлено' :
                                         order.status === 'cancelled' ? 'Скасовано' : order.status
                                       }</p>
-                                      <p><span className="font-medium">Оплата:</span> {order.payment_method === 'cash' ? 'Накладений платіж' : 'Онлайн оплата'}</p>
+                                      <p><span className="font-medium">Оплата:</span> {orderDetails[order.id].payment_method === 'cash' ? 'Накладений платіж' : 'Онлайн оплата'}</p>
                                       <p><span className="font-medium">Дата:</span> {formatDate(order.created_at)}</p>
-                                      {order.tracking_number && <p><span className="font-medium">Код відстеження:</span> {order.tracking_number}</p>}
+                                      {orderDetails[order.id].tracking_number && <p><span className="font-medium">Код відстеження:</span> {orderDetails[order.id].tracking_number}</p>}
                                     </div>
                                   </div>
                                 </div>
@@ -519,20 +543,18 @@ const fetchOrders = async () => {
                                 <div>
                                   <h4 className="font-medium text-gray-700 mb-3">Товари</h4>
                                   <div className="space-y-4">
-                                    {order.items?.map((item, index) => (
+                                    {orderDetails[order.id].items.map((item, index) => (
                                       <div key={index} className="flex items-center border-b pb-3">
                                         <div className="w-16 h-16 mr-4 relative flex-shrink-0 bg-gray-100 rounded overflow-hidden">
-                                          {item.image ? (
+                                          {item.product?.images?.[0]?.image ? (
                                             <div className="h-full w-full relative">
                                                 <Image 
                                                 src={
-                                                  item.image 
-                                                    ? item.image.startsWith('/') 
-                                                      // If it's a relative URL, convert to absolute URL with domain
-                                                      ? `http://${window.location.hostname}:8000${item.image}`
-                                                      // Use as is if it's already absolute
-                                                      : item.image
-                                                    : ''
+                                                  item.product.images[0].image.startsWith('/') 
+                                                    // If it's a relative URL, convert to absolute URL with domain
+                                                    ? `http://${window.location.hostname}:8000${item.product.images[0].image}`
+                                                    // Use as is if it's already absolute
+                                                    : item.product.images[0].image
                                                 }
                                                 alt={item.product_name || "Товар"}
                                                 fill
@@ -576,16 +598,24 @@ const fetchOrders = async () => {
                                   </div>
                                 </div>
                                 
-                                {order.notes && (
+                                {orderDetails[order.id].notes && (
                                   <div>
                                     <h4 className="font-medium text-gray-700 mb-2">Примітки</h4>
-                                    <p className="text-gray-600 bg-gray-50 p-3 rounded">{order.notes}</p>
+                                    <p className="text-gray-600 bg-gray-50 p-3 rounded">{orderDetails[order.id].notes}</p>
                                   </div>
                                 )}
                               </div>
+                              )}
                             </CardContent>
                           </Card>
                         ))}
+                        {ordersNextPage && (
+                          <div className="flex justify-center">
+                            <Button variant="outline" onClick={() => fetchOrders(ordersNextPage)}>
+                              Показати більше
+                            </Button>
+                          </div>
+                        )}
                       </div>
                     )}
                   </CardContent>
@@ -10,7 +10,7 @@ import { Label } from "@/components/ui/label"
 import { Eye, EyeOff } from 'lucide-react'
 import { FaGoogle as Google } from 'react-icons/fa'
 import Snowfall from 'react-snowfall'
-import { login, register } from '@/app/services/auth'
+import { guestCart, login, register } from '@/app/services/auth'
 import Cookies from 'js-cookie'
 import { Alert, AlertDescription } from "@/components/ui/alert"
 import { GoogleLogin } from '@react-oauth/google'
@@ -29,7 +29,8 @@ export default function AuthPage() {
     const googleToken = response.credential;
     try {
       const res = await api.post('/auth/google/', {
-        google_token: googleToken
+        google_token: googleToken,
+        cart: guestCart(),
       });
 
       if (res.status === 200) {
@@ -59,7 +59,7 @@ export default function HomePage() {
 
         setAnimalCategories(animalCategoriesRes.data);
         setItemCategories(itemCategoriesRes.data);
-        setProducts(productsRes.data);
+        setProducts(productsRes.data.results);
         const accessToken = Cookies.get('accessToken');
         if (accessToken) {
           const userRes = await api.get('/user/me/');
@@ -318,8 +318,9 @@ export default function HomePage() {
                         <div className="relative h-40 bg-gray-200 rounded-lg overflow-hidden transition-transform duration-300 group-hover:scale-105">
                           <img
                             src={category.image}
+                            srcSet={category.srcset || undefined}
                             alt={category.name}
-                            
+                            loading="lazy"
                             sizes="(max-width: 768px) 100vw, (max-width: 1200px) 50vw, 25vw"
                             style={{ objectFit: 'cover' }}
                           />
@@ -187,10 +187,10 @@ export default function ProductPage() {
           params: {
             category: productResponse.data.animal_category?.id,
             exclude: params.id,
-            limit: 4
+            page_size: 5
           }
         });
-        const filteredSimilarProducts = similarResponse.data.filter(
+        const filteredSimilarProducts = similarResponse.data.results.filter(
           (item) => item.id !== parseInt(params.id)
         );
         setSimilarProducts(filteredSimilarProducts);
@@ -201,7 +201,7 @@ export default function ProductPage() {
           const userreview = await api.get(`/user/get_reviews/`);
           setUserRating(userreview.data[0].rating);
         }
-        console.log(similarResponse.data[0].id);
+        console.log(similarResponse.data.results[0]?.id);
         setIsLoading(false);
       } catch (error) {
         console.error('Error:', error);
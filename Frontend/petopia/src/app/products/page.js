@@ -84,7 +84,9 @@ export default function SearchPage() {
   const [sortBy, setSortBy] = useState('relevance');
   const [User, setUser] = useState(null);
   const [cart, setCart] = useState([]);
-  const [page, setPage] = useState(1);
+  const [totalCount, setTotalCount] = useState(0);
+  const [nextPage, setNextPage] = useState(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
   const [isFirstLoad, setIsFirstLoad] = useState(true);
   const [isHeartClicked, setIsHeartClicked] = useState(false);
   const router = useRouter();
@@ -203,10 +205,13 @@ export default function SearchPage() {
         min_price: priceRange.min,
         max_price: priceRange.max,
         sort_by: sortBy,
+        page_size: ITEMS_PER_PAGE,
       };
       const filteredResponse = await api.get('/products/', { params: filters });
-      setSearchResults(filteredResponse.data);
-      setFilteredResults(filteredResponse.data);
+      setSearchResults(filteredResponse.data.results);
+      setFilteredResults(filteredResponse.data.results);
+      setTotalCount(filteredResponse.data.count);
+      setNextPage(filteredResponse.data.next);
     } catch (error) {
       console.error('Error fetching data:', error);
     }
@@ -228,14 +233,25 @@ export default function SearchPage() {
   }, []);
   
   useEffect(() => {
-    setDisplayedResults(filteredResults.slice(0, page * ITEMS_PER_PAGE));
-  }, [filteredResults, page]);
+    setDisplayedResults(filteredResults);
+  }, [filteredResults]);
 
+  // Load the next page from the server when the sentinel scrolls into view
   useEffect(() => {
-    if (inView) {
-      setPage((prevPage) => prevPage + 1);
-    }
-  }, [inView]);
+    if (!inView || !nextPage || isLoadingMore) return;
+    const loadMore = async () => {
+      setIsLoadingMore(true);
+      try {
+        const response = await api.get(nextPage);
+        setFilteredResults((prev) => [...prev, ...response.data.results]);
+        setNextPage(response.data.next);
+      } catch (error) {
+        console.error('Error loading more products:', error);
+      }
+      setIsLoadingMore(false);
+    };
+    loadMore();
+  }, [inView, nextPage, isLoadingMore]);
 
   useEffect(() => {
     return () => {
@@ -396,7 +412,7 @@ export default function SearchPage() {
 
           <div className="flex-grow">
             <div className="mb-4 flex justify-between items-center">
-              <span className="text-gray-600">{filteredResults.length} results</span>
+              <span className="text-gray-600">{totalCount} results</span>
               <select
                 value={sortBy}
                 onChange={(e) => {setSortBy(e.target.value); fetchData(e.target.value)}}
@@ -406,6 +422,7 @@ export default function SearchPage() {
                 <option value="price_asc">Price: Low to High</option>
                 <option value="price_desc">Price: High to Low</option>
                 <option value="newest">Newest</option>
+                <option value="top_rated">Top Rated</option>
               </select>
             </div>
 
@@ -447,7 +464,7 @@ export default function SearchPage() {
               </div>
             )}
 
-            {displayedResults.length < filteredResults.length && (
+            {nextPage && (
               <div ref={ref} className="flex justify-center mt-8">
                 <SkeletonLoader className="h-10 w-32" />
               </div>
@@ -5,11 +5,22 @@ import Cookies from 'js-cookie';
 
 // ... (register function)
 
+// Browser cart, sent with the login so the server can merge it into the user's cart
+export const guestCart = () => {
+  try {
+    return JSON.parse(localStorage.getItem('cart') || '[]')
+      .map(item => ({ product_id: item.id, quantity: item.quantity }));
+  } catch {
+    return [];
+  }
+};
+
 export const login = async (email, password) => {
   try {
     const response = await api.post('/login/', {
       email,
       password,
+      cart: guestCart(),
     });
 
     // Store tokens in cookies
@@ -81,6 +81,9 @@ export function ProductCard({ product, handlewishlist, isHeartClicked }) {
         <div className="aspect-square mb-3">
           <img
             src={product.images[0].image}
+            srcSet={product.images[0].srcset || undefined}
+            sizes="(max-width: 640px) 50vw, (max-width: 1024px) 33vw, 240px"
+            loading="lazy"
             alt={product.name}
             className={`w-full h-full object-cover rounded-md ${product.stock === 0 ? 'opacity-70' : ''}`}
           />